@@ -0,0 +1,35 @@
+"""
+Offline benchmarks for every solver on synthetic low-rank data, see
+experiments/run_benchmarks.py.
+"""
+from __future__ import absolute_import
+
+from .datasets import (
+    MISSINGNESS_PATTERNS,
+    SIZES,
+    create_benchmark_dataset,
+    create_low_rank_matrix,
+    create_missing_mask,
+)
+from .runner import (
+    compare_results,
+    environment_info,
+    load_results,
+    run_benchmarks,
+    save_results,
+)
+from .solvers import SOLVERS
+
+__all__ = [
+    "MISSINGNESS_PATTERNS",
+    "SIZES",
+    "SOLVERS",
+    "compare_results",
+    "create_benchmark_dataset",
+    "create_low_rank_matrix",
+    "create_missing_mask",
+    "environment_info",
+    "load_results",
+    "run_benchmarks",
+    "save_results",
+]
@@ -0,0 +1,120 @@
+"""
+Synthetic low-rank matrices with different missingness patterns.
+"""
+from __future__ import absolute_import, print_function, division
+
+import numpy as np
+
+# name -> (n_rows, n_cols, rank)
+SIZES = {
+    "small": (200, 50, 5),
+    "medium": (2000, 200, 10),
+    "large": (20000, 500, 20),
+}
+
+MISSINGNESS_PATTERNS = ["uniform", "rows", "columns", "blocks", "mnar"]
+
+
+def create_low_rank_matrix(n_rows, n_cols, rank, noise=0.0, random_state=None):
+    """
+    Product of two Gaussian factors, like create_rank_k_dataset in the tests,
+    plus optional Gaussian noise.
+    """
+    if random_state is None:
+        random_state = np.random.RandomState(0)
+    X = np.dot(
+        random_state.randn(n_rows, rank),
+        random_state.randn(rank, n_cols))
+    if noise > 0:
+        X += noise * random_state.randn(n_rows, n_cols)
+    return X
+
+
+def _uniform_mask(X, fraction_missing, random_state):
+    return random_state.rand(*X.shape) < fraction_missing
+
+
+def _rows_mask(X, fraction_missing, random_state):
+    # some rows lose far more of their entries than others
+    n_rows = X.shape[0]
+    row_fractions = np.minimum(
+        random_state.rand(n_rows) * 2 * fraction_missing, 0.95)
+    return random_state.rand(*X.shape) < row_fractions[:, np.newaxis]
+
+
+def _columns_mask(X, fraction_missing, random_state):
+    return _rows_mask(X.T, fraction_missing, random_state).T
+
+
+def _blocks_mask(X, fraction_missing, random_state):
+    # every row misses one contiguous run of columns, similar to the
+    # squares removed from images in experiments/complete_faces.py
+    n_rows, n_cols = X.shape
+    missing_mask = np.zeros(X.shape, dtype=bool)
+    run_length = int(round(fraction_missing * n_cols))
+    if run_length == 0:
+        return missing_mask
+    starts = random_state.randint(0, n_cols - run_length + 1, n_rows)
+    column_indices = starts[:, np.newaxis] + np.arange(run_length)
+    missing_mask[np.arange(n_rows)[:, np.newaxis], column_indices] = True
+    return missing_mask
+
+
+def _mnar_mask(X, fraction_missing, random_state):
+    # missing not at random: larger values are more likely to be missing,
+    # with probabilities proportional to the rank of each value
+    ranks = np.argsort(np.argsort(X, axis=None)).reshape(X.shape)
+    probabilities = 2 * fraction_missing * (ranks + 0.5) / X.size
+    return random_state.rand(*X.shape) < probabilities
+
+
+_PATTERN_FUNCTIONS = {
+    "uniform": _uniform_mask,
+    "rows": _rows_mask,
+    "columns": _columns_mask,
+    "blocks": _blocks_mask,
+    "mnar": _mnar_mask,
+}
+
+
+def create_missing_mask(X, fraction_missing, pattern="uniform", random_state=None):
+    """
+    Boolean mask of the entries of X to remove, missing about
+    fraction_missing of them in the given pattern (see
+    MISSINGNESS_PATTERNS). Every row and column keeps at least one observed
+    entry since several solvers can't handle empty rows or columns.
+    """
+    if pattern not in _PATTERN_FUNCTIONS:
+        raise ValueError("Invalid missingness pattern: '%s'" % (pattern,))
+    if random_state is None:
+        random_state = np.random.RandomState(0)
+    missing_mask = _PATTERN_FUNCTIONS[pattern](
+        X, fraction_missing, random_state)
+    n_rows, n_cols = missing_mask.shape
+    for row_idx in np.flatnonzero(missing_mask.all(axis=1)):
+        missing_mask[row_idx, random_state.randint(n_cols)] = False
+    for col_idx in np.flatnonzero(missing_mask.all(axis=0)):
+        missing_mask[random_state.randint(n_rows), col_idx] = False
+    return missing_mask
+
+
+def create_benchmark_dataset(
+        n_rows,
+        n_cols,
+        rank,
+        fraction_missing,
+        pattern="uniform",
+        noise=0.0,
+        random_seed=0):
+    """
+    Returns the full matrix, a copy with NaN in place of its missing
+    entries and the mask of missing entries.
+    """
+    random_state = np.random.RandomState(random_seed)
+    X = create_low_rank_matrix(
+        n_rows, n_cols, rank, noise=noise, random_state=random_state)
+    missing_mask = create_missing_mask(
+        X, fraction_missing, pattern=pattern, random_state=random_state)
+    X_incomplete = X.copy()
+    X_incomplete[missing_mask] = np.nan
+    return X, X_incomplete, missing_mask
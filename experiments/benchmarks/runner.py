@@ -0,0 +1,237 @@
+"""
+Time and memory-profile solvers on the synthetic datasets and compare the
+results against an earlier run.
+"""
+from __future__ import absolute_import, print_function, division
+
+import json
+import platform
+import subprocess
+import sys
+from os.path import dirname
+from time import time
+
+import numpy as np
+import scipy
+
+from fancyimpute.common import masked_mae, masked_mse
+
+from .datasets import SIZES, create_benchmark_dataset
+from .solvers import SOLVERS
+
+try:
+    import tracemalloc
+except ImportError:
+    # not available on Python 2
+    tracemalloc = None
+
+RESULTS_FORMAT_VERSION = 1
+
+
+def environment_info():
+    """
+    Versions and machine details stored with the results, so that runs
+    from different releases or machines can be told apart.
+    """
+    try:
+        git_commit = subprocess.check_output(
+            ["git", "rev-parse", "HEAD"],
+            cwd=dirname(__file__),
+            stderr=subprocess.STDOUT).decode("ascii").strip()
+    except (OSError, subprocess.CalledProcessError):
+        git_commit = None
+    return {
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "scipy": scipy.__version__,
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "git_commit": git_commit,
+    }
+
+
+def _peak_traced_memory(fn):
+    tracemalloc.start()
+    try:
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak
+
+
+def run_benchmark_case(
+        solver_name,
+        size_name,
+        fraction_missing,
+        pattern,
+        repeats=3,
+        measure_memory=True,
+        random_seed=0):
+    """
+    Run one solver on one dataset and return a dictionary describing the
+    case and its results. Errors raised by the solver are recorded rather
+    than propagated.
+    """
+    n_rows, n_cols, rank = SIZES[size_name]
+    make_solver, _ = SOLVERS[solver_name]
+    X, X_incomplete, missing_mask = create_benchmark_dataset(
+        n_rows,
+        n_cols,
+        rank,
+        fraction_missing,
+        pattern=pattern,
+        random_seed=random_seed)
+    result = {
+        "solver": solver_name,
+        "size": size_name,
+        "shape": [n_rows, n_cols],
+        "rank": rank,
+        "fraction_missing": fraction_missing,
+        "observed_fraction_missing": float(missing_mask.mean()),
+        "pattern": pattern,
+        "random_seed": random_seed,
+    }
+    times = []
+    try:
+        for _ in range(repeats):
+            # same random state for every repeat of a solver
+            np.random.seed(random_seed)
+            solver = make_solver(rank)
+            start_t = time()
+            X_completed = solver.complete(X_incomplete)
+            times.append(time() - start_t)
+        if measure_memory and tracemalloc is not None:
+            np.random.seed(random_seed)
+            solver = make_solver(rank)
+            result["peak_memory_bytes"] = _peak_traced_memory(
+                lambda: solver.complete(X_incomplete))
+    except Exception as e:
+        result["error"] = "%s: %s" % (e.__class__.__name__, e)
+        return result
+    result["times"] = times
+    result["min_time"] = min(times)
+    result["median_time"] = float(np.median(times))
+    result["missing_mae"] = float(masked_mae(X, X_completed, missing_mask))
+    result["missing_mse"] = float(masked_mse(X, X_completed, missing_mask))
+    return result
+
+
+def run_benchmarks(
+        solver_names=None,
+        size_names=("small",),
+        fractions_missing=(0.25,),
+        patterns=("uniform",),
+        repeats=3,
+        measure_memory=True,
+        random_seed=0,
+        verbose=True):
+    """
+    Run every combination of solver, size, fraction of missing entries and
+    missingness pattern, skipping solvers on sizes beyond their limits.
+    Returns a list of result dictionaries.
+    """
+    if solver_names is None:
+        solver_names = sorted(SOLVERS)
+    results = []
+    for size_name in size_names:
+        n_rows, n_cols, _ = SIZES[size_name]
+        for solver_name in solver_names:
+            _, max_entries = SOLVERS[solver_name]
+            if max_entries is not None and n_rows * n_cols > max_entries:
+                if verbose:
+                    print("Skipping %s on %s data" % (solver_name, size_name))
+                continue
+            for pattern in patterns:
+                for fraction_missing in fractions_missing:
+                    result = run_benchmark_case(
+                        solver_name,
+                        size_name,
+                        fraction_missing,
+                        pattern,
+                        repeats=repeats,
+                        measure_memory=measure_memory,
+                        random_seed=random_seed)
+                    if verbose:
+                        print(format_result(result))
+                    results.append(result)
+    return results
+
+
+def format_result(result):
+    description = "%s %s %s missing=%0.2f" % (
+        result["solver"],
+        result["size"],
+        result["pattern"],
+        result["fraction_missing"])
+    if "error" in result:
+        return "%s: %s" % (description, result["error"])
+    memory = ""
+    if "peak_memory_bytes" in result:
+        memory = " peak=%0.1fMB" % (result["peak_memory_bytes"] / 2 ** 20,)
+    return "%s: %0.3fs%s MAE=%0.4f" % (
+        description,
+        result["min_time"],
+        memory,
+        result["missing_mae"])
+
+
+def save_results(path, results):
+    with open(path, "w") as f:
+        json.dump({
+            "version": RESULTS_FORMAT_VERSION,
+            "environment": environment_info(),
+            "results": results,
+        }, f, indent=2, sort_keys=True)
+
+
+def load_results(path):
+    with open(path) as f:
+        data = json.load(f)
+    if data.get("version") != RESULTS_FORMAT_VERSION:
+        raise ValueError("Unsupported benchmark results version %s" % (
+            data.get("version"),))
+    return data["results"]
+
+
+def _case_key(result):
+    return (
+        result["solver"],
+        result["size"],
+        result["pattern"],
+        result["fraction_missing"])
+
+
+def compare_results(
+        baseline_results,
+        results,
+        time_tolerance=0.25,
+        memory_tolerance=0.25,
+        error_tolerance=0.1):
+    """
+    Compare results against a baseline run and return a list of messages
+    describing regressions: cases which got slower, used more memory or
+    imputed less accurately by more than the given fractions, or which
+    started failing.
+    """
+    baseline_by_key = {_case_key(result): result for result in baseline_results}
+    regressions = []
+    for result in results:
+        baseline = baseline_by_key.get(_case_key(result))
+        if baseline is None or "error" in baseline:
+            continue
+        description = "%s %s %s missing=%0.2f" % _case_key(result)
+        if "error" in result:
+            regressions.append("%s: now fails with %s" % (
+                description, result["error"]))
+            continue
+        for field, tolerance in [
+                ("min_time", time_tolerance),
+                ("peak_memory_bytes", memory_tolerance),
+                ("missing_mae", error_tolerance)]:
+            if field not in result or field not in baseline:
+                continue
+            if result[field] > (1 + tolerance) * baseline[field]:
+                regressions.append("%s: %s went from %g to %g" % (
+                    description, field, baseline[field], result[field]))
+    return regressions
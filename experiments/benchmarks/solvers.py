@@ -0,0 +1,54 @@
+"""
+Solver configurations to benchmark, each limited to the matrix sizes it
+can handle in a reasonable time.
+"""
+from __future__ import absolute_import
+
+from fancyimpute import (
+    BiScaler,
+    IterativeSVD,
+    KNN,
+    MatrixFactorization,
+    MICE,
+    NuclearNormMinimization,
+    SimilarityWeightedAveraging,
+    SimpleFill,
+    SoftImpute,
+    StochasticSoftImpute,
+)
+
+# name -> (function from the rank of the data to a solver,
+#          largest number of entries to run it on)
+SOLVERS = {
+    "SimpleFill": (
+        lambda rank: SimpleFill(fill_method="mean"),
+        None),
+    "SoftImpute": (
+        lambda rank: SoftImpute(verbose=False),
+        None),
+    "SoftImpute+BiScaler": (
+        lambda rank: SoftImpute(
+            normalizer=BiScaler(verbose=False), verbose=False),
+        None),
+    "StochasticSoftImpute": (
+        lambda rank: StochasticSoftImpute(max_rank=rank, verbose=False),
+        None),
+    "IterativeSVD": (
+        lambda rank: IterativeSVD(rank=rank, verbose=False),
+        None),
+    "KNN": (
+        lambda rank: KNN(k=5, verbose=False),
+        10 ** 6),
+    "MICE": (
+        lambda rank: MICE(n_imputations=20, n_burn_in=5, verbose=False),
+        10 ** 6),
+    "MatrixFactorization": (
+        lambda rank: MatrixFactorization(rank=rank, verbose=False),
+        10 ** 6),
+    "NuclearNormMinimization": (
+        lambda rank: NuclearNormMinimization(verbose=False),
+        10 ** 4),
+    "SimilarityWeightedAveraging": (
+        lambda rank: SimilarityWeightedAveraging(similarity_backend="sparse"),
+        10 ** 6),
+}
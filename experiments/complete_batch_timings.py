@@ -0,0 +1,64 @@
+"""
+Compare completing many small matrices one at a time with complete_batch.
+
+    python experiments/complete_batch_timings.py --n-matrices 10000
+"""
+from __future__ import print_function, division
+
+import argparse
+from time import time
+
+import numpy as np
+
+from fancyimpute import IterativeSVD, SoftImpute
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--n-matrices", type=int, default=10000)
+parser.add_argument("--n-rows", type=int, default=50)
+parser.add_argument("--n-cols", type=int, default=20)
+parser.add_argument("--rank", type=int, default=3)
+parser.add_argument("--fraction-missing", type=float, default=0.2)
+
+
+def create_incomplete_stack(
+        n_matrices, n_rows, n_cols, rank, fraction_missing, random_seed=0):
+    np.random.seed(random_seed)
+    X = np.matmul(
+        np.random.randn(n_matrices, n_rows, rank),
+        np.random.randn(n_matrices, rank, n_cols))
+    missing_mask = np.random.rand(*X.shape) < fraction_missing
+    X_incomplete = X.copy()
+    X_incomplete[missing_mask] = np.nan
+    return X, X_incomplete, missing_mask
+
+
+def timed(name, fn, *args, **kwargs):
+    start_t = time()
+    result = fn(*args, **kwargs)
+    print("%s: %0.2fs" % (name, time() - start_t))
+    return result
+
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+    X, X_incomplete, missing_mask = create_incomplete_stack(
+        args.n_matrices,
+        args.n_rows,
+        args.n_cols,
+        args.rank,
+        args.fraction_missing)
+    for solver in [
+            SoftImpute(verbose=False),
+            IterativeSVD(rank=args.rank, verbose=False)]:
+        name = solver.__class__.__name__
+        X_loop = timed(
+            "%s.complete one matrix at a time" % name,
+            lambda: np.array([solver.complete(X_i) for X_i in X_incomplete]))
+        X_batch = timed(
+            "%s.complete_batch" % name,
+            solver.complete_batch,
+            X_incomplete)
+        for label, X_result in [("loop", X_loop), ("batch", X_batch)]:
+            print("  %s MAE: %0.4f" % (
+                label,
+                np.abs(X - X_result)[missing_mask].mean()))
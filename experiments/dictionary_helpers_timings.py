@@ -0,0 +1,98 @@
+"""
+Time the conversions from nested and pair dictionaries to arrays.
+
+    python experiments/dictionary_helpers_timings.py --n-entries 10000000
+"""
+from __future__ import print_function, division
+
+import argparse
+from time import time
+
+import numpy as np
+
+from fancyimpute.dictionary_helpers import (
+    curry_pair_dictionary,
+    dense_matrix_from_nested_dictionary,
+    dense_matrix_from_pair_dictionary,
+    dense_nan_matrix,
+    nested_key_indices,
+    sparse_csr_matrix_from_nested_dictionary,
+    sparse_csr_matrix_from_pair_dictionary,
+    sparse_dok_matrix_from_nested_dictionary,
+)
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--n-entries", type=int, default=10 ** 7)
+parser.add_argument("--n-rows", type=int, default=100000)
+parser.add_argument("--n-cols", type=int, default=2000)
+parser.add_argument(
+    "--skip-elementwise",
+    action="store_true",
+    default=False,
+    help="Don't time the reference element-by-element dense fill")
+
+
+def create_pair_dictionary(n_entries, n_rows, n_cols, random_seed=0):
+    np.random.seed(random_seed)
+    flat_indices = np.random.choice(n_rows * n_cols, n_entries, replace=False)
+    rows = flat_indices // n_cols
+    cols = flat_indices % n_cols
+    values = np.random.randn(n_entries)
+    return dict(zip(zip(rows.tolist(), cols.tolist()), values.tolist()))
+
+
+def elementwise_dense_matrix_from_nested_dictionary(nested_dict):
+    """
+    Reference implementation which fills the array one element at a time.
+    """
+    outer_key_indices, inner_key_indices = nested_key_indices(nested_dict)
+    result = dense_nan_matrix(
+        (len(outer_key_indices), len(inner_key_indices)), "float32")
+    for outer_key, sub_dictionary in nested_dict.items():
+        i = outer_key_indices[outer_key]
+        for inner_key, value in sub_dictionary.items():
+            result[i, inner_key_indices[inner_key]] = value
+    return result
+
+
+def timed(name, fn, *args, **kwargs):
+    start_t = time()
+    result = fn(*args, **kwargs)
+    print("%s: %0.2fs" % (name, time() - start_t))
+    return result
+
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+    pair_dict = timed(
+        "create pair dictionary with %d entries" % args.n_entries,
+        create_pair_dictionary,
+        args.n_entries,
+        args.n_rows,
+        args.n_cols)
+    nested_dict = timed("curry_pair_dictionary", curry_pair_dictionary, pair_dict)
+    if not args.skip_elementwise:
+        timed(
+            "elementwise dense fill (reference)",
+            elementwise_dense_matrix_from_nested_dictionary,
+            nested_dict)
+    timed(
+        "dense_matrix_from_nested_dictionary",
+        dense_matrix_from_nested_dictionary,
+        nested_dict)
+    timed(
+        "sparse_csr_matrix_from_nested_dictionary",
+        sparse_csr_matrix_from_nested_dictionary,
+        nested_dict)
+    timed(
+        "sparse_dok_matrix_from_nested_dictionary",
+        sparse_dok_matrix_from_nested_dictionary,
+        nested_dict)
+    timed(
+        "dense_matrix_from_pair_dictionary",
+        dense_matrix_from_pair_dictionary,
+        pair_dict)
+    timed(
+        "sparse_csr_matrix_from_pair_dictionary",
+        sparse_csr_matrix_from_pair_dictionary,
+        pair_dict)
@@ -0,0 +1,64 @@
+"""
+Time Solver.fill against filling one column at a time, on a wide and on a
+tall matrix:
+
+    python experiments/fill_timings.py --n-rows 1000 --n-cols 100000
+    python experiments/fill_timings.py --n-rows 2000000 --n-cols 10
+"""
+from __future__ import print_function, division
+
+import argparse
+from time import time
+
+import numpy as np
+
+from fancyimpute import Solver
+from fancyimpute.common import generate_random_column_samples
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--n-rows", type=int, default=1000)
+parser.add_argument("--n-cols", type=int, default=100000)
+parser.add_argument("--fraction-missing", type=float, default=0.2)
+
+COLUMN_FUNCTIONS = {
+    "mean": np.nanmean,
+    "median": np.nanmedian,
+    "min": np.nanmin,
+    "random": generate_random_column_samples,
+}
+
+
+def columnwise_fill(X, missing_mask, col_fn):
+    """
+    Reference implementation which fills one column at a time.
+    """
+    X = X.copy()
+    for col_idx in range(X.shape[1]):
+        missing_col = missing_mask[:, col_idx]
+        if missing_col.sum() == 0:
+            continue
+        X[missing_col, col_idx] = col_fn(X[:, col_idx])
+    return X
+
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+    np.random.seed(0)
+    X = np.random.randn(args.n_rows, args.n_cols)
+    missing_mask = np.random.uniform(0, 1, X.shape) < args.fraction_missing
+    X[missing_mask] = np.nan
+    solver = Solver()
+    for fill_method, col_fn in sorted(COLUMN_FUNCTIONS.items()):
+        np.random.seed(1)
+        start_t = time()
+        X_reference = columnwise_fill(X, missing_mask, col_fn)
+        columnwise_seconds = time() - start_t
+        np.random.seed(1)
+        start_t = time()
+        X_filled = solver.fill(X, missing_mask, fill_method=fill_method)
+        vectorized_seconds = time() - start_t
+        print("%s: columnwise %0.2fs, vectorized %0.2fs, same result=%s" % (
+            fill_method,
+            columnwise_seconds,
+            vectorized_seconds,
+            np.allclose(X_reference, X_filled)))
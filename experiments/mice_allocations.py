@@ -0,0 +1,69 @@
+"""
+Measure how much memory MICE allocates per imputation round using
+tracemalloc. Run with:
+
+    python experiments/mice_allocations.py
+"""
+from __future__ import print_function, division
+
+import tracemalloc
+from time import time
+
+import numpy as np
+
+from fancyimpute import MICE
+
+
+def create_incomplete_matrix(n_rows, n_cols, fraction_missing, random_seed=0):
+    np.random.seed(random_seed)
+    X = np.dot(np.random.randn(n_rows, 5), np.random.randn(5, n_cols))
+    X[np.random.uniform(0, 1, X.shape) < fraction_missing] = np.nan
+    return X
+
+
+def measure_imputation_round(
+        n_rows=5000,
+        n_cols=50,
+        fraction_missing=0.2,
+        n_rounds=5,
+        **mice_kwargs):
+    X = create_incomplete_matrix(n_rows, n_cols, fraction_missing)
+    mice = MICE(verbose=False, **mice_kwargs)
+    missing_mask = np.asarray(np.isnan(X), order="F")
+    observed_mask = ~missing_mask
+    visit_indices = mice.get_visit_indices(missing_mask)
+    X_filled = mice.initialize(
+        X,
+        missing_mask=missing_mask,
+        observed_mask=observed_mask,
+        visit_indices=visit_indices)
+    scratch_buffers = mice._create_scratch_buffers(X_filled)
+
+    tracemalloc.start()
+    start_t = time()
+    for _ in range(n_rounds):
+        mice.perform_imputation_round(
+            X_filled=X_filled,
+            missing_mask=missing_mask,
+            observed_mask=observed_mask,
+            visit_indices=visit_indices,
+            scratch_buffers=scratch_buffers)
+    elapsed = time() - start_t
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "seconds_per_round": elapsed / n_rounds,
+        "peak_MB": peak / 1e6,
+        "matrix_MB": X.nbytes / 1e6,
+    }
+
+
+if __name__ == "__main__":
+    for impute_type in ["col", "pmm"]:
+        result = measure_imputation_round(impute_type=impute_type)
+        print("impute_type=%s: %0.4fs/round, peak allocated=%0.2fMB "
+              "(matrix=%0.2fMB)" % (
+                  impute_type,
+                  result["seconds_per_round"],
+                  result["peak_MB"],
+                  result["matrix_MB"]))
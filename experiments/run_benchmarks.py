@@ -0,0 +1,83 @@
+"""
+Benchmark every solver on synthetic low-rank data without any downloads,
+write the results as JSON and optionally compare them against an earlier
+run, exiting with an error if anything regressed:
+
+    python experiments/run_benchmarks.py --output baseline.json
+    python experiments/run_benchmarks.py --compare baseline.json
+"""
+from __future__ import print_function, division
+
+import argparse
+import sys
+
+from benchmarks import (
+    MISSINGNESS_PATTERNS,
+    SIZES,
+    SOLVERS,
+    compare_results,
+    load_results,
+    run_benchmarks,
+    save_results,
+)
+
+parser = argparse.ArgumentParser()
+parser.add_argument(
+    "--solvers",
+    nargs="+",
+    choices=sorted(SOLVERS),
+    default=sorted(SOLVERS))
+parser.add_argument(
+    "--sizes",
+    nargs="+",
+    choices=sorted(SIZES),
+    default=["small", "medium"])
+parser.add_argument(
+    "--fractions-missing",
+    nargs="+",
+    type=float,
+    default=[0.1, 0.5])
+parser.add_argument(
+    "--patterns",
+    nargs="+",
+    choices=MISSINGNESS_PATTERNS,
+    default=MISSINGNESS_PATTERNS)
+parser.add_argument("--repeats", type=int, default=3)
+parser.add_argument(
+    "--skip-memory",
+    action="store_true",
+    default=False,
+    help="Don't run each case again under tracemalloc to find peak memory")
+parser.add_argument("--random-seed", type=int, default=0)
+parser.add_argument("--output", help="Path of JSON file to write results to")
+parser.add_argument(
+    "--compare",
+    help="Path of JSON results of an earlier run to check for regressions")
+parser.add_argument("--time-tolerance", type=float, default=0.25)
+parser.add_argument("--memory-tolerance", type=float, default=0.25)
+parser.add_argument("--error-tolerance", type=float, default=0.1)
+
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+    results = run_benchmarks(
+        solver_names=args.solvers,
+        size_names=args.sizes,
+        fractions_missing=args.fractions_missing,
+        patterns=args.patterns,
+        repeats=args.repeats,
+        measure_memory=not args.skip_memory,
+        random_seed=args.random_seed)
+    if args.output:
+        save_results(args.output, results)
+    if args.compare:
+        regressions = compare_results(
+            load_results(args.compare),
+            results,
+            time_tolerance=args.time_tolerance,
+            memory_tolerance=args.memory_tolerance,
+            error_tolerance=args.error_tolerance)
+        for regression in regressions:
+            print("REGRESSION %s" % (regression,))
+        if regressions:
+            sys.exit(1)
@@ -1,6 +1,6 @@
 from time import time
 import numpy as np
-from fancyimpute.knn_helpers import (
+from knnimpute import (
     knn_impute_optimistic,
     knn_impute_with_argpartition,
     knn_impute_few_observed,
@@ -8,9 +8,15 @@ from .matrix_factorization import MatrixFactorization
 from .iterative_svd import IterativeSVD
 from .simple_fill import SimpleFill
 from .soft_impute import SoftImpute
+from .stochastic_soft_impute import StochasticSoftImpute
 from .biscaler import BiScaler
 from .knn import KNN
 from .similarity_weighted_averaging import SimilarityWeightedAveraging
+from .serialization import save_fitted_model, load_fitted_model
+from .callbacks import LoggingCallback, TraceCallback
+from .hyperparameter_search import search_hyperparameters
+from .rank_estimation import estimate_rank_and_shrinkage
+from .group_imputation import complete_by_group
 
 __all__ = [
     "Solver",
@@ -21,7 +27,15 @@ __all__ = [
     "IterativeSVD",
     "SimpleFill",
     "SoftImpute",
+    "StochasticSoftImpute",
     "BiScaler",
     "KNN",
-    "SimilarityWeightedAveraging"
+    "SimilarityWeightedAveraging",
+    "save_fitted_model",
+    "load_fitted_model",
+    "LoggingCallback",
+    "TraceCallback",
+    "search_hyperparameters",
+    "estimate_rank_and_shrinkage",
+    "complete_by_group",
 ]
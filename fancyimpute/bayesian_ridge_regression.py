@@ -13,8 +13,8 @@
 from __future__ import absolute_import, print_function, division
 
 from six.moves import range
-from numpy import dot, append, column_stack, ones
-from numpy.linalg import norm, inv, multi_dot
+from numpy import dot, append, column_stack, empty, ones
+from numpy.linalg import norm, inv
 from numpy.random import multivariate_normal
 
 
@@ -44,15 +44,26 @@ class BayesianRidgeRegression(object):
         self.normalize_lambda = normalize_lambda
 
     def fit(self, X, y, inverse_covariance=None):
+        n, d_features = X.shape
         if self.add_ones:
-            X_ones = self.add_column_of_ones(X)
+            # Rather than concatenating a column of ones onto X (which
+            # copies the whole matrix) we account for the intercept
+            # analytically: the extra row/column of X^T X holds the column
+            # sums of X and its corner holds the number of samples.
+            d = d_features + 1
         else:
-            X_ones = X
-        # first add a column of all ones to X
-        n, d = X_ones.shape
+            d = d_features
         # the big expensive step when d is large
         if inverse_covariance is None:
-            outer_product = dot(X_ones.T, X_ones)
+            if self.add_ones:
+                outer_product = empty((d, d), dtype=X.dtype)
+                outer_product[:d_features, :d_features] = dot(X.T, X)
+                column_sums = X.sum(axis=0)
+                outer_product[:d_features, d_features] = column_sums
+                outer_product[d_features, :d_features] = column_sums
+                outer_product[d_features, d_features] = n
+            else:
+                outer_product = dot(X.T, X)
             if self.normalize_lambda:
                 lambda_reg = self.lambda_reg * norm(outer_product)
             else:
@@ -69,32 +80,48 @@ class BayesianRidgeRegression(object):
         else:
             self.inverse_covariance = inverse_covariance
         # estimate of the parameters
-        self.beta_estimate = multi_dot([self.inverse_covariance, X_ones.T, y])
+        if self.add_ones:
+            X_dot_y = empty(d, dtype=self.inverse_covariance.dtype)
+            X_dot_y[:d_features] = dot(X.T, y)
+            X_dot_y[d_features] = y.sum()
+        else:
+            X_dot_y = dot(X.T, y)
+        self.beta_estimate = dot(self.inverse_covariance, X_dot_y)
         # now we need the estimate of the noise variance
         # reference: https://stat.ethz.ch/R-manual/R-devel/library/stats/html/summary.lm.html
-        pred = dot(X_ones, self.beta_estimate)
+        pred = self._linear_predictor(X, self.beta_estimate)
         # get the residual of the predictions and square it
         pred -= y
         pred **= 2
         sum_squared_residuals = pred.sum()
         self.sigma_squared_estimate = sum_squared_residuals / max((n - d), 1)
+        self.sigma_squared_estimate = self.sigma_squared_estimate.astype(
+            self.inverse_covariance.dtype)
         self.covar = self.sigma_squared_estimate * self.inverse_covariance
 
+    def _linear_predictor(self, X, beta):
+        """
+        Computes dot(X, beta), treating the last element of beta as the
+        intercept when add_ones is set.
+        """
+        if not self.add_ones:
+            return dot(X, beta)
+        result = dot(X, beta[:-1])
+        result += beta[-1]
+        return result
+
     def predict(self, X, random_draw=False):
-        if self.add_ones:
-            X_ones = self.add_column_of_ones(X)
-        else:
-            X_ones = X
         if random_draw:
-            return dot(X_ones, self.random_beta_draw(num_draws=1)[0])
+            return self._linear_predictor(
+                X, self.random_beta_draw(num_draws=1)[0])
         else:
-            return dot(X_ones, self.beta_estimate)
+            return self._linear_predictor(X, self.beta_estimate)
 
     def add_column_of_ones(self, X):
         if len(X.shape) == 1:
             return append(X, 1)
         else:
-            return column_stack((X, ones(X.shape[0])))
+            return column_stack((X, ones(X.shape[0], dtype=X.dtype)))
 
     def random_beta_draw(self, num_draws=1):
         """
@@ -106,7 +133,9 @@ class BayesianRidgeRegression(object):
         Note that the pros use something different:
         https://github.com/stefvanbuuren/mice/blob/master/R/mice.impute.norm.r
         """
-        return multivariate_normal(self.beta_estimate, self.covar, num_draws)
+        draws = multivariate_normal(self.beta_estimate, self.covar, num_draws)
+        # the sampler always returns float64, keep the dtype of the model
+        return draws.astype(self.beta_estimate.dtype, copy=False)
 
     def predict_dist(self, X, eps=0.00001):
         """
@@ -117,15 +146,26 @@ class BayesianRidgeRegression(object):
         The parameter `eps` prevents collapse of the variances to 0 by
         clamping them to this minimum value.
         """
+        # mean is simply the linear regression prediction
+        mus = self._linear_predictor(X, self.beta_estimate)
         if self.add_ones:
-            X_ones = self.add_column_of_ones(X)
+            # x^T C x for the augmented row [x, 1] expands into the
+            # quadratic form of the feature block, twice the cross term
+            # with the intercept and the intercept variance
+            d_features = X.shape[1]
+            covar_features = self.covar[:d_features, :d_features]
+            covar_intercept = self.covar[:d_features, d_features]
+            X_dot_covar = dot(X, covar_features)
+            X_dot_covar *= X
+            sigmas_squared = X_dot_covar.sum(axis=1)
+            cross_terms = dot(X, covar_intercept)
+            cross_terms *= 2
+            sigmas_squared += cross_terms
+            sigmas_squared += self.covar[d_features, d_features]
         else:
-            X_ones = X
-        # mean is simply the linear regression prediction
-        mus = dot(X_ones, self.beta_estimate)
-        X_dot_covar = dot(X_ones, self.covar)
-        X_dot_covar *= X_ones
-        sigmas_squared = X_dot_covar.sum(axis=1)
+            X_dot_covar = dot(X, self.covar)
+            X_dot_covar *= X
+            sigmas_squared = X_dot_covar.sum(axis=1)
         sigmas_squared += self.sigma_squared_estimate
         if sigmas_squared.min() <= eps:
             # keep the variance from collapsing completely or in some
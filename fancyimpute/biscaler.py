@@ -11,11 +11,15 @@
 # limitations under the License.
 
 from __future__ import absolute_import, print_function, division
+from copy import copy
+from time import time
 
 from six.moves import range
 
 import numpy as np
 
+from .callbacks import notify_callbacks
+
 
 class BiScaler(object):
     """
@@ -34,7 +38,8 @@ class BiScaler(object):
             max_value=None,
             max_iters=100,
             tolerance=0.001,
-            verbose=True):
+            verbose=True,
+            callbacks=None):
         self.center_rows = center_rows
         self.center_columns = center_columns
         self.scale_rows = scale_rows
@@ -44,6 +49,7 @@ class BiScaler(object):
         self.max_iters = max_iters
         self.tolerance = tolerance
         self.verbose = verbose
+        self.callbacks = list(callbacks) if callbacks else []
 
     def estimate_row_means(
             self,
@@ -264,6 +270,7 @@ class BiScaler(object):
             print("[BiScaler] Initial log residual value = %f" % (
                 np.log(last_residual),))
         for i in range(self.max_iters):
+            start_t = time()
             if last_residual == 0:
                 # already have a perfect fit, so let's get out of here
                 print("[BiScaler] No room for improvement")
@@ -320,6 +327,13 @@ class BiScaler(object):
                     i + 1,
                     np.log(residual),
                     np.log(last_residual / residual)))
+            notify_callbacks(
+                self.callbacks,
+                self.__class__.__name__,
+                iteration=i + 1,
+                elapsed_time=time() - start_t,
+                residual=residual,
+                convergence_delta=change_in_residual / last_residual)
             if change_in_residual / last_residual < self.tolerance:
                 break
             last_residual = residual
@@ -328,6 +342,43 @@ class BiScaler(object):
         self.column_means = column_means
         self.column_scales = column_scales
 
+    def fit_new_rows(self, X):
+        """
+        Returns a copy of this BiScaler whose row means and scales are
+        estimated for the rows of X (which weren't seen by fit), keeping
+        the fitted column means and scales. Rows without any observed
+        values are left uncentered and unscaled.
+        """
+        X = self.clamp(X)
+        n_rows = X.shape[0]
+        dtype = self.column_means.dtype
+        observed = ~np.isnan(X)
+        empty_rows = ~observed.any(axis=1)
+        # with fixed column statistics a single estimate of the row
+        # statistics is exact, there's nothing to alternate between
+        if self.center_rows:
+            with np.errstate(divide="ignore", invalid="ignore"):
+                row_means = self.estimate_row_means(
+                    X=X,
+                    observed=observed,
+                    column_means=self.column_means,
+                    column_scales=self.column_scales)
+            row_means[empty_rows] = 0
+        else:
+            row_means = np.zeros(n_rows, dtype=dtype)
+        if self.scale_rows:
+            X_centered = self.center(X, row_means, self.column_means)
+            X_centered[empty_rows] = 0
+            row_scales = self.estimate_row_scales(
+                X_centered=X_centered,
+                column_scales=self.column_scales)
+        else:
+            row_scales = np.ones(n_rows, dtype=dtype)
+        result = copy(self)
+        result.row_means = row_means
+        result.row_scales = row_scales
+        return result
+
     def transform(self, X):
         X = np.asarray(X).copy()
         X = self.center(X, self.row_means, self.column_means, inplace=True)
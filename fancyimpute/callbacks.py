@@ -0,0 +1,150 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Per-iteration events for iterative solvers.
+
+Solvers (and BiScaler) accept a list of callbacks, each of which is called
+with a dictionary describing every iteration. Every event has the fields:
+
+    "source" : name of the class which ran the iteration
+    "iteration" : 1-based iteration number
+    "elapsed_time" : wall time in seconds spent in this iteration
+    "peak_rss" : peak resident set size of the process in bytes, or None
+        where the resource module isn't available
+
+and, depending on the solver, some of:
+
+    "svd_time" : wall time in seconds spent computing the SVD
+    "rank" : rank of the current low-rank approximation
+    "convergence_delta" : relative change of the solution which is compared
+        against the convergence threshold
+    "observed_mae" : mean absolute error on the observed entries
+    "observed_mae_sampled" : whether observed_mae was estimated on a sample
+        of the observed entries rather than all of them
+    "residual" : BiScaler's residual after the iteration
+    "n_converged" : number of converged matrices when completing a batch
+"""
+
+from __future__ import absolute_import, print_function, division
+import json
+import logging
+import math
+import sys
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+def peak_rss():
+    """
+    Returns the peak resident set size of this process in bytes, or None
+    if it can't be determined on this platform.
+    """
+    if resource is None:
+        return None
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        # already in bytes on macOS but in kilobytes elsewhere
+        return max_rss
+    return max_rss * 1024
+
+
+def notify_callbacks(callbacks, source, **fields):
+    """
+    Build an event from the given fields and pass it to every callback.
+    """
+    if not callbacks:
+        return
+    event = dict(fields)
+    event["source"] = source
+    event["peak_rss"] = peak_rss()
+    for callback in callbacks:
+        callback(event)
+
+
+def _python_value(value):
+    # numpy scalars aren't JSON serializable
+    if hasattr(value, "item"):
+        return value.item()
+    return value
+
+
+def _json_value(value):
+    value = _python_value(value)
+    # JSON has no infinite or NaN numbers, e.g. the first convergence_delta
+    # of a solver starting from zeros is infinite
+    if isinstance(value, float) and (math.isinf(value) or math.isnan(value)):
+        return None
+    return value
+
+
+class LoggingCallback(object):
+    """
+    Log every event as a single line of key=value pairs, with the event
+    itself attached to the log record as its "imputation_event" attribute
+    for handlers which emit structured records.
+
+    Parameters
+    ----------
+    logger : logging.Logger, optional
+        Defaults to the "fancyimpute" logger.
+
+    level : int
+        Level to log the events at.
+    """
+
+    def __init__(self, logger=None, level=logging.INFO):
+        if logger is None:
+            logger = logging.getLogger("fancyimpute")
+        self.logger = logger
+        self.level = level
+
+    def __call__(self, event):
+        fields = " ".join(
+            "%s=%s" % (key, _python_value(value))
+            for (key, value) in sorted(event.items())
+            if key != "source")
+        self.logger.log(
+            self.level,
+            "[%s] %s" % (event["source"], fields),
+            extra={"imputation_event": event})
+
+
+class TraceCallback(object):
+    """
+    Keep every event in memory so that the whole trace can be inspected or
+    exported as JSON after a solver has run.
+    """
+
+    def __init__(self):
+        self.events = []
+
+    def __call__(self, event):
+        self.events.append(dict(event))
+
+    def to_json(self, path=None):
+        """
+        Returns the events as a JSON list, also writing it to path if given.
+        Infinite and NaN values are written as null.
+        """
+        events = [
+            {key: _json_value(value) for (key, value) in event.items()}
+            for event in self.events
+        ]
+        text = json.dumps(events, indent=2, sort_keys=True, allow_nan=False)
+        if path is not None:
+            with open(path, "w") as f:
+                f.write(text)
+        return text
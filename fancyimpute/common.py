@@ -12,8 +12,11 @@
 
 from __future__ import absolute_import, print_function, division
 import logging
+from multiprocessing import Pool
 
 import numpy as np
+from numpy.lib.format import open_memmap
+from six import string_types
 from six.moves import range
 
 
@@ -27,6 +30,194 @@ def masked_mse(X_true, X_pred, mask):
     return np.mean(masked_diff ** 2)
 
 
+def masked_changes_per_matrix(X_old, X_new, missing_mask):
+    """
+    For each matrix in a stack with shape (n_matrices, n_rows, n_cols),
+    returns the sum of squared differences between X_old and X_new over
+    its missing entries and the sum of squares of X_old over the same
+    entries.
+    """
+    difference = np.where(missing_mask, X_old - X_new, 0)
+    old_missing_values = np.where(missing_mask, X_old, 0)
+    ssd = (difference ** 2).sum(axis=(1, 2))
+    old_norm_squared = (old_missing_values ** 2).sum(axis=(1, 2))
+    return ssd, old_norm_squared
+
+
+# fold_in_rows solves the ridge regressions of all rows at once (which
+# beats looping over rows unless the rank is large) when the upper
+# triangles of the outer products of the column factors, an array of
+# n_cols x rank (rank + 1) / 2 elements, are at most this large
+MAX_BATCHED_FOLD_IN_SIZE = 2 * 10 ** 5
+
+
+def _batched_ridge_fold_in_rows(
+        missing_mask,
+        column_factors,
+        rhs,
+        gram,
+        regularization,
+        block_size=4096):
+    n_rows, n_cols = missing_mask.shape
+    rank = column_factors.shape[1]
+    # each row's Gram matrix is the full one minus the outer products of
+    # the factors of its missing columns, which are symmetric so only their
+    # upper triangles are summed
+    upper_rows, upper_cols = np.triu_indices(rank)
+    outer_products = (
+        column_factors[:, upper_rows] * column_factors[:, upper_cols])
+    gram = gram + regularization * np.eye(rank, dtype=gram.dtype)
+    row_factors = np.zeros((n_rows, rank), dtype=rhs.dtype)
+    for start in range(0, n_rows, block_size):
+        end = min(start + block_size, n_rows)
+        upper_triangles = gram[upper_rows, upper_cols] - np.dot(
+            missing_mask[start:end].astype(outer_products.dtype),
+            outer_products)
+        row_grams = np.empty((end - start, rank, rank), dtype=gram.dtype)
+        row_grams[:, upper_rows, upper_cols] = upper_triangles
+        row_grams[:, upper_cols, upper_rows] = upper_triangles
+        row_factors[start:end] = np.linalg.solve(
+            row_grams, rhs[start:end, :, np.newaxis])[:, :, 0]
+    return row_factors
+
+
+def fold_in_rows(X, missing_mask, column_factors, regularization=0.0):
+    """
+    Find the row factors of a low-rank model X ~= dot(row_factors,
+    column_factors.T) for new rows, holding the column factors fixed. Each
+    row gets its own ridge regression on its observed entries.
+
+    Parameters
+    ----------
+    X : np.ndarray
+        New rows, the values of missing entries are ignored.
+
+    missing_mask : np.ndarray
+        Boolean array indicating the missing entries of X.
+
+    column_factors : np.ndarray
+        Array of shape (n_cols, rank)
+
+    regularization : float
+        Ridge penalty on the row factors. Without one the minimum norm
+        least-squares solution is used.
+
+    Returns array of shape (n_rows, rank).
+    """
+    n_rows, n_cols = X.shape
+    rank = column_factors.shape[1]
+    # the right hand sides of all the normal equations in a single product,
+    # zeroing the missing entries drops them from the sums
+    X_observed = np.where(missing_mask, 0, X)
+    rhs = np.dot(X_observed, column_factors)
+    gram = np.dot(column_factors.T, column_factors)
+    batched_size = n_cols * rank * (rank + 1) // 2
+    if regularization > 0 and batched_size <= MAX_BATCHED_FOLD_IN_SIZE:
+        return _batched_ridge_fold_in_rows(
+            missing_mask, column_factors, rhs, gram, regularization)
+    n_missing_per_row = missing_mask.sum(axis=1)
+    row_factors = np.zeros((n_rows, rank), dtype=rhs.dtype)
+    diagonal = np.arange(rank)
+    # the cutoff numpy >= 1.14 uses for rcond=None, which older versions
+    # don't accept
+    rcond = np.finfo(rhs.dtype).eps * rank
+    for i in range(n_rows):
+        n_missing = n_missing_per_row[i]
+        if n_missing == n_cols:
+            continue
+        elif n_missing == 0:
+            row_gram = gram.copy()
+        elif 2 * n_missing < n_cols:
+            # cheaper to remove the missing columns from the full Gram matrix
+            missing_factors = column_factors[missing_mask[i]]
+            row_gram = gram - np.dot(missing_factors.T, missing_factors)
+        else:
+            observed_factors = column_factors[~missing_mask[i]]
+            row_gram = np.dot(observed_factors.T, observed_factors)
+        if regularization > 0:
+            row_gram[diagonal, diagonal] += regularization
+            row_factors[i] = np.linalg.solve(row_gram, rhs[i])
+        else:
+            row_factors[i] = np.linalg.lstsq(
+                row_gram, rhs[i], rcond=rcond)[0]
+    return row_factors
+
+
+def reconstruct_entries(
+        row_factors,
+        column_factors,
+        rows,
+        cols,
+        block_size=65536):
+    """
+    Returns the entries of dot(row_factors, column_factors.T) at the given
+    coordinates without forming the whole product, gathering the factors of
+    block_size entries at a time.
+
+    Parameters
+    ----------
+    row_factors : np.ndarray
+        Array of shape (n_rows, rank)
+
+    column_factors : np.ndarray
+        Array of shape (n_cols, rank)
+
+    rows : np.ndarray
+        Row index of each entry.
+
+    cols : np.ndarray
+        Column index of each entry.
+
+    block_size : int
+    """
+    dtype = np.result_type(row_factors, column_factors)
+    values = np.empty(len(rows), dtype=dtype)
+    for start in range(0, len(rows), block_size):
+        end = start + block_size
+        values[start:end] = np.einsum(
+            "ij,ij->i",
+            row_factors[rows[start:end]],
+            column_factors[cols[start:end]])
+    return values
+
+
+def load_input_array(X):
+    """
+    If X is the path to a .npy file then memory-map it read-only, otherwise
+    return X unchanged.
+    """
+    if isinstance(X, string_types):
+        return np.load(X, mmap_mode="r")
+    return X
+
+
+def create_output_array(out, shape, dtype):
+    """
+    Parameters
+    ----------
+    out : np.ndarray, str or None
+        Existing array to write a result into, path at which to create a
+        memory-mapped .npy file, or None to allocate a new array.
+
+    shape : tuple
+
+    dtype : dtype
+        Used when a new array or file is created.
+
+    Returns an array of the given shape. Newly created arrays are zeroed,
+    existing ones are returned as they are.
+    """
+    if out is None:
+        return np.zeros(shape, dtype=dtype)
+    elif isinstance(out, string_types):
+        return open_memmap(out, mode="w+", dtype=dtype, shape=shape)
+    elif out.shape != shape:
+        raise ValueError(
+            "Expected output array with shape %s but got %s" % (
+                shape, out.shape))
+    return out
+
+
 def generate_random_column_samples(column):
     col_mask = np.isnan(column)
     n_missing = np.sum(col_mask)
@@ -43,51 +234,251 @@ def generate_random_column_samples(column):
         return np.random.randn(n_missing) * std + mean
 
 
+def nan_column_means_and_stds(X, missing_mask, buffer_size=2 ** 20):
+    """
+    Means and standard deviations of the observed entries in each column of
+    X (NaN for columns without any). Equivalent to np.nanmean(X, axis=0)
+    and np.nanstd(X, axis=0) but works through blocks of rows with a single
+    reused buffer of about buffer_size bytes instead of allocating
+    temporary copies of the whole matrix.
+    """
+    n_rows, n_cols = X.shape
+    n_observed = n_rows - missing_mask.sum(axis=0)
+    # as many rows as fit in the buffer, so that tall matrices don't loop
+    # over many tiny blocks
+    block_size = buffer_size // max(1, n_cols * X.dtype.itemsize)
+    block_size = max(1, min(block_size, n_rows))
+    buffer = np.empty((block_size, n_cols), dtype=X.dtype)
+    sums = np.zeros(n_cols, dtype=X.dtype)
+    squared_deviation_sums = np.zeros(n_cols, dtype=X.dtype)
+    row_blocks = [
+        (start, min(start + block_size, n_rows))
+        for start in range(0, n_rows, block_size)
+    ]
+    for (start, end) in row_blocks:
+        block = buffer[:end - start]
+        np.copyto(block, X[start:end])
+        np.copyto(block, 0, where=missing_mask[start:end])
+        sums += block.sum(axis=0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        means = sums / n_observed
+    for (start, end) in row_blocks:
+        block = buffer[:end - start]
+        np.subtract(X[start:end], means, out=block)
+        np.copyto(block, 0, where=missing_mask[start:end])
+        block **= 2
+        squared_deviation_sums += block.sum(axis=0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        variances = squared_deviation_sums / n_observed
+    return means, np.sqrt(variances)
+
+
+def generate_random_samples_for_missing_entries(X, missing_mask):
+    """
+    Vectorized generate_random_column_samples for every column of X at
+    once, drawing all the Gaussian samples with a single call (in the same
+    order as calling generate_random_column_samples one column at a time).
+
+    Returns the row indices, column indices and sampled values of the
+    missing entries.
+    """
+    column_indices, row_indices = np.nonzero(missing_mask.T)
+    empty_columns = missing_mask.sum(axis=0) == X.shape[0]
+    if empty_columns.any():
+        logging.warn("No observed values in %d columns" % (
+            empty_columns.sum(),))
+    means, stds = nan_column_means_and_stds(X, missing_mask)
+    means[empty_columns] = 0
+    stds[empty_columns] = 0
+    sampled_columns = ~np.isclose(stds, 0)
+    values = means[column_indices]
+    sampled_entries = sampled_columns[column_indices]
+    samples = np.random.randn(sampled_entries.sum())
+    samples *= stds[column_indices[sampled_entries]]
+    samples += values[sampled_entries]
+    values[sampled_entries] = samples
+    return row_indices, column_indices, values
+
+
+def masked_column_percentiles(X, mask, percentiles):
+    """
+    Percentiles of the entries of each column of X which are selected by
+    mask, interpolated linearly like np.percentile. All percentiles of all
+    columns come from a single sort of X.
+
+    Returns array of shape (len(percentiles), n_cols), with NaN for columns
+    which have no selected entries.
+    """
+    n_rows, n_cols = X.shape
+    # sorting puts the NaN values of the unselected entries at the end of
+    # each column
+    sorted_values = np.where(mask, X, np.nan)
+    sorted_values.sort(axis=0)
+    counts = mask.sum(axis=0)
+    positions = np.outer(
+        np.asarray(percentiles, dtype=float) / 100.0,
+        np.maximum(counts - 1, 0))
+    lower = np.floor(positions).astype(int)
+    upper = np.minimum(lower + 1, np.maximum(counts - 1, 0))
+    fractions = positions - lower
+    # fancy indexing rather than np.take_along_axis, which needs numpy 1.15
+    columns = np.arange(n_cols)
+    lower_values = sorted_values[lower, columns]
+    upper_values = sorted_values[upper, columns]
+    return lower_values + fractions * (upper_values - lower_values)
+
+
+def percentile_mismatch(candidate, missing_mask, percentiles, columns):
+    """
+    Mean squared difference between the percentiles of the imputed and the
+    observed values of candidate, over all of the given columns.
+    """
+    missing_percentiles = masked_column_percentiles(
+        candidate[:, columns], missing_mask[:, columns], percentiles)
+    observed_percentiles = masked_column_percentiles(
+        candidate[:, columns], ~missing_mask[:, columns], percentiles)
+    return np.mean((missing_percentiles - observed_percentiles) ** 2)
+
+
+# task function and shared arguments of worker processes, see WorkerPool
+_worker_state = {}
+
+
+def _initialize_worker(function, shared_args):
+    _worker_state["function"] = function
+    _worker_state["shared_args"] = shared_args
+
+
+def _run_task_in_worker(task):
+    return _worker_state["function"](task, *_worker_state["shared_args"])
+
+
+class WorkerPool(object):
+    """
+    Process pool which calls function(task, *shared_args) for every task.
+    The shared arguments (such as large arrays) are sent to each worker
+    once when it starts rather than with every task. The function has to
+    be defined at the top level of a module so that it can be pickled.
+
+    Used as a context manager, the pool is closed and its workers joined
+    on exit.
+
+    Parameters
+    ----------
+    n_jobs : int
+        Number of worker processes.
+
+    function : function
+
+    shared_args : tuple
+    """
+
+    def __init__(self, n_jobs, function, shared_args=()):
+        self._pool = Pool(
+            n_jobs,
+            initializer=_initialize_worker,
+            initargs=(function, tuple(shared_args)))
+
+    def map(self, tasks):
+        return self._pool.map(_run_task_in_worker, tasks)
+
+    def imap(self, tasks):
+        return self._pool.imap(_run_task_in_worker, tasks)
+
+    def imap_unordered(self, tasks):
+        """
+        Results in the order in which they finish, with every worker taking
+        the next task as soon as it's done with one.
+        """
+        return self._pool.imap_unordered(_run_task_in_worker, tasks)
+
+    def close(self):
+        self._pool.close()
+        self._pool.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
 def choose_solution_using_percentiles(
         X_original,
         solutions,
         parameters=None,
         verbose=False,
-        percentiles=list(range(10, 100, 10))):
+        percentiles=list(range(10, 100, 10)),
+        n_jobs=1):
     """
     It's tricky to pick a single matrix out of all the candidate
     solutions with differing shrinkage thresholds.
     Our heuristic is to pick the matrix whose percentiles match best
-    between the missing and observed data.
+    between the missing and observed data, averaged over every column with
+    at least two missing and two observed values.
+
+    Parameters
+    ----------
+    X_original : np.ndarray
+        Incomplete matrix, with NaN for missing values.
+
+    solutions : iterable of np.ndarray
+        Candidate completions of X_original. May be a generator, in which
+        case only the best candidate so far is kept in memory.
+
+    parameters : list, optional
+        Parameter of each candidate, only used for printing.
+
+    verbose : bool
+
+    percentiles : list of float
+
+    n_jobs : int
+        Number of worker processes to score candidates in. Candidates are
+        then all collected up front, so generators lose their memory
+        savings.
     """
     missing_mask = np.isnan(X_original)
+    n_rows = missing_mask.shape[0]
+    n_missing_per_column = missing_mask.sum(axis=0)
+    columns = np.flatnonzero(
+        (n_missing_per_column >= 2) &
+        (n_rows - n_missing_per_column >= 2))
+    if len(columns) == 0:
+        raise ValueError(
+            "No columns with at least two missing and two observed values")
+    percentiles = np.asarray(percentiles, dtype=float)
+    pool = None
+    if n_jobs > 1:
+        solutions = list(solutions)
+        pool = WorkerPool(
+            n_jobs,
+            percentile_mismatch,
+            shared_args=(missing_mask, percentiles, columns))
+        scores = pool.imap(solutions)
+        candidates_and_scores = zip(solutions, scores)
+    else:
+        candidates_and_scores = (
+            (candidate, percentile_mismatch(
+                candidate, missing_mask, percentiles, columns))
+            for candidate in solutions)
+    n_solutions = len(solutions) if hasattr(solutions, "__len__") else None
     min_mse = np.inf
     best_solution = None
-    for i, candidate in enumerate(solutions):
-        for col_idx in range(X_original.shape[1]):
-            col_data = candidate[:, col_idx]
-            col_missing = missing_mask[:, col_idx]
-            col_observed = ~col_missing
-            if col_missing.sum() < 2:
-                continue
-            elif col_observed.sum() < 2:
-                continue
-            missing_data = col_data[col_missing]
-            observed_data = col_data[col_observed]
-
-            missing_percentiles = np.array([
-                np.percentile(missing_data, p)
-                for p in percentiles])
-
-            observed_percentiles = np.array([
-                np.percentile(observed_data, p)
-                for p in percentiles])
-
-            mse = np.mean((missing_percentiles - observed_percentiles) ** 2)
-        if mse < min_mse:
-            min_mse = mse
-            best_solution = candidate
-        if verbose:
-            print("Candidate #%d/%d%s: %f" % (
-                i + 1,
-                len(solutions),
-                (" (parameter=%s) " % parameters[i]
-                    if parameters is not None
-                    else ""),
-                mse))
+    try:
+        for i, (candidate, mse) in enumerate(candidates_and_scores):
+            if mse < min_mse:
+                min_mse = mse
+                best_solution = candidate
+            if verbose:
+                print("Candidate #%d%s%s: %f" % (
+                    i + 1,
+                    "/%d" % n_solutions if n_solutions is not None else "",
+                    (" (parameter=%s) " % parameters[i]
+                        if parameters is not None
+                        else ""),
+                    mse))
+    finally:
+        if pool is not None:
+            pool.close()
     return best_solution
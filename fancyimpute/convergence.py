@@ -0,0 +1,297 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import, print_function, division
+
+import numpy as np
+from six.moves import range
+
+from .common import masked_mae, reconstruct_entries
+
+# reconstructing the missing entries one by one from the factors of a
+# low-rank matrix takes about as long as the whole product (with BLAS) when
+# this fraction of the entries is missing
+MAX_MISSING_FRACTION_FOR_ENTRYWISE_RECONSTRUCTION = 0.05
+
+# number of entries per block of rows when computing the error on all of
+# the observed entries from the factors one entry at a time
+OBSERVED_ENTRIES_BLOCK_SIZE = 65536
+
+
+class ConvergenceMonitor(object):
+    """
+    Tracks the progress of a solver which repeatedly replaces the missing
+    entries of a matrix with their values in a new reconstruction, while
+    its observed entries never change.
+
+    The current missing values and their squared norm are kept between
+    iterations, so measuring the change of the solution takes a single
+    gather of the missing entries of the new reconstruction, which is
+    then reused to update the matrix. The error on the observed entries is
+    estimated on a fixed random sample of them unless a full pass is
+    requested.
+
+    Solvers which produce the factors of a low-rank reconstruction can pass
+    those instead (see update_from_factors), in which case only the missing
+    (and sampled observed) entries of the product are computed when few of
+    the entries are missing.
+
+    Parameters
+    ----------
+    X : np.ndarray
+        Initialized matrix, its observed entries must stay fixed.
+
+    missing_mask : np.ndarray
+        Boolean array indicating where the missing entries of X are.
+
+    sample_size : int, optional
+        Number of observed entries to estimate the observed error on, or
+        None to always use all of them.
+
+    full_metrics_every : int, optional
+        Use all observed entries for the observed error on every iteration
+        which is a multiple of this.
+
+    random_seed : int
+        Seed for the sample of observed entries, which doesn't touch the
+        global NumPy random state.
+    """
+
+    def __init__(
+            self,
+            X,
+            missing_mask,
+            sample_size=10000,
+            full_metrics_every=None,
+            random_seed=0):
+        self.X = X
+        self.missing_mask = missing_mask
+        self.sample_size = sample_size
+        self.full_metrics_every = full_metrics_every
+        self.random_seed = random_seed
+        self.iteration = 0
+        self.missing_values = X[missing_mask]
+        self.missing_norm_squared = np.dot(
+            self.missing_values, self.missing_values)
+        self._sample_rows = None
+        self._sample_cols = None
+        self._sample_values = None
+        self._missing_rows = None
+        self._missing_cols = None
+        self._reconstruction = None
+        # factors and clip function the reconstruction buffer holds the
+        # product of
+        self._reconstruction_source = None
+
+    def _sample_observed_entries(self):
+        n_rows, n_cols = self.missing_mask.shape
+        n_observed = self.missing_mask.size - self.missing_values.size
+        random_state = np.random.RandomState(self.random_seed)
+        # draw flat indices until enough of them land on observed entries,
+        # which avoids listing all of the observed entries
+        fraction_observed = n_observed / self.missing_mask.size
+        flat_indices = np.array([], dtype=int)
+        while len(flat_indices) < self.sample_size:
+            n_draws = int(2 * self.sample_size / fraction_observed) + 1
+            candidates = random_state.randint(
+                0, self.missing_mask.size, n_draws)
+            rows, cols = np.unravel_index(candidates, (n_rows, n_cols))
+            candidates = candidates[~self.missing_mask[rows, cols]]
+            flat_indices = np.union1d(flat_indices, candidates)
+        flat_indices = random_state.choice(
+            flat_indices, self.sample_size, replace=False)
+        self._sample_rows, self._sample_cols = np.unravel_index(
+            flat_indices, (n_rows, n_cols))
+        self._sample_values = self.X[self._sample_rows, self._sample_cols]
+
+    def update(self, X_new):
+        """
+        Copy the missing entries of X_new into X and return the squared
+        norm of their change relative to the squared norm of their previous
+        values.
+        """
+        return self.update_missing_values(X_new[self.missing_mask])
+
+    def update_missing_values(self, new_missing_values):
+        """
+        Same as update, given only the new values of the missing entries
+        (in the order of X[missing_mask]).
+        """
+        self.iteration += 1
+        difference = self.missing_values - new_missing_values
+        ssd = np.dot(difference, difference)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            # the first change is undefined when starting from zeros
+            relative_change_squared = ssd / self.missing_norm_squared
+        self.X[self.missing_mask] = new_missing_values
+        self.missing_values = new_missing_values
+        self.missing_norm_squared = np.dot(
+            new_missing_values, new_missing_values)
+        return relative_change_squared
+
+    def _sample_covers_observed_entries(self):
+        # a sample can't hold more distinct observed entries than there are
+        n_observed = self.missing_mask.size - self.missing_values.size
+        return self.sample_size is None or self.sample_size >= n_observed
+
+    def uses_full_metrics(self):
+        """
+        Whether observed_mae uses every observed entry on this iteration.
+        """
+        return (
+            self._sample_covers_observed_entries() or
+            (self.full_metrics_every is not None and
+             self.iteration % self.full_metrics_every == 0))
+
+    def observed_mae(self, X_pred, full=None):
+        """
+        Mean absolute error of X_pred on the observed entries of X, over
+        all of them if full (by default decided by uses_full_metrics) and
+        otherwise over the fixed sample. The sample is never larger than
+        the number of observed entries, so with a sample_size at least that
+        large all of them are used either way.
+        """
+        if full is None:
+            full = self.uses_full_metrics()
+        if full or self._sample_covers_observed_entries():
+            return masked_mae(
+                X_true=self.X,
+                X_pred=X_pred,
+                mask=~self.missing_mask)
+        if self._sample_values is None:
+            self._sample_observed_entries()
+        predicted_values = X_pred[self._sample_rows, self._sample_cols]
+        return np.mean(np.abs(self._sample_values - predicted_values))
+
+    def uses_entrywise_reconstruction(self):
+        """
+        Whether update_from_factors computes only the missing entries of
+        the reconstruction instead of the whole product.
+        """
+        return self.missing_values.size <= (
+            MAX_MISSING_FRACTION_FOR_ENTRYWISE_RECONSTRUCTION *
+            self.missing_mask.size)
+
+    def _dense_reconstruction(self, row_factors, column_factors, clip):
+        # reuse one buffer for the products of every iteration
+        if self._reconstruction is None:
+            self._reconstruction = np.empty(
+                self.X.shape,
+                dtype=np.result_type(row_factors, column_factors))
+        np.dot(row_factors, column_factors.T, out=self._reconstruction)
+        if clip is not None:
+            clip(self._reconstruction)
+        self._reconstruction_source = (row_factors, column_factors, clip)
+        return self._reconstruction
+
+    def _reconstruction_of(self, row_factors, column_factors, clip):
+        """
+        The dense reconstruction from the given factors, reusing the buffer
+        without another product if it already holds it (such as after
+        update_from_factors with the same factors).
+        """
+        if self._reconstruction_source is not None:
+            last_row_factors, last_column_factors, last_clip = \
+                self._reconstruction_source
+            # bound methods like Solver.clip are new objects on every
+            # access but compare equal
+            if (last_row_factors is row_factors and
+                    last_column_factors is column_factors and
+                    last_clip == clip):
+                return self._reconstruction
+        return self._dense_reconstruction(row_factors, column_factors, clip)
+
+    def _full_observed_mae_from_factors(
+            self, row_factors, column_factors, clip):
+        # one block of rows at a time, so that neither the dense product nor
+        # the indices of all of the observed entries are held in memory
+        n_rows, n_cols = self.X.shape
+        block_size = max(1, OBSERVED_ENTRIES_BLOCK_SIZE // n_cols)
+        total_error = 0.0
+        for start in range(0, n_rows, block_size):
+            end = min(start + block_size, n_rows)
+            rows, cols = np.nonzero(~self.missing_mask[start:end])
+            predicted_values = reconstruct_entries(
+                row_factors[start:end], column_factors, rows, cols)
+            if clip is not None:
+                clip(predicted_values)
+            total_error += np.abs(
+                self.X[start:end][rows, cols] - predicted_values).sum()
+        n_observed = self.missing_mask.size - self.missing_values.size
+        return total_error / n_observed
+
+    def update_from_factors(self, row_factors, column_factors, clip=None):
+        """
+        Same as update(clip(dot(row_factors, column_factors.T))), but when
+        few entries are missing only the missing entries of the product are
+        computed and clipped.
+
+        Parameters
+        ----------
+        row_factors : np.ndarray
+            Array of shape (n_rows, rank)
+
+        column_factors : np.ndarray
+            Array of shape (n_cols, rank)
+
+        clip : function, optional
+            Clips an array of values in place, such as Solver.clip.
+        """
+        if not self.uses_entrywise_reconstruction():
+            return self.update(self._dense_reconstruction(
+                row_factors, column_factors, clip))
+        if self._missing_rows is None:
+            # same order as X[missing_mask]
+            self._missing_rows, self._missing_cols = np.nonzero(
+                self.missing_mask)
+        new_missing_values = reconstruct_entries(
+            row_factors,
+            column_factors,
+            self._missing_rows,
+            self._missing_cols)
+        if clip is not None:
+            clip(new_missing_values)
+        return self.update_missing_values(new_missing_values)
+
+    def observed_mae_from_factors(
+            self,
+            row_factors,
+            column_factors,
+            clip=None,
+            full=None):
+        """
+        Same as observed_mae(clip(dot(row_factors, column_factors.T))), but
+        computing only the sampled entries of the product unless all of the
+        observed entries are used. Those then come from the dense
+        reconstruction already computed by update_from_factors with the
+        same factors, or one block of rows at a time when it only
+        reconstructed the missing entries.
+        """
+        if full is None:
+            full = self.uses_full_metrics()
+        if full or self._sample_covers_observed_entries():
+            if self.uses_entrywise_reconstruction():
+                return self._full_observed_mae_from_factors(
+                    row_factors, column_factors, clip)
+            return self.observed_mae(
+                self._reconstruction_of(row_factors, column_factors, clip),
+                full=True)
+        if self._sample_values is None:
+            self._sample_observed_entries()
+        predicted_values = reconstruct_entries(
+            row_factors,
+            column_factors,
+            self._sample_rows,
+            self._sample_cols)
+        if clip is not None:
+            clip(predicted_values)
+        return np.mean(np.abs(self._sample_values - predicted_values))
@@ -16,23 +16,32 @@ Helper functions for incomplete matrices represented using dictionaries.
 
 from __future__ import absolute_import, print_function, division
 from collections import defaultdict
+from itertools import chain
 
-from six.moves import range
+from six.moves import range, map
 import numpy as np
 
-from scipy.sparse import dok_matrix
+from scipy.sparse import coo_matrix, csr_matrix, dok_matrix
+
 
 def dense_nan_matrix(shape, dtype):
-    return np.ones(shape, dtype=dtype) * np.nan
+    return np.full(shape, np.nan, dtype=dtype)
+
+
+def sparse_csr_matrix(shape, dtype):
+    return coo_matrix(shape, dtype=dtype).tocsr()
+
+
+def collect_inner_key_set(nested_dict):
+    inner_key_set = set([])
+    for inner_dict in nested_dict.values():
+        inner_key_set.update(inner_dict.keys())
+    return inner_key_set
 
 
 def collect_nested_keys(nested_dict):
     outer_key_list = list(sorted(nested_dict.keys()))
-    inner_key_set = set([])
-    for k in outer_key_list:
-        inner_dict = nested_dict[k]
-        inner_key_set = inner_key_set.union(inner_dict.keys())
-    inner_key_list = list(sorted(inner_key_set))
+    inner_key_list = list(sorted(collect_inner_key_set(nested_dict)))
     return outer_key_list, inner_key_list
 
 
@@ -52,8 +61,9 @@ def flattened_nested_key_indices(nested_dict):
     Combine the outer and inner keys of nested dictionaries into a single
     ordering.
     """
-    outer_keys, inner_keys = collect_nested_keys(nested_dict)
-    combined_keys = list(sorted(set(outer_keys + inner_keys)))
+    combined_key_set = collect_inner_key_set(nested_dict)
+    combined_key_set.update(nested_dict.keys())
+    combined_keys = list(sorted(combined_key_set))
     return {k: i for (i, k) in enumerate(combined_keys)}
 
 
@@ -64,6 +74,91 @@ def index_dict_to_sorted_list(key_indices):
     return sorted_list
 
 
+def nested_dictionary_triplets(
+        nested_dict,
+        outer_key_indices,
+        inner_key_indices,
+        dtype="float32"):
+    """
+    Collect the entries of a nested dictionary into three arrays of row
+    indices, column indices and values.
+    """
+    n_entries = sum(len(d) for d in nested_dict.values())
+    outer_indices = np.fromiter(
+        map(outer_key_indices.__getitem__, nested_dict.keys()),
+        dtype=np.int64,
+        count=len(nested_dict))
+    inner_dict_sizes = np.fromiter(
+        map(len, nested_dict.values()),
+        dtype=np.int64,
+        count=len(nested_dict))
+    row_indices = np.repeat(outer_indices, inner_dict_sizes)
+    column_indices = np.fromiter(
+        map(
+            inner_key_indices.__getitem__,
+            chain.from_iterable(d.keys() for d in nested_dict.values())),
+        dtype=np.int64,
+        count=n_entries)
+    values = np.fromiter(
+        chain.from_iterable(d.values() for d in nested_dict.values()),
+        dtype=dtype,
+        count=n_entries)
+    return row_indices, column_indices, values
+
+
+def pair_dictionary_triplets(
+        pair_dict,
+        row_key_indices,
+        column_key_indices,
+        dtype="float32"):
+    """
+    Collect the entries of a dictionary whose keys are pairs into three arrays
+    of row indices, column indices and values.
+    """
+    n_entries = len(pair_dict)
+    row_indices = np.fromiter(
+        (row_key_indices[row_key] for (row_key, _) in pair_dict.keys()),
+        dtype=np.int64,
+        count=n_entries)
+    column_indices = np.fromiter(
+        (column_key_indices[column_key] for (_, column_key) in pair_dict.keys()),
+        dtype=np.int64,
+        count=n_entries)
+    values = np.fromiter(pair_dict.values(), dtype=dtype, count=n_entries)
+    return row_indices, column_indices, values
+
+
+def array_from_triplets(
+        array_fn,
+        shape,
+        dtype,
+        row_indices,
+        column_indices,
+        values):
+    """
+    Construct an array with array_fn and fill in the given entries, using a
+    single bulk operation for the array constructors defined in this module.
+    """
+    if array_fn is dense_nan_matrix:
+        result = dense_nan_matrix(shape, dtype)
+        result[row_indices, column_indices] = values
+    elif array_fn is sparse_csr_matrix:
+        result = coo_matrix(
+            (values, (row_indices, column_indices)),
+            shape=shape,
+            dtype=dtype).tocsr()
+    elif array_fn is dok_matrix:
+        result = coo_matrix(
+            (values, (row_indices, column_indices)),
+            shape=shape,
+            dtype=dtype).todok()
+    else:
+        result = array_fn(shape, dtype)
+        for (i, j, value) in zip(row_indices, column_indices, values):
+            result[i, j] = value
+    return result
+
+
 def array_from_nested_dictionary(
         nested_dict,
         array_fn,
@@ -96,12 +191,13 @@ def array_from_nested_dictionary(
     n_rows = len(outer_key_indices)
     n_cols = len(inner_key_indices)
     shape = (n_rows, n_cols)
-    result = array_fn(shape, dtype)
-    for outer_key, sub_dictionary in nested_dict.items():
-        i = outer_key_indices[outer_key]
-        for inner_key, value in sub_dictionary.items():
-            j = inner_key_indices[inner_key]
-            result[i, j] = value
+    row_indices, column_indices, values = nested_dictionary_triplets(
+        nested_dict,
+        outer_key_indices,
+        inner_key_indices,
+        dtype=dtype)
+    result = array_from_triplets(
+        array_fn, shape, dtype, row_indices, column_indices, values)
     outer_key_list = index_dict_to_sorted_list(outer_key_indices)
     inner_key_list = index_dict_to_sorted_list(inner_key_indices)
     return result, outer_key_list, inner_key_list
@@ -118,6 +214,22 @@ def sparse_dok_matrix_from_nested_dictionary(
         square_result=square_result)
 
 
+def sparse_csr_matrix_from_nested_dictionary(
+        nested_dict,
+        dtype="float32",
+        square_result=False):
+    """
+    Like sparse_dok_matrix_from_nested_dictionary but returns a CSR matrix
+    in which every value in the dictionary (including zeros) is explicitly
+    stored.
+    """
+    return array_from_nested_dictionary(
+        nested_dict,
+        array_fn=sparse_csr_matrix,
+        dtype=dtype,
+        square_result=square_result)
+
+
 def dense_matrix_from_nested_dictionary(
         nested_dict,
         dtype="float32",
@@ -129,24 +241,28 @@ def dense_matrix_from_nested_dictionary(
         square_result=square_result)
 
 
-def matrix_to_pair_dictionary(
-        X, row_keys=None, column_keys=None, filter_fn=None):
+def matrix_filter_mask(X, filter_fn=None):
     """
-    X : numpy.ndarray
-
-    row_keys : dict
-        Dictionary mapping indices to row names. If omitted then maps each
-        number to its string representation, such as 1 -> "1".
-
-    column_keys : dict
-        If omitted and matrix is square, then use the same dictionary
-        as the rows. Otherwise map each column index to its string form.
-
-    filter_fn : function
-        If given then only add elements for which this function returns True.
+    Boolean mask of the elements of X for which filter_fn returns True.
+    Vectorized functions such as np.isfinite are applied to the whole array
+    at once, anything else is called on one element at a time.
+    """
+    if filter_fn is None:
+        return np.ones(X.shape, dtype=bool)
+    try:
+        mask = np.asarray(filter_fn(X))
+    except (TypeError, ValueError):
+        mask = None
+    if mask is None or mask.shape != X.shape:
+        mask = np.frompyfunc(filter_fn, 1, 1)(X)
+    return mask.astype(bool, copy=False)
+
+
+def matrix_key_lists(n_rows, n_cols, row_keys=None, column_keys=None):
+    """
+    Lists of row and column keys for the conversion of a matrix into a
+    dictionary, see matrix_to_pair_dictionary.
     """
-    n_rows, n_cols = X.shape
-
     if row_keys is None:
         row_keys = {i: i for i in range(n_rows)}
 
@@ -165,17 +281,51 @@ def matrix_to_pair_dictionary(
         raise ValueError("Need %d column keys but got list of length %d" % (
             n_cols,
             len(column_keys)))
+    row_key_list = [row_keys[i] for i in range(n_rows)]
+    column_key_list = [column_keys[j] for j in range(n_cols)]
+    return row_key_list, column_key_list
+
+
+def matrix_to_pair_dictionary(
+        X, row_keys=None, column_keys=None, filter_fn=None):
+    """
+    X : numpy.ndarray
+
+    row_keys : dict
+        Dictionary mapping indices to row names. If omitted then maps each
+        row index to itself.
+
+    column_keys : dict
+        If omitted and matrix is square, then use the same dictionary
+        as the rows. Otherwise map each column index to itself.
+
+    filter_fn : function
+        If given then only add elements for which this function returns True.
+    """
+    row_key_list, column_key_list = matrix_key_lists(
+        X.shape[0], X.shape[1], row_keys=row_keys, column_keys=column_keys)
+    row_indices, column_indices = np.nonzero(matrix_filter_mask(X, filter_fn))
+    values = X[row_indices, column_indices]
+    key_pairs = zip(
+        map(row_key_list.__getitem__, row_indices.tolist()),
+        map(column_key_list.__getitem__, column_indices.tolist()))
+    return dict(zip(key_pairs, values.tolist()))
 
-    result_dict = {}
-    for i, X_i in enumerate(X):
-        row_key = row_keys[i]
-        for j, X_ij in enumerate(X_i):
-            if filter_fn and not filter_fn(X_ij):
-                continue
-            column_key = column_keys[j]
-            key_pair = (row_key, column_key)
-            result_dict[key_pair] = X_ij
-    return result_dict
+
+def matrix_to_sparse_csr_matrix(X, filter_fn=None, dtype=None):
+    """
+    Convert a dense matrix into a CSR matrix which stores only the elements
+    for which filter_fn returns True (all elements if filter_fn is omitted),
+    without building an intermediate dictionary.
+    """
+    mask = matrix_filter_mask(X, filter_fn)
+    column_indices = np.nonzero(mask)[1]
+    indptr = np.zeros(X.shape[0] + 1, dtype=np.int64)
+    np.cumsum(mask.sum(axis=1), out=indptr[1:])
+    return csr_matrix(
+        (X[mask], column_indices, indptr),
+        shape=X.shape,
+        dtype=X.dtype if dtype is None else dtype)
 
 
 def curry_pair_dictionary(key_pair_dict, default_value=0.0):
@@ -205,12 +355,23 @@ def matrix_to_nested_dictionary(
         row_keys=None,
         column_keys=None,
         filter_fn=None):
-    pair_dict = matrix_to_pair_dictionary(
-        X,
-        row_keys=row_keys,
-        column_keys=column_keys,
-        filter_fn=filter_fn)
-    return curry_pair_dictionary(pair_dict)
+    """
+    Like matrix_to_pair_dictionary but returns a dictionary of dictionaries
+    with one inner dictionary for each row which has at least one element.
+    """
+    row_key_list, column_key_list = matrix_key_lists(
+        X.shape[0], X.shape[1], row_keys=row_keys, column_keys=column_keys)
+    X_csr = matrix_to_sparse_csr_matrix(X, filter_fn=filter_fn)
+    column_keys_flat = list(
+        map(column_key_list.__getitem__, X_csr.indices.tolist()))
+    values = X_csr.data.tolist()
+    indptr = X_csr.indptr.tolist()
+    result = defaultdict(dict)
+    for i in np.flatnonzero(np.diff(X_csr.indptr)).tolist():
+        start, end = indptr[i], indptr[i + 1]
+        result[row_key_list[i]] = dict(
+            zip(column_keys_flat[start:end], values[start:end]))
+    return result
 
 
 def pair_dict_key_sets(pair_dict):
@@ -264,11 +425,13 @@ def array_from_pair_dictionary(
     n_rows = len(row_key_indices)
     n_cols = len(column_key_indices)
     shape = (n_rows, n_cols)
-    result = array_fn(shape, dtype)
-    for (row_key, column_key), value in pair_dict.items():
-        i = row_key_indices[row_key]
-        j = column_key_indices[column_key]
-        result[i, j] = value
+    row_indices, column_indices, values = pair_dictionary_triplets(
+        pair_dict,
+        row_key_indices,
+        column_key_indices,
+        dtype=dtype)
+    result = array_from_triplets(
+        array_fn, shape, dtype, row_indices, column_indices, values)
     return result, row_key_list, column_key_list
 
 
@@ -283,6 +446,17 @@ def sparse_dok_matrix_from_pair_dictionary(
         square_result=square_result)
 
 
+def sparse_csr_matrix_from_pair_dictionary(
+        pair_dict,
+        dtype="float32",
+        square_result=False):
+    return array_from_pair_dictionary(
+        pair_dict,
+        array_fn=sparse_csr_matrix,
+        dtype=dtype,
+        square_result=square_result)
+
+
 def dense_matrix_from_pair_dictionary(
         pair_dict,
         dtype="float32",
@@ -294,6 +468,130 @@ def dense_matrix_from_pair_dictionary(
         square_result=square_result)
 
 
+def key_indices_from_array(keys):
+    """
+    Map an array of (possibly repeated) keys to indices into the sorted array
+    of its distinct keys.
+
+    Returns the sorted distinct keys and an integer index for each element
+    of keys.
+    """
+    unique_keys, indices = np.unique(np.asarray(keys), return_inverse=True)
+    return unique_keys, indices.astype(np.int64, copy=False)
+
+
+def shared_key_indices_from_arrays(row_keys, column_keys):
+    """
+    Like key_indices_from_array but rows and columns share the sorted array
+    of all distinct keys appearing in either of them.
+    """
+    row_keys = np.asarray(row_keys)
+    unique_keys, indices = key_indices_from_array(
+        np.concatenate([row_keys, np.asarray(column_keys)]))
+    return unique_keys, indices[:len(row_keys)], indices[len(row_keys):]
+
+
+def array_from_triplets_with_keys(
+        row_keys,
+        column_keys,
+        values,
+        array_fn,
+        dtype="float32",
+        square_result=False):
+    """
+    Convert columnar (row key, column key, value) triplets into a sparse or
+    incomplete array.
+
+    Parameters
+    ----------
+    row_keys : array-like
+        Row key of each entry.
+
+    column_keys : array-like
+        Column key of each entry.
+
+    values : array-like
+        Value of each entry.
+
+    array_fn : function
+        Takes shape and dtype as arguments, returns empty array.
+
+    dtype : dtype
+        NumPy dtype of result array
+
+    square_result : bool
+        Combine keys from rows and columns
+
+    Returns array and sorted arrays of the row and column keys.
+    """
+    values = np.asarray(values, dtype=dtype)
+    if square_result:
+        row_key_array, row_indices, column_indices = \
+            shared_key_indices_from_arrays(row_keys, column_keys)
+        column_key_array = row_key_array
+    else:
+        row_key_array, row_indices = key_indices_from_array(row_keys)
+        column_key_array, column_indices = key_indices_from_array(column_keys)
+    if not (len(row_indices) == len(column_indices) == len(values)):
+        raise ValueError(
+            "Expected the same number of row keys, column keys and values "
+            "but got %d, %d and %d" % (
+                len(row_indices), len(column_indices), len(values)))
+    shape = (len(row_key_array), len(column_key_array))
+    flat_indices = np.unique(np.ravel_multi_index(
+        (row_indices, column_indices), shape))
+    if len(flat_indices) != len(values):
+        raise ValueError(
+            "Found %d duplicate (row, column) pairs among the triplets" % (
+                len(values) - len(flat_indices)))
+    result = array_from_triplets(
+        array_fn, shape, dtype, row_indices, column_indices, values)
+    return result, row_key_array, column_key_array
+
+
+def sparse_csr_matrix_from_triplets(
+        row_keys,
+        column_keys,
+        values,
+        dtype="float32",
+        square_result=False):
+    return array_from_triplets_with_keys(
+        row_keys,
+        column_keys,
+        values,
+        array_fn=sparse_csr_matrix,
+        dtype=dtype,
+        square_result=square_result)
+
+
+def dense_matrix_from_triplets(
+        row_keys,
+        column_keys,
+        values,
+        dtype="float32",
+        square_result=False):
+    return array_from_triplets_with_keys(
+        row_keys,
+        column_keys,
+        values,
+        array_fn=dense_nan_matrix,
+        dtype=dtype,
+        square_result=square_result)
+
+
+def dense_matrix_from_sparse_matrix(X, dtype=None):
+    """
+    Densify a scipy.sparse matrix whose stored entries are the observed
+    values, filling every entry which isn't stored with NaN.
+    """
+    X_coo = X.tocoo()
+    X_coo.sum_duplicates()
+    result = dense_nan_matrix(
+        X_coo.shape, X_coo.dtype if dtype is None else dtype)
+    result[X_coo.row, X_coo.col] = X_coo.data
+    return result
+
+
 def transpose_nested_dictionary(nested_dict):
     """
     Given a nested dictionary from k1 -> k2 > value
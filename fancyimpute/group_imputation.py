@@ -0,0 +1,134 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Impute a matrix whose rows belong to independent groups (e.g. customers or
+regions) by completing every group's rows on their own, rather than fitting
+one model to all of the rows.
+"""
+
+from __future__ import absolute_import, print_function, division
+
+import numpy as np
+
+from .common import WorkerPool
+from .simple_fill import SimpleFill
+
+
+def _complete_group(task, solver):
+    group_index, X_group = task
+    return group_index, solver.complete(X_group)
+
+
+def complete_by_group(
+        solver,
+        X,
+        groups,
+        min_group_size=10,
+        fallback_solver=None,
+        n_jobs=1,
+        verbose=True):
+    """
+    Complete the rows of every group of X with solver independently of the
+    other groups.
+
+    Groups with fewer than min_group_size rows, or with a column that has
+    no observed entries in the group, are too small to fit on their own
+    and take their values from a single completion of the whole matrix by
+    fallback_solver instead. That completion runs on all of the rows, so
+    the fallback should be cheap: a solver like KNN would bring back the
+    cost of imputing the whole matrix at once. Groups without missing
+    entries are left as they are.
+
+    Parameters
+    ----------
+    solver : Solver
+        Solver to complete each group with, e.g. KNN(k=5, verbose=False).
+        With n_jobs > 1 it's pickled into the worker processes.
+
+    X : np.ndarray, scipy.sparse matrix or str
+        Incomplete matrix, see Solver.prepare_input_data.
+
+    groups : array-like
+        Group label of every row of X.
+
+    min_group_size : int
+        Smallest number of rows of a group to complete on its own.
+
+    fallback_solver : Solver, optional
+        Solver which completes the whole matrix for the rows of the groups
+        which are too small, by default SimpleFill() (column means). Only
+        run if there are such groups.
+
+    n_jobs : int
+        Number of worker processes to complete groups in. The largest
+        groups are handed out first and each worker takes the next group
+        as soon as it's done with one, which balances the load when the
+        group sizes are uneven.
+
+    verbose : bool
+
+    Returns the completed matrix, with its rows in the order of X.
+    """
+    X, missing_mask = solver.prepare_input_data(X)
+    groups = np.asarray(groups)
+    if groups.shape != (X.shape[0],):
+        raise ValueError("Expected %d group labels but got shape %s" % (
+            X.shape[0], groups.shape))
+    labels, group_indices = np.unique(groups, return_inverse=True)
+    # a stable sort keeps the rows of each group in their original order
+    rows_by_group = np.split(
+        np.argsort(group_indices, kind="mergesort"),
+        np.cumsum(np.bincount(group_indices))[:-1])
+    X_result = X.copy()
+    fitted_groups = []
+    fallback_groups = []
+    for i, rows in enumerate(rows_by_group):
+        group_missing_mask = missing_mask[rows]
+        if not group_missing_mask.any():
+            continue
+        if (len(rows) < min_group_size or
+                group_missing_mask.all(axis=0).any()):
+            fallback_groups.append(i)
+        else:
+            fitted_groups.append(i)
+    if verbose:
+        print(
+            "[complete_by_group] Completing %d groups on their own and %d "
+            "with the fallback solver, %d groups have no missing values" % (
+                len(fitted_groups),
+                len(fallback_groups),
+                len(labels) - len(fitted_groups) - len(fallback_groups)))
+
+    # largest groups first, so that no worker is left with a big group at
+    # the end while the others are idle
+    fitted_groups.sort(key=lambda i: -len(rows_by_group[i]))
+    tasks = ((i, X[rows_by_group[i]]) for i in fitted_groups)
+    if n_jobs > 1 and len(fitted_groups) > 1:
+        pool = WorkerPool(
+            min(n_jobs, len(fitted_groups)),
+            _complete_group,
+            shared_args=(solver,))
+        with pool:
+            for i, X_group in pool.imap_unordered(tasks):
+                X_result[rows_by_group[i]] = X_group
+    else:
+        for i, X_group in tasks:
+            X_result[rows_by_group[i]] = solver.complete(X_group)
+
+    if fallback_groups:
+        if fallback_solver is None:
+            fallback_solver = SimpleFill()
+        X_global = fallback_solver.complete(X)
+        for i in fallback_groups:
+            X_result[rows_by_group[i]] = X_global[rows_by_group[i]]
+    return X_result
@@ -0,0 +1,322 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Choose the parameters of a solver by hiding some of the observed entries
+of a matrix, completing it with every candidate configuration and scoring
+the completions on the hidden entries.
+"""
+
+from __future__ import absolute_import, print_function, division
+from itertools import product
+
+import numpy as np
+
+from .common import WorkerPool, masked_mae, masked_mse
+
+METRICS = {
+    "mse": masked_mse,
+    "mae": masked_mae,
+}
+
+
+def parameter_grid(parameter_values):
+    """
+    Every combination of the given parameter values, e.g.
+    parameter_grid({"rank": [5, 10], "max_iters": [50]}) returns
+    [{"rank": 5, "max_iters": 50}, {"rank": 10, "max_iters": 50}].
+    """
+    names = sorted(parameter_values)
+    return [
+        dict(zip(names, values))
+        for values in product(*[parameter_values[name] for name in names])
+    ]
+
+
+def _stratified_holdout_mask(observed_mask, fraction, random_state):
+    # hide the same fraction of the observed entries of every column by
+    # ranking random keys within each column
+    keys = random_state.rand(*observed_mask.shape)
+    keys[~observed_mask] = np.inf
+    ranks = np.argsort(np.argsort(keys, axis=0), axis=0)
+    n_observed = observed_mask.sum(axis=0)
+    n_hidden = np.minimum(
+        np.round(fraction * n_observed).astype(int),
+        np.maximum(n_observed - 1, 0))
+    return ranks < n_hidden
+
+
+def create_holdout_mask(X, fraction=0.1, stratify=None, random_seed=0):
+    """
+    Choose observed entries of X to hide from the solvers.
+
+    Parameters
+    ----------
+    X : np.ndarray
+        Incomplete matrix with NaN for missing values.
+
+    fraction : float
+        Fraction of the observed entries to hide.
+
+    stratify : str, optional
+        None hides a random subset of all observed entries, "columns" (or
+        "rows") hides the same fraction of the observed entries of every
+        column (or row).
+
+    random_seed : int
+
+    Returns a boolean mask of the hidden entries. Every row and column keeps
+    at least one observed entry which isn't hidden.
+    """
+    random_state = np.random.RandomState(random_seed)
+    observed_mask = ~np.isnan(X)
+    if stratify is None:
+        holdout_mask = (
+            (random_state.rand(*X.shape) < fraction) & observed_mask)
+    elif stratify == "columns":
+        holdout_mask = _stratified_holdout_mask(
+            observed_mask, fraction, random_state)
+    elif stratify == "rows":
+        holdout_mask = _stratified_holdout_mask(
+            observed_mask.T, fraction, random_state).T
+    else:
+        raise ValueError("Invalid stratification: '%s'" % (stratify,))
+    # give back one hidden entry to rows and columns which would otherwise
+    # lose all of their observed entries
+    remaining = (observed_mask & ~holdout_mask).sum(axis=1)
+    for row_idx in np.flatnonzero(
+            (remaining == 0) & observed_mask.any(axis=1)):
+        col_idx = np.flatnonzero(holdout_mask[row_idx])[0]
+        holdout_mask[row_idx, col_idx] = False
+    remaining = (observed_mask & ~holdout_mask).sum(axis=0)
+    for col_idx in np.flatnonzero(
+            (remaining == 0) & observed_mask.any(axis=0)):
+        row_idx = np.flatnonzero(holdout_mask[:, col_idx])[0]
+        holdout_mask[row_idx, col_idx] = False
+    return holdout_mask
+
+
+def evaluate_configuration(
+        solver_class,
+        parameters,
+        X_train,
+        X_original,
+        holdout_mask,
+        metric="mse"):
+    """
+    Complete X_train with solver_class(**parameters) and return the error
+    of the completion on the held out entries of X_original. Errors raised
+    by the solver give an infinite score.
+
+    Returns a tuple of the score and a description of any error (or None).
+    """
+    try:
+        X_completed = solver_class(**parameters).complete(X_train)
+    except Exception as e:
+        return np.inf, "%s: %s" % (e.__class__.__name__, e)
+    score = METRICS[metric](
+        X_true=X_original,
+        X_pred=X_completed,
+        mask=holdout_mask)
+    if not np.isfinite(score):
+        return np.inf, "Non-finite score"
+    return float(score), None
+
+
+def _evaluate_parameters(
+        parameters,
+        solver_class,
+        X_train,
+        X_original,
+        holdout_mask,
+        metric):
+    return evaluate_configuration(
+        solver_class,
+        parameters,
+        X_train,
+        X_original,
+        holdout_mask,
+        metric=metric)
+
+
+def search_hyperparameters(
+        solver_class,
+        configurations,
+        X,
+        fixed_parameters=None,
+        holdout_fraction=0.1,
+        stratify=None,
+        metric="mse",
+        successive_halving=False,
+        budget_parameter="max_iters",
+        min_budget=10,
+        max_budget=100,
+        halving_factor=3,
+        n_jobs=1,
+        random_seed=0,
+        verbose=True):
+    """
+    Find the configuration of solver_class which best predicts a held out
+    subset of the observed entries of X.
+
+    Parameters
+    ----------
+    solver_class : class
+        Solver to tune, e.g. SoftImpute.
+
+    configurations : list of dict or dict
+        Candidate keyword arguments of solver_class, or a dictionary
+        mapping each parameter to its candidate values (see
+        parameter_grid).
+
+    X : np.ndarray
+        Incomplete matrix with NaN for missing values.
+
+    fixed_parameters : dict, optional
+        Keyword arguments shared by every configuration, e.g.
+        {"verbose": False}.
+
+    holdout_fraction : float
+        Fraction of the observed entries to hide and score on.
+
+    stratify : str, optional
+        See create_holdout_mask.
+
+    metric : str
+        "mse" or "mae" on the held out entries.
+
+    successive_halving : bool
+        Instead of running every configuration to completion, run them all
+        with budget_parameter set to min_budget, keep the best
+        1 / halving_factor of them, multiply the budget by halving_factor
+        and repeat until a single configuration is left or the budget
+        reaches max_budget.
+
+    budget_parameter : str
+        Keyword argument limiting the work of solver_class, such as
+        "max_iters" for SoftImpute and IterativeSVD.
+
+    min_budget : int
+
+    max_budget : int
+
+    halving_factor : int
+
+    n_jobs : int
+        Number of worker processes to evaluate configurations in.
+
+    random_seed : int
+        Seed for choosing the held out entries.
+
+    verbose : bool
+
+    Returns the best configuration (without the fixed parameters) and a
+    list with a dictionary for every evaluation, holding its "parameters",
+    "score", "budget" (None without successive halving) and "error".
+    """
+    if metric not in METRICS:
+        raise ValueError("Invalid metric: '%s'" % (metric,))
+    if isinstance(configurations, dict):
+        configurations = parameter_grid(configurations)
+    configurations = list(configurations)
+    if len(configurations) == 0:
+        raise ValueError("No configurations to search")
+    if fixed_parameters is None:
+        fixed_parameters = {}
+    X_original = np.asarray(X)
+    holdout_mask = create_holdout_mask(
+        X_original,
+        fraction=holdout_fraction,
+        stratify=stratify,
+        random_seed=random_seed)
+    if not holdout_mask.any():
+        raise ValueError("No observed entries could be held out")
+    X_train = X_original.copy()
+    X_train[holdout_mask] = np.nan
+
+    if successive_halving:
+        budgets = []
+        budget = min_budget
+        while budget < max_budget:
+            budgets.append(budget)
+            budget *= halving_factor
+        budgets.append(max_budget)
+    else:
+        budgets = [None]
+
+    pool = None
+    if n_jobs > 1:
+        pool = WorkerPool(
+            n_jobs,
+            _evaluate_parameters,
+            shared_args=(
+                solver_class, X_train, X_original, holdout_mask, metric))
+    results = []
+    try:
+        candidates = configurations
+        for budget in budgets:
+            parameters_list = []
+            for configuration in candidates:
+                parameters = dict(fixed_parameters)
+                parameters.update(configuration)
+                if budget is not None:
+                    parameters[budget_parameter] = budget
+                parameters_list.append(parameters)
+            if pool is not None:
+                scores_and_errors = pool.map(parameters_list)
+            else:
+                scores_and_errors = [
+                    evaluate_configuration(
+                        solver_class,
+                        parameters,
+                        X_train,
+                        X_original,
+                        holdout_mask,
+                        metric=metric)
+                    for parameters in parameters_list
+                ]
+            round_results = []
+            for configuration, (score, error) in zip(
+                    candidates, scores_and_errors):
+                result = {
+                    "parameters": configuration,
+                    "score": score,
+                    "budget": budget,
+                    "error": error,
+                }
+                if verbose:
+                    print("[search_hyperparameters] %s%s: %s=%s%s" % (
+                        configuration,
+                        "" if budget is None else " (%s=%d)" % (
+                            budget_parameter, budget),
+                        metric,
+                        score,
+                        "" if error is None else " (%s)" % (error,)))
+                round_results.append(result)
+            results.extend(round_results)
+            order = np.argsort(
+                [result["score"] for result in round_results],
+                kind="mergesort")
+            ranked = [candidates[i] for i in order]
+            best_configuration = ranked[0]
+            best_score = round_results[order[0]]["score"]
+            if len(ranked) == 1:
+                # no point in giving a larger budget to the last survivor
+                break
+            candidates = ranked[:max(1, len(ranked) // halving_factor)]
+    finally:
+        if pool is not None:
+            pool.close()
+    if not np.isfinite(best_score):
+        raise ValueError("Every configuration failed, e.g. with %s" % (
+            results[-1]["error"],))
+    return best_configuration, results
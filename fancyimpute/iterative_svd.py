@@ -12,11 +12,87 @@
 
 from __future__ import absolute_import, print_function, division
 
-from sklearn.decomposition import TruncatedSVD
+from time import time
+
+from scipy.sparse import issparse
+from scipy.sparse.linalg import svds
+from six.moves import range
+from sklearn.utils.extmath import randomized_svd
 import numpy as np
 
 from .solver import Solver
-from .common import masked_mae
+from .common import (
+    create_output_array,
+    load_input_array,
+    masked_changes_per_matrix,
+)
+from .convergence import ConvergenceMonitor
+from .rank_estimation import estimate_rank_and_shrinkage
+
+# extra dimensions of the random subspace used to find the top singular
+# vectors when streaming over row chunks
+N_OVERSAMPLES = 10
+
+
+class TruncatedSVDWorkspace(object):
+    """
+    Computes the truncated SVDs of a sequence of matrices of the same shape
+    which change little from one to the next, such as the successive fills
+    of IterativeSVD.
+
+    Rather than starting from scratch like a new TruncatedSVD on every
+    call, ARPACK is restarted from the previous leading singular subspace
+    (its v0 is the sum of the previous singular vectors weighted by their
+    singular values).
+
+    Parameters
+    ----------
+    dtype : dtype
+
+    algorithm : str
+        "arpack" or "randomized", as for TruncatedSVD. Randomized SVDs
+        can't be warm started.
+    """
+
+    def __init__(self, dtype, algorithm="arpack"):
+        if algorithm not in ("arpack", "randomized"):
+            raise ValueError("Invalid SVD algorithm: '%s'" % (algorithm,))
+        self.dtype = dtype
+        self.algorithm = algorithm
+        self.components = None
+        self._v0 = None
+
+    def _arpack_svd(self, X, rank):
+        if self._v0 is None:
+            # same initialization as TruncatedSVD, in the workspace's dtype
+            # so that float32 runs stay in single precision
+            self._v0 = np.random.uniform(-1, 1, min(X.shape)).astype(
+                self.dtype)
+        (U, s, V) = svds(X, k=rank, tol=0.0, v0=self._v0)
+        # ARPACK returns the singular values in ascending order
+        order = np.argsort(s)[::-1]
+        (U, s, V) = (U[:, order], s[order], V[order])
+        # ARPACK iterates on the Gram matrix of the smaller dimension
+        if X.shape[0] >= X.shape[1]:
+            self._v0 = np.dot(s, V)
+        else:
+            self._v0 = np.dot(U, s)
+        return (U, s, V)
+
+    def factorize(self, X, rank):
+        """
+        Returns the factors of the best rank approximation of X as arrays
+        of shape (n_rows, rank) and (n_cols, rank) whose product is the
+        approximation. Its principal axes are kept as the rows of
+        components.
+        """
+        if self.algorithm == "arpack":
+            (U, s, V) = self._arpack_svd(X, rank)
+        else:
+            (U, s, V) = randomized_svd(X, rank, n_iter=5)
+        self.components = V
+        U *= s
+        return U, V.T
 
 
 class IterativeSVD(Solver):
@@ -30,55 +106,363 @@ class IterativeSVD(Solver):
             init_fill_method="zero",
             min_value=None,
             max_value=None,
-            verbose=True):
+            verbose=True,
+            dtype=None,
+            callbacks=None,
+            n_metric_samples=10000,
+            full_metrics_every=None,
+            row_chunk_size=None,
+            n_power_iterations=2,
+            random_seed=0):
+        """
+        Parameters
+        ----------
+        rank : int or str
+            Rank of the SVD approximation, or "auto" to estimate it from the
+            spectrum of the incomplete matrix (see
+            fancyimpute.rank_estimation). Estimating the rank isn't
+            supported by complete_batch or with row_chunk_size.
+
+        convergence_threshold : float
+            Stop once the squared change of the missing values relative to
+            their squared norm drops below this.
+
+        max_iters : int
+
+        gradual_rank_increase : bool
+            Double the rank on every iteration until it reaches rank.
+
+        svd_algorithm : str
+            "arpack" or "randomized", see TruncatedSVDWorkspace.
+
+        init_fill_method : str
+            See Solver.fill, only "zero" and "mean" are supported with
+            row_chunk_size.
+
+        min_value : float
+
+        max_value : float
+
+        verbose : bool
+
+        dtype : dtype, optional
+            Floating point type to compute in, e.g. "float32"
+
+        callbacks : list, optional
+            Functions called with a dictionary describing each iteration,
+            see fancyimpute.callbacks.
+
+        n_metric_samples : int, optional
+            See SoftImpute.
+
+        full_metrics_every : int, optional
+            See SoftImpute.
+
+        row_chunk_size : int, optional
+            Stream the matrix through memory this many rows at a time, see
+            complete_in_row_chunks. Combined with a memory-mapped input and
+            out array only a chunk of rows and a few arrays of size
+            rank x n_cols are held in memory.
+
+        n_power_iterations : int
+            Power iterations of the randomized range finder used with
+            row_chunk_size, each one is a pass over the data.
+
+        random_seed : int
+            Seed of the randomized range finder used with row_chunk_size.
+        """
         Solver.__init__(
             self,
             fill_method=init_fill_method,
             min_value=min_value,
-            max_value=max_value)
+            max_value=max_value,
+            dtype=dtype,
+            callbacks=callbacks)
         self.rank = rank
         self.max_iters = max_iters
         self.svd_algorithm = svd_algorithm
         self.convergence_threshold = convergence_threshold
         self.gradual_rank_increase = gradual_rank_increase
         self.verbose = verbose
+        self.n_metric_samples = n_metric_samples
+        self.full_metrics_every = full_metrics_every
+        self.row_chunk_size = row_chunk_size
+        self.n_power_iterations = n_power_iterations
+        self.random_seed = random_seed
 
-    def _converged(self, X_old, X_new, missing_mask):
-        # check for convergence
-        old_missing_values = X_old[missing_mask]
-        new_missing_values = X_new[missing_mask]
-        difference = old_missing_values - new_missing_values
-        ssd = np.sum(difference ** 2)
-        old_norm_squared = (old_missing_values ** 2).sum()
-        return (ssd / old_norm_squared) < self.convergence_threshold
+    def _converged_batch(self, X_old, X_new, missing_mask):
+        ssd, old_norm_squared = masked_changes_per_matrix(
+            X_old, X_new, missing_mask)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return (ssd / old_norm_squared) < self.convergence_threshold
+
+    def _fixed_rank(self):
+        if self.rank == "auto":
+            raise ValueError(
+                "rank='auto' is only supported when completing one matrix "
+                "in memory")
+        return self.rank
+
+    def _rank_at_iteration(self, i, rank):
+        # deviation from original svdImpute algorithm:
+        # gradually increase the rank of our approximation
+        if self.gradual_rank_increase:
+            return min(2 ** i, rank)
+        else:
+            return rank
 
     def solve(self, X, missing_mask):
-        observed_mask = ~missing_mask
         X_filled = X
+        if self.rank == "auto":
+            rank, _ = estimate_rank_and_shrinkage(X_filled, missing_mask)
+            if self.verbose:
+                print("[IterativeSVD] Estimated rank=%d" % (rank,))
+        else:
+            rank = self.rank
+        monitor = ConvergenceMonitor(
+            X_filled,
+            missing_mask,
+            sample_size=self.n_metric_samples,
+            full_metrics_every=self.full_metrics_every)
+        workspace = TruncatedSVDWorkspace(
+            X_filled.dtype, algorithm=self.svd_algorithm)
+        for i in range(self.max_iters):
+            start_t = time()
+            curr_rank = self._rank_at_iteration(i, rank)
+            row_factors, column_factors = workspace.factorize(
+                X_filled, curr_rank)
+            svd_time = time() - start_t
+            delta = monitor.update_from_factors(
+                row_factors, column_factors, clip=self.clip)
+            converged = delta < self.convergence_threshold
+            mae = None
+            if self.verbose or self.callbacks:
+                mae = monitor.observed_mae_from_factors(
+                    row_factors, column_factors, clip=self.clip)
+            if self.verbose:
+                print(
+                    "[IterativeSVD] Iter %d: observed MAE=%0.6f" % (
+                        i + 1, mae))
+            self._notify_callbacks(
+                iteration=i + 1,
+                elapsed_time=time() - start_t,
+                svd_time=svd_time,
+                rank=curr_rank,
+                convergence_delta=delta,
+                observed_mae=mae,
+                observed_mae_sampled=not monitor.uses_full_metrics())
+            if converged:
+                break
+        # new rows are folded in by least squares on the principal axes
+        self.column_factors = workspace.components.T
+        self.fold_in_regularization = 0.0
+        return X_filled
+
+    def solve_batch(self, X, missing_mask):
+        """
+        Runs the IterativeSVD iterations on a whole stack of matrices, using
+        a batched full SVD truncated to the current rank in place of
+        TruncatedSVD. Every matrix stops being updated once it has
+        converged.
+        """
+        X_filled = X
+        n_matrices = len(X_filled)
+        rank = self._fixed_rank()
+        # matrices without missing values are already complete
+        active = missing_mask.any(axis=(1, 2))
         for i in range(self.max_iters):
-            # deviation from original svdImpute algorithm:
-            # gradually increase the rank of our approximation
-            if self.gradual_rank_increase:
-                curr_rank = min(2 ** i, self.rank)
-            else:
-                curr_rank = self.rank
-            tsvd = TruncatedSVD(curr_rank, algorithm=self.svd_algorithm)
-            X_reduced = tsvd.fit_transform(X_filled)
-            X_reconstructed = tsvd.inverse_transform(X_reduced)
+            active_indices = np.flatnonzero(active)
+            if len(active_indices) == 0:
+                break
+            start_t = time()
+            curr_rank = self._rank_at_iteration(i, rank)
+            X_active = X_filled[active_indices]
+            active_missing_mask = missing_mask[active_indices]
+            (U, s, V) = np.linalg.svd(
+                X_active, full_matrices=False, compute_uv=True)
+            svd_time = time() - start_t
+            X_reconstructed = np.matmul(
+                U[:, :, :curr_rank] * s[:, np.newaxis, :curr_rank],
+                V[:, :curr_rank])
             X_reconstructed = self.clip(X_reconstructed)
-            mae = masked_mae(
-                X_true=X,
-                X_pred=X_reconstructed,
-                mask=observed_mask)
+            converged = self._converged_batch(
+                X_old=X_active,
+                X_new=X_reconstructed,
+                missing_mask=active_missing_mask)
+            np.copyto(X_active, X_reconstructed, where=active_missing_mask)
+            X_filled[active_indices] = X_active
+            active[active_indices[converged]] = False
+            n_converged = n_matrices - active.sum()
+            if self.verbose:
+                print(
+                    "[IterativeSVD] Iter %d: %d of %d matrices converged" % (
+                        i + 1,
+                        n_converged,
+                        n_matrices))
+            self._notify_callbacks(
+                iteration=i + 1,
+                elapsed_time=time() - start_t,
+                svd_time=svd_time,
+                rank=curr_rank,
+                n_converged=n_converged)
+        return X_filled
+
+    def _row_chunks(self, n_rows):
+        chunk_size = max(1, self.row_chunk_size)
+        return [
+            (row_start, min(row_start + chunk_size, n_rows))
+            for row_start in range(0, n_rows, chunk_size)
+        ]
+
+    def _top_right_singular_vectors(self, X, row_chunks, rank, V_init):
+        """
+        Randomized range finder over the row chunks of X: power iterations
+        with X'X starting from V_init (the previous iteration's singular
+        vectors) padded with random directions, then a Rayleigh-Ritz step.
+        Makes n_power_iterations + 1 passes over X and only ever holds one
+        chunk and arrays of size n_cols x (rank + N_OVERSAMPLES).
+
+        Returns the top rank right singular vectors as an n_cols x rank
+        array.
+        """
+        n_cols = X.shape[1]
+        n_components = min(n_cols, rank + N_OVERSAMPLES)
+        random_state = np.random.RandomState(self.random_seed)
+        Q = random_state.randn(n_cols, n_components).astype(X.dtype)
+        if V_init is not None:
+            n_init = min(V_init.shape[1], n_components)
+            Q[:, :n_init] = V_init[:, :n_init]
+        Q, _ = np.linalg.qr(Q)
+        for _ in range(self.n_power_iterations):
+            Z = np.zeros_like(Q)
+            for (row_start, row_end) in row_chunks:
+                X_chunk = np.asarray(X[row_start:row_end])
+                Z += np.dot(X_chunk.T, np.dot(X_chunk, Q))
+            Q, _ = np.linalg.qr(Z)
+        # the eigenvectors of Q'X'XQ rotate Q onto the right singular
+        # vectors of XQ
+        gram = np.zeros((n_components, n_components), dtype=X.dtype)
+        for (row_start, row_end) in row_chunks:
+            XQ_chunk = np.dot(np.asarray(X[row_start:row_end]), Q)
+            gram += np.dot(XQ_chunk.T, XQ_chunk)
+        _, W = np.linalg.eigh(gram)
+        # eigenvalues come in ascending order
+        return np.dot(Q, W[:, ::-1][:, :rank])
+
+    def complete_in_row_chunks(self, X, out=None):
+        """
+        Complete X without ever loading all of it into memory. Every pass
+        over the data reads one chunk of row_chunk_size rows at a time: the
+        initial fill, the n_power_iterations + 1 passes of a randomized
+        range finder on each iteration, and a final pass per iteration which
+        projects each chunk onto the top singular vectors and writes the new
+        estimates of its missing values back into out. The missing entries
+        of each chunk are found again from the NaNs of X, so no mask of the
+        whole matrix is kept either.
+
+        Parameters
+        ----------
+        X : np.ndarray or str
+            Incomplete matrix, typically a np.memmap or the path of a .npy
+            file to memory-map.
+
+        out : np.ndarray or str, optional
+            Array (typically a np.memmap) or path of a .npy file to create,
+            which is used as the working copy of the matrix and holds the
+            result.
+        """
+        rank = self._fixed_rank()
+        X_original = load_input_array(X)
+        if issparse(X_original):
+            raise ValueError(
+                "Sparse input isn't supported with row_chunk_size")
+        self._check_input(X_original)
+        if self.normalizer is not None:
+            raise ValueError("Normalizers aren't supported with row_chunk_size")
+        if self.fill_method not in ("zero", "mean"):
+            raise ValueError(
+                "Invalid fill method with row_chunk_size: '%s'" % (
+                    self.fill_method,))
+        n_rows, n_cols = X_original.shape
+        dtype = self._input_dtype(X_original)
+        X_filled = create_output_array(out, X_original.shape, dtype)
+        row_chunks = self._row_chunks(n_rows)
+
+        def original_chunk(row_start, row_end):
+            # copied, since the chunk gets filled in place
+            X_chunk = np.array(X_original[row_start:row_end], dtype=dtype)
+            return X_chunk, np.isnan(X_chunk)
+
+        n_missing = 0
+        column_sums = np.zeros(n_cols, dtype=dtype)
+        column_counts = np.zeros(n_cols, dtype=int)
+        for (row_start, row_end) in row_chunks:
+            X_chunk, missing_chunk = original_chunk(row_start, row_end)
+            n_missing += missing_chunk.sum()
+            column_sums += np.where(missing_chunk, 0, X_chunk).sum(axis=0)
+            column_counts += (~missing_chunk).sum(axis=0)
+        if n_missing == 0:
+            raise ValueError("Input matrix is not missing any values")
+        if n_missing == X_original.size:
+            raise ValueError("Input matrix must have some non-missing values")
+        if self.fill_method == "mean":
+            with np.errstate(divide="ignore", invalid="ignore"):
+                fill_values = column_sums / column_counts
+        else:
+            fill_values = np.zeros(n_cols, dtype=dtype)
+        for (row_start, row_end) in row_chunks:
+            X_chunk, missing_chunk = original_chunk(row_start, row_end)
+            self._fill_columns_with_values(
+                X_chunk, missing_chunk, fill_values)
+            X_filled[row_start:row_end] = X_chunk
+
+        V = None
+        for i in range(self.max_iters):
+            start_t = time()
+            curr_rank = self._rank_at_iteration(i, rank)
+            V = self._top_right_singular_vectors(
+                X_filled, row_chunks, curr_rank, V)
+            svd_time = time() - start_t
+            ssd = 0.0
+            old_norm_squared = 0.0
+            absolute_error_sum = 0.0
+            for (row_start, row_end) in row_chunks:
+                _, missing_chunk = original_chunk(row_start, row_end)
+                X_chunk = np.array(X_filled[row_start:row_end])
+                X_reconstructed = self.clip(
+                    np.dot(np.dot(X_chunk, V), V.T))
+                old_missing_values = X_chunk[missing_chunk]
+                new_missing_values = X_reconstructed[missing_chunk]
+                difference = old_missing_values - new_missing_values
+                ssd += np.dot(difference, difference)
+                old_norm_squared += np.dot(
+                    old_missing_values, old_missing_values)
+                absolute_error_sum += np.abs(
+                    X_chunk - X_reconstructed)[~missing_chunk].sum()
+                X_chunk[missing_chunk] = new_missing_values
+                X_filled[row_start:row_end] = X_chunk
+            with np.errstate(divide="ignore", invalid="ignore"):
+                delta = ssd / old_norm_squared
+            mae = absolute_error_sum / (X_original.size - n_missing)
             if self.verbose:
                 print(
                     "[IterativeSVD] Iter %d: observed MAE=%0.6f" % (
                         i + 1, mae))
-            converged = self._converged(
-                X_old=X_filled,
-                X_new=X_reconstructed,
-                missing_mask=missing_mask)
-            X_filled[missing_mask] = X_reconstructed[missing_mask]
-            if converged:
+            self._notify_callbacks(
+                iteration=i + 1,
+                elapsed_time=time() - start_t,
+                svd_time=svd_time,
+                rank=curr_rank,
+                convergence_delta=delta,
+                observed_mae=mae,
+                observed_mae_sampled=False)
+            if delta < self.convergence_threshold:
                 break
+        self.column_factors = V
+        self.fold_in_regularization = 0.0
         return X_filled
+
+    def single_imputation(self, X, out=None):
+        if self.row_chunk_size:
+            return self.complete_in_row_chunks(X, out=out)
+        return Solver.single_imputation(self, X, out=out)
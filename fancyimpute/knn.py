@@ -12,11 +12,86 @@
 
 from __future__ import absolute_import, print_function, division
 import numpy as np
+from six.moves import range
 
 from knnimpute import knn_impute_few_observed, knn_impute_with_argpartition
 
 from .solver import Solver
 
+
+def normalized_distances_to_reference(
+        X,
+        missing_mask,
+        X_reference,
+        reference_missing_mask):
+    """
+    Mean squared difference between each row of X and each row of
+    X_reference over the columns which both have observed, infinite for
+    pairs of rows without any such columns. Same distance as
+    knnimpute.all_pairs_normalized_distances but between two different sets
+    of rows, computed with matrix products instead of a loop over rows.
+    """
+    observed = (~missing_mask).astype(X.dtype)
+    reference_observed = (~reference_missing_mask).astype(X.dtype)
+    X_zeroed = np.where(missing_mask, 0, X)
+    reference_zeroed = np.where(reference_missing_mask, 0, X_reference)
+    # sum over shared columns of (x - r)^2 = x^2 + r^2 - 2xr
+    ssd = np.dot(X_zeroed ** 2, reference_observed.T)
+    ssd += np.dot(observed, (reference_zeroed ** 2).T)
+    ssd -= 2 * np.dot(X_zeroed, reference_zeroed.T)
+    np.maximum(ssd, 0, out=ssd)
+    n_shared = np.dot(observed, reference_observed.T)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        D = ssd / n_shared
+    D[n_shared == 0] = np.inf
+    return D
+
+
+def knn_impute_new_rows(
+        X,
+        missing_mask,
+        X_reference,
+        reference_missing_mask,
+        k,
+        min_dist=1e-6,
+        max_dist_multiplier=1e6):
+    """
+    Impute the missing entries of each row of X from its k nearest rows in
+    X_reference which have the column observed, weighted by inverse
+    distance in the same way as knnimpute.knn_impute_few_observed.
+
+    Missing values without any neighbors which have them observed are
+    left as NaN.
+    """
+    D = normalized_distances_to_reference(
+        X, missing_mask, X_reference, reference_missing_mask)
+    D_finite = D[np.isfinite(D)]
+    max_dist = max_dist_multiplier * max(
+        1, D_finite.max() if len(D_finite) > 0 else 1)
+    valid_distances_per_row = (D < max_dist).sum(axis=1)
+    np.clip(D, min_dist, max_dist, out=D)
+    inv_D = 1.0 / D
+    D_sorted = np.argsort(D, axis=1)
+    reference_observed_column_major = np.asarray(
+        ~reference_missing_mask, order="F")
+    reference_column_major = np.asarray(X_reference, order="F")
+    X_result = np.array(X, order="C")
+    X_result[missing_mask] = np.nan
+    for i in range(X.shape[0]):
+        candidate_neighbor_indices = D_sorted[i, :valid_distances_per_row[i]]
+        row_weights = inv_D[i]
+        for j in np.flatnonzero(missing_mask[i]):
+            observed = reference_observed_column_major[:, j]
+            k_nearest_indices = candidate_neighbor_indices[
+                observed[candidate_neighbor_indices]][:k]
+            weights = row_weights[k_nearest_indices]
+            weight_sum = weights.sum()
+            if weight_sum > 0:
+                values = reference_column_major[k_nearest_indices, j]
+                X_result[i, j] = np.dot(values, weights) / weight_sum
+    return X_result
+
+
 class KNN(Solver):
     """
     k-Nearest Neighbors imputation for arrays with missing data.
@@ -39,7 +114,8 @@ class KNN(Solver):
             min_value=None,
             max_value=None,
             normalizer=None,
-            verbose=True):
+            verbose=True,
+            dtype=None):
         """
         Parameters
         ----------
@@ -67,20 +143,21 @@ class KNN(Solver):
             Any object (such as BiScaler) with fit() and transform() methods
 
         verbose : bool
+
+        dtype : dtype, optional
+            Floating point type to compute in, e.g. "float32"
         """
         Solver.__init__(
             self,
             min_value=min_value,
             max_value=max_value,
-            normalizer=normalizer)
+            normalizer=normalizer,
+            dtype=dtype)
         self.k = k
         self.verbose = verbose
         self.orientation = orientation
         self.print_interval = print_interval
-        if use_argpartition:
-            self._impute_fn = knn_impute_with_argpartition
-        else:
-            self._impute_fn = knn_impute_few_observed
+        self.use_argpartition = use_argpartition
 
     def solve(self, X, missing_mask):
         if self.orientation == "columns":
@@ -92,7 +169,11 @@ class KNN(Solver):
                 "Orientation must be either 'rows' or 'columns', got: %s" % (
                     self.orientation,))
 
-        X_imputed = self._impute_fn(
+        if self.use_argpartition:
+            impute_fn = knn_impute_with_argpartition
+        else:
+            impute_fn = knn_impute_few_observed
+        X_imputed = impute_fn(
             X=X,
             missing_mask=missing_mask,
             k=self.k,
@@ -111,3 +192,52 @@ class KNN(Solver):
             X_imputed = X_imputed.T
 
         return X_imputed
+
+    def fit_transform(self, X):
+        """
+        Complete X and keep it (with its missing values) as the reference
+        rows which new rows are matched against by transform.
+        """
+        if self.orientation != "rows":
+            raise ValueError(
+                "Only orientation='rows' supports imputing new rows")
+        X_result = self.complete(X)
+        X_reference, reference_missing_mask = self.prepare_input_data(X)
+        if self.normalizer is not None:
+            X_reference = self.normalizer.transform(X_reference)
+        self.reference_matrix = np.array(X_reference)
+        self.reference_missing_mask = reference_missing_mask
+        return X_result
+
+    def transform(self, X):
+        """
+        Impute the missing entries of new rows from their nearest neighbors
+        among the rows given to fit.
+        """
+        if getattr(self, "reference_matrix", None) is None:
+            raise ValueError("%s must be fit before calling transform" % (
+                self.__class__.__name__,))
+        X_original = self._convert_input(X)
+        missing_mask = np.isnan(X_original)
+        X = X_original
+        normalizer = None
+        if self.normalizer is not None:
+            normalizer = self.normalizer.fit_new_rows(X)
+            X = normalizer.transform(X)
+        X_result = knn_impute_new_rows(
+            X,
+            missing_mask,
+            self.reference_matrix,
+            self.reference_missing_mask,
+            k=self.k)
+        failed_to_impute = np.isnan(X_result)
+        if failed_to_impute.any():
+            print("[KNN] Warning: %d/%d still missing after imputation, replacing with 0" % (
+                failed_to_impute.sum(),
+                X_result.size))
+            X_result[failed_to_impute] = 0
+        if normalizer is not None:
+            X_result = normalizer.inverse_transform(X_result, inplace=True)
+        X_result = self.clip(X_result)
+        np.copyto(X_result, X_original, where=~missing_mask)
+        return X_result
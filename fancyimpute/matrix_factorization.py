@@ -97,4 +97,8 @@ class MatrixFactorization(Solver):
 
         U_value = U.get_value()
         V_value = V.get_value()
+        # new rows are folded in by least squares on V, without the
+        # sparsity penalty which was applied to U
+        self.column_factors = V_value.T
+        self.fold_in_regularization = 0.0
         return np.dot(U_value, V_value)
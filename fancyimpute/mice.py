@@ -18,6 +18,7 @@ from six.moves import range
 import numpy as np
 
 from .bayesian_ridge_regression import BayesianRidgeRegression
+from .common import create_output_array
 from .solver import Solver
 
 
@@ -71,6 +72,13 @@ class MICE(Solver):
             Maximum possible imputed value
 
         verbose : boolean
+
+        dtype : dtype, optional
+            Floating point type to compute in, e.g. "float32"
+
+        callbacks : list, optional
+            Functions called with a dictionary describing each imputation
+            round, see fancyimpute.callbacks.
     """
 
     def __init__(
@@ -85,7 +93,9 @@ class MICE(Solver):
             init_fill_method="mean",
             min_value=None,
             max_value=None,
-            verbose=True):
+            verbose=True,
+            dtype=None,
+            callbacks=None):
         """
         Parameters
         ----------
@@ -125,13 +135,22 @@ class MICE(Solver):
             values of a column)
 
         verbose : boolean
+
+        dtype : dtype, optional
+            Floating point type to compute in, e.g. "float32"
+
+        callbacks : list, optional
+            Functions called with a dictionary describing each imputation
+            round, see fancyimpute.callbacks.
         """
         Solver.__init__(
             self,
             n_imputations=n_imputations,
             min_value=min_value,
             max_value=max_value,
-            fill_method=init_fill_method)
+            fill_method=init_fill_method,
+            dtype=dtype,
+            callbacks=callbacks)
         self.visit_sequence = visit_sequence
         self.n_burn_in = n_burn_in
         self.n_pmm_neighbors = n_pmm_neighbors
@@ -140,12 +159,34 @@ class MICE(Solver):
         self.n_nearest_columns = n_nearest_columns
         self.verbose = verbose
 
+    def _create_scratch_buffers(self, X_filled):
+        """
+        Allocate the predictor matrices which get reused for every column
+        update, so that an imputation round doesn't have to allocate a new
+        subset of X_filled for each column.
+
+        Returns two buffers:
+            - (n_rows, n_predictor_cols) Fortran-ordered array which holds
+              the predictor columns in their original row order
+            - flat array large enough to hold the observed and missing
+              predictor rows as two contiguous blocks
+        """
+        n_rows, n_cols = X_filled.shape
+        n_predictor_cols = int(min(n_cols - 1, self.n_nearest_columns))
+        X_other_cols = np.empty(
+            (n_rows, n_predictor_cols),
+            dtype=X_filled.dtype,
+            order="F")
+        flat_buffer = np.empty(n_rows * n_predictor_cols, dtype=X_filled.dtype)
+        return X_other_cols, flat_buffer
+
     def perform_imputation_round(
             self,
             X_filled,
             missing_mask,
             observed_mask,
-            visit_indices):
+            visit_indices,
+            scratch_buffers=None):
         """
         Does one entire round-robin set of updates.
         """
@@ -157,6 +198,11 @@ class MICE(Solver):
             correlation_matrix = np.corrcoef(X_filled, rowvar=0)
             abs_correlation_matrix = np.abs(correlation_matrix)
 
+        if scratch_buffers is None:
+            scratch_buffers = self._create_scratch_buffers(X_filled)
+        X_other_cols, flat_buffer = scratch_buffers
+        n_predictor_cols = X_other_cols.shape[1]
+
         n_missing_for_each_column = missing_mask.sum(axis=0)
         ordered_column_indices = np.arange(n_cols)
 
@@ -166,8 +212,13 @@ class MICE(Solver):
             n_missing_for_this_col = n_missing_for_each_column[col_idx]
             if n_missing_for_this_col > 0:  # if we have any missing data at all
                 observed_row_mask_for_this_col = observed_mask[:, col_idx]
+                observed_row_indices = np.flatnonzero(
+                    observed_row_mask_for_this_col)
+                missing_row_indices = np.flatnonzero(
+                    missing_row_mask_for_this_col)
+                n_observed_for_this_col = len(observed_row_indices)
                 column_values = X_filled[:, col_idx]
-                column_values_observed = column_values[observed_row_mask_for_this_col]
+                column_values_observed = column_values[observed_row_indices]
 
                 if n_cols <= self.n_nearest_columns:
                     other_column_indices = np.concatenate([
@@ -193,8 +244,37 @@ class MICE(Solver):
                         self.n_nearest_columns,
                         replace=False,
                         p=p)
-                X_other_cols = X_filled[:, other_column_indices]
-                X_other_cols_observed = X_other_cols[observed_row_mask_for_this_col]
+                # Gather the predictors into the preallocated buffers instead
+                # of fancy indexing, which would allocate fresh copies for
+                # every column. Transposing the Fortran-ordered arrays lets
+                # np.take work on C-contiguous data without copying it and
+                # mode="clip" keeps it from buffering the output.
+                np.take(
+                    X_filled.T,
+                    other_column_indices,
+                    axis=0,
+                    out=X_other_cols.T,
+                    mode="clip")
+                # carve the flat buffer into two contiguous Fortran-ordered
+                # blocks for the observed and missing rows of this column
+                split_point = n_observed_for_this_col * n_predictor_cols
+                X_other_cols_observed = flat_buffer[:split_point].reshape(
+                    (n_observed_for_this_col, n_predictor_cols), order="F")
+                X_other_cols_missing = flat_buffer[
+                    split_point:n_rows * n_predictor_cols].reshape(
+                        (n_missing_for_this_col, n_predictor_cols), order="F")
+                np.take(
+                    X_other_cols.T,
+                    observed_row_indices,
+                    axis=1,
+                    out=X_other_cols_observed.T,
+                    mode="clip")
+                np.take(
+                    X_other_cols.T,
+                    missing_row_indices,
+                    axis=1,
+                    out=X_other_cols_missing.T,
+                    mode="clip")
                 brr = self.model
                 brr.fit(
                     X_other_cols_observed,
@@ -204,13 +284,11 @@ class MICE(Solver):
                 # Now we choose the row method (PMM) or the column method.
                 if self.impute_type == 'pmm':  # this is the PMM procedure
                     # predict values for missing values using random beta draw
-                    X_missing = X_filled[
-                        np.ix_(missing_row_mask_for_this_col, other_column_indices)]
-                    col_preds_missing = brr.predict(X_missing, random_draw=True)
+                    col_preds_missing = brr.predict(
+                        X_other_cols_missing, random_draw=True)
                     # predict values for observed values using best estimated beta
-                    X_observed = X_filled[
-                        np.ix_(observed_row_mask_for_this_col, other_column_indices)]
-                    col_preds_observed = brr.predict(X_observed, random_draw=False)
+                    col_preds_observed = brr.predict(
+                        X_other_cols_observed, random_draw=False)
                     # for each missing value, find its nearest neighbors in the observed values
                     D = np.abs(col_preds_missing[:, np.newaxis] - col_preds_observed)  # distances
                     # take top k neighbors
@@ -224,7 +302,6 @@ class MICE(Solver):
                     # neighbor in the output space
                     imputed_values = column_values_observed[imputed_indices]
                 elif self.impute_type == 'col':
-                    X_other_cols_missing = X_other_cols[missing_row_mask_for_this_col]
                     # predict values for missing values using posterior predictive draws
                     # see the end of this:
                     # https://www.cs.utah.edu/~fletcher/cs6957/lectures/BayesianLinearRegression.pdf
@@ -232,9 +309,10 @@ class MICE(Solver):
                     # inplace sqrt of sigma_squared
                     sigmas = sigmas_squared
                     np.sqrt(sigmas_squared, out=sigmas)
-                    imputed_values = np.random.normal(mus, sigmas)
+                    imputed_values = np.random.normal(mus, sigmas).astype(
+                        X_filled.dtype, copy=False)
                 imputed_values = self.clip(imputed_values)
-                X_filled[missing_row_mask_for_this_col, col_idx] = imputed_values
+                X_filled[missing_row_indices, col_idx] = imputed_values
         return X_filled
 
     def initialize(self, X, missing_mask, observed_mask, visit_indices):
@@ -281,19 +359,21 @@ class MICE(Solver):
         else:
             raise ValueError("Invalid choice for visit order: %s" % self.visit_sequence)
 
-    def multiple_imputations(self, X):
+    def multiple_imputations(self, X, missing_mask=None):
         """
         Expects 2d float matrix with NaN entries signifying missing values
 
+        If missing_mask is given then X is taken to be already prepared by
+        prepare_input_data (with missing_mask its NaN entries) and isn't
+        checked again.
+
         Returns a sequence of arrays of the imputed missing values
         of length self.n_imputations, and a mask that specifies where these values
         belong in X.
         """
         start_t = time()
-        X = np.asarray(X)
-        self._check_input(X)
-        missing_mask = np.isnan(X)
-        self._check_missing_value_mask(missing_mask)
+        if missing_mask is None:
+            X, missing_mask = self.prepare_input_data(X)
 
         visit_indices = self.get_visit_indices(missing_mask)
         # since we're accessing the missing mask one column at a time,
@@ -309,9 +389,11 @@ class MICE(Solver):
 
         # now we jam up in the usual fashion for n_burn_in + n_imputations iterations
         results_list = []  # all of the imputed values, in a flattened format
+        scratch_buffers = self._create_scratch_buffers(X_filled)
         total_rounds = self.n_burn_in + self.n_imputations
 
         for m in range(total_rounds):
+            round_start_t = time()
             if self.verbose:
                 print(
                     "[MICE] Starting imputation round %d/%d, elapsed time %0.3f" % (
@@ -322,17 +404,135 @@ class MICE(Solver):
                 X_filled=X_filled,
                 missing_mask=missing_mask,
                 observed_mask=observed_mask,
-                visit_indices=visit_indices)
+                visit_indices=visit_indices,
+                scratch_buffers=scratch_buffers)
             if m >= self.n_burn_in:
                 results_list.append(X_filled[missing_mask])
+            self._notify_callbacks(
+                iteration=m + 1,
+                elapsed_time=time() - round_start_t)
         return np.array(results_list), missing_mask
 
-    def complete(self, X):
+    def complete(self, X, out=None):
+        """
+        Expects 2d float matrix with NaN entries signifying missing values,
+        a scipy.sparse matrix in which missing values aren't stored or the
+        path of a .npy file to memory-map.
+
+        If out is given (an array or a path at which to create a
+        memory-mapped .npy file) then the result is written into it.
+        """
+        X, missing_mask = self.prepare_input_data(X)
         if self.verbose:
             print("[MICE] Completing matrix with shape %s" % (X.shape,))
-        X_completed = np.array(X.copy())
-        imputed_arrays, missing_mask = self.multiple_imputations(X)
+        imputed_arrays, missing_mask = self.multiple_imputations(
+            X, missing_mask=missing_mask)
+        if out is None:
+            X_completed = X.copy()
+        else:
+            X_completed = create_output_array(out, X.shape, X.dtype)
+            X_completed[...] = X
         # average the imputed values for each feature
         average_imputated_values = imputed_arrays.mean(axis=0)
         X_completed[missing_mask] = average_imputated_values
         return X_completed
+
+    def fit_transform(self, X):
+        """
+        Complete X and then regress each column on the other columns of the
+        completed matrix, keeping the coefficients so that transform can
+        impute new rows with chained (posterior mean) predictions.
+        """
+        X_completed = self.complete(X)
+        X, missing_mask = self.prepare_input_data(X)
+        n_rows, n_cols = X_completed.shape
+        if self.fill_method == "median":
+            self.initial_fill_values = np.nanmedian(X, axis=0)
+        else:
+            self.initial_fill_values = np.nanmean(X, axis=0)
+        if n_cols > self.n_nearest_columns:
+            abs_correlation_matrix = np.abs(
+                np.corrcoef(X_completed, rowvar=0))
+        column_coefficients = np.zeros((n_cols, n_cols), dtype=X.dtype)
+        column_intercepts = np.zeros(n_cols, dtype=X.dtype)
+        ordered_column_indices = np.arange(n_cols)
+        for col_idx in range(n_cols):
+            other_column_indices = np.concatenate([
+                ordered_column_indices[:col_idx],
+                ordered_column_indices[col_idx + 1:]
+            ])
+            if n_cols > self.n_nearest_columns:
+                # keep the most correlated columns
+                order = np.argsort(
+                    -abs_correlation_matrix[col_idx, other_column_indices])
+                other_column_indices = np.sort(
+                    other_column_indices[order[:int(self.n_nearest_columns)]])
+            self.model.fit(
+                X_completed[:, other_column_indices],
+                X_completed[:, col_idx])
+            beta = self.model.beta_estimate
+            if getattr(self.model, "add_ones", False):
+                column_coefficients[other_column_indices, col_idx] = beta[:-1]
+                column_intercepts[col_idx] = beta[-1]
+            else:
+                column_coefficients[other_column_indices, col_idx] = beta
+        self.column_coefficients = column_coefficients
+        self.column_intercepts = column_intercepts
+        return X_completed
+
+    def transform(self, X, max_rounds=100, convergence_threshold=0.0001):
+        """
+        Impute the missing entries of new rows: start from the column fill
+        values of the training data and then, in each round, replace the
+        missing entries of each column with their predictions from the
+        other columns using the coefficients learned by fit.
+
+        The predictions are posterior means rather than samples, so unlike
+        complete there's nothing to average over: the rounds stop once the
+        imputed values settle.
+
+        Parameters
+        ----------
+        X : np.ndarray
+            New rows with NaN for missing values.
+
+        max_rounds : int
+            Largest number of rounds of chained predictions.
+
+        convergence_threshold : float
+            Stop once the norm of the change of the imputed values in a
+            round relative to their previous norm drops below this.
+        """
+        if getattr(self, "column_coefficients", None) is None:
+            raise ValueError("%s must be fit before calling transform" % (
+                self.__class__.__name__,))
+        X_original = self._convert_input(X)
+        missing_mask = np.isnan(X_original)
+        X_filled = np.array(X_original, order="F")
+        self._fill_columns_with_values(
+            X_filled, missing_mask, self.initial_fill_values)
+        visit_indices = [
+            col_idx
+            for col_idx in self.get_visit_indices(missing_mask)
+            if missing_mask[:, col_idx].any()
+        ]
+        missing_row_indices = [
+            np.flatnonzero(missing_mask[:, col_idx])
+            for col_idx in visit_indices
+        ]
+        for _ in range(max_rounds):
+            ssd = 0.0
+            old_norm_squared = 0.0
+            for col_idx, rows in zip(visit_indices, missing_row_indices):
+                predictions = np.dot(
+                    X_filled[rows],
+                    self.column_coefficients[:, col_idx])
+                predictions += self.column_intercepts[col_idx]
+                predictions = self.clip(predictions)
+                old_values = X_filled[rows, col_idx]
+                ssd += np.sum((old_values - predictions) ** 2)
+                old_norm_squared += np.sum(old_values ** 2)
+                X_filled[rows, col_idx] = predictions
+            if ssd <= convergence_threshold ** 2 * old_norm_squared:
+                break
+        return X_filled
@@ -0,0 +1,185 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Choose the rank of IterativeSVD and the shrinkage value of SoftImpute from
+a single randomized SVD of the incomplete matrix, rather than by completing
+it with every candidate value.
+
+The matrix is modeled as a low-rank matrix plus independent noise with
+every entry observed with the same probability p. Its columns are centered,
+its missing entries zeroed and it's divided by p so that its expectation is
+the centered matrix, then a randomized SVD gives its top singular values.
+
+The rank is chosen by the eigenvalue ratio criterion (Ahn and Horenstein,
+"Eigenvalue Ratio Test for the Number of Factors", 2013): the rank with the
+largest ratio between consecutive squared singular values, among those
+whose last singular value is above the Marchenko-Pastur bulk edge
+sigma * (sqrt(n_rows) + sqrt(n_cols)) of the remaining energy. The edge
+alone underestimates how far the noise's singular values reach, since
+the noise from zeroing the missing entries isn't independent across
+entries.
+
+The shrinkage value is the expected largest singular value of the noise
+on the observed entries, sigma_noise * sqrt(p) * (sqrt(n_rows) +
+sqrt(n_cols)). That is the smallest value which keeps SoftImpute from
+fitting pure noise. sigma_noise is estimated from the residuals of a
+rank-limited least-squares fit of the observed entries.
+"""
+
+from __future__ import absolute_import, print_function, division
+
+import numpy as np
+from six.moves import range
+from sklearn.utils.extmath import randomized_svd
+
+from .common import fold_in_rows, reconstruct_entries
+
+# tiny ridge penalty of the alternating least squares fit, only there to
+# keep rows and columns with few observed entries well-posed
+RIDGE_REGULARIZATION = 1e-6
+
+# smallest shrinkage value as a fraction of the largest singular value of
+# the observed entries
+MIN_RELATIVE_SHRINKAGE = 1e-3
+
+
+def _marchenko_pastur_edge(s, total_energy, rank, n_rows, n_cols):
+    """
+    Bulk edge of the singular values of a noise matrix whose variance is
+    the energy not explained by the top rank components.
+    """
+    residual_energy = max(total_energy - (s[:rank] ** 2).sum(), 0)
+    sigma = np.sqrt(residual_energy / (n_rows * n_cols))
+    return sigma * (np.sqrt(n_rows) + np.sqrt(n_cols))
+
+
+def _eigenvalue_ratio_rank(s, total_energy, n_rows, n_cols):
+    """
+    Rank at which the ratio between consecutive squared singular values is
+    largest, among the ranks whose last singular value is above the
+    Marchenko-Pastur edge of the remaining energy (or 1 if none are).
+    """
+    best_rank = 1
+    best_ratio = 0
+    for rank in range(1, len(s)):
+        if s[rank - 1] <= _marchenko_pastur_edge(
+                s, total_energy, rank, n_rows, n_cols):
+            break
+        ratio = (s[rank - 1] / max(s[rank], np.finfo(s.dtype).tiny)) ** 2
+        if ratio > best_ratio:
+            best_rank = rank
+            best_ratio = ratio
+    return best_rank
+
+
+def estimate_rank_and_shrinkage(
+        X,
+        missing_mask=None,
+        max_rank=50,
+        n_oversamples=20,
+        n_power_iterations=2,
+        n_residual_samples=100000,
+        random_seed=0):
+    """
+    Estimate the rank of the low-rank part of an incomplete matrix and a
+    shrinkage value for SoftImpute, see the module docstring.
+
+    Parameters
+    ----------
+    X : np.ndarray
+        Incomplete matrix, the values of its missing entries are ignored.
+
+    missing_mask : np.ndarray, optional
+        Boolean array indicating the missing entries of X, by default its
+        NaN entries.
+
+    max_rank : int
+        Largest rank to consider, the number of components of the
+        randomized SVD.
+
+    n_oversamples : int
+        Extra components of the randomized SVD, which make its top
+        max_rank singular values more accurate.
+
+    n_power_iterations : int
+        Power iterations of the randomized SVD.
+
+    n_residual_samples : int
+        Number of observed entries on which to estimate the noise level
+        left over by the low-rank part.
+
+    random_seed : int
+
+    Returns a tuple of the estimated rank (at least 1) and shrinkage value.
+    """
+    if missing_mask is None:
+        missing_mask = np.isnan(X)
+    observed_mask = ~missing_mask
+    n_rows, n_cols = X.shape
+    n_observed = observed_mask.sum()
+    if n_observed == 0:
+        raise ValueError("Input matrix must have some non-missing values")
+    observed_fraction = n_observed / X.size
+    X_observed = np.where(missing_mask, 0, X)
+    n_observed_per_column = np.maximum(observed_mask.sum(axis=0), 1)
+    column_means = X_observed.sum(axis=0) / n_observed_per_column
+    # centered and zero-filled, scaled so that its expectation is the
+    # centered matrix
+    Y = np.where(missing_mask, 0, X_observed - column_means)
+    Y /= observed_fraction
+    random_state = np.random.RandomState(random_seed)
+    # one extra component to compare the last candidate rank against
+    n_components = min(max_rank + 1, n_rows, n_cols)
+    U, s, V = randomized_svd(
+        Y,
+        n_components,
+        n_oversamples=n_oversamples,
+        n_iter=n_power_iterations,
+        random_state=random_state)
+    rank = _eigenvalue_ratio_rank(s, (Y ** 2).sum(), n_rows, n_cols)
+
+    # noise level of the observed entries around a low-rank fit, correcting
+    # for the degrees of freedom the fit used up. The column space of the
+    # randomized SVD is too rough under missingness and overestimates the
+    # noise, so one round of alternating least squares on the observed
+    # entries refines it: rows onto the estimated column space, then the
+    # columns onto those row factors and the rows once more.
+    row_factors = fold_in_rows(
+        Y, missing_mask, V[:rank].T, regularization=RIDGE_REGULARIZATION)
+    column_factors = fold_in_rows(
+        Y.T, missing_mask.T, row_factors, regularization=RIDGE_REGULARIZATION)
+    row_factors = fold_in_rows(
+        Y, missing_mask, column_factors, regularization=RIDGE_REGULARIZATION)
+    observed_rows, observed_cols = np.nonzero(observed_mask)
+    if n_observed > n_residual_samples:
+        sample = random_state.randint(0, n_observed, n_residual_samples)
+        observed_rows = observed_rows[sample]
+        observed_cols = observed_cols[sample]
+    residuals = (
+        Y[observed_rows, observed_cols] -
+        reconstruct_entries(
+            row_factors, column_factors, observed_rows, observed_cols))
+    # undo the scaling of Y
+    residuals *= observed_fraction
+    degrees_of_freedom = max(
+        n_observed - rank * (n_rows + n_cols - rank) - n_cols, 1)
+    noise_variance = (
+        np.mean(residuals ** 2) * n_observed / degrees_of_freedom)
+    shrinkage_value = (
+        np.sqrt(noise_variance * observed_fraction) *
+        (np.sqrt(n_rows) + np.sqrt(n_cols)))
+    # without any noise a little shrinkage still keeps SoftImpute stable
+    shrinkage_value = max(
+        shrinkage_value,
+        MIN_RELATIVE_SHRINKAGE * observed_fraction * s[0])
+    return rank, shrinkage_value
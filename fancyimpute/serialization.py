@@ -0,0 +1,190 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+On-disk format for fitted imputers which doesn't pickle any objects.
+
+A fitted model is saved as a directory holding a small JSON header and one
+uncompressed .npy file per array, so that loading can memory-map the
+arrays instead of reading them. The header describes each object by its
+class name and its attributes:
+
+    {
+        "format": "fancyimpute-fitted-model",
+        "version": 1,
+        "model": {
+            "class": "SoftImpute",
+            "attributes": {"max_iters": 100, ...},
+            "dtypes": {"dtype": "float32"},
+            "arrays": {"column_factors": "column_factors.npy"},
+            "objects": {"normalizer": {"class": "BiScaler", ...}}
+        }
+    }
+
+Attributes which are neither arrays, JSON scalars, dtypes nor instances of
+the classes in this package (such as functions) aren't saved and get their
+default values when the model is loaded. JSON has no infinite or NaN
+numbers, so those are saved as {"__float__": "inf"} (or "-inf", "nan").
+"""
+
+from __future__ import absolute_import, print_function, division
+import json
+from os import makedirs
+from os.path import exists, join
+
+import numpy as np
+from six import string_types
+
+from .bayesian_ridge_regression import BayesianRidgeRegression
+from .biscaler import BiScaler
+from .iterative_svd import IterativeSVD
+from .knn import KNN
+from .matrix_factorization import MatrixFactorization
+from .mice import MICE
+from .nuclear_norm_minimization import NuclearNormMinimization
+from .similarity_weighted_averaging import SimilarityWeightedAveraging
+from .simple_fill import SimpleFill
+from .soft_impute import SoftImpute
+from .stochastic_soft_impute import StochasticSoftImpute
+
+FORMAT_NAME = "fancyimpute-fitted-model"
+FORMAT_VERSION = 1
+HEADER_FILENAME = "header.json"
+
+SERIALIZABLE_CLASSES = {
+    cls.__name__: cls
+    for cls in [
+        BayesianRidgeRegression,
+        BiScaler,
+        IterativeSVD,
+        KNN,
+        MatrixFactorization,
+        MICE,
+        NuclearNormMinimization,
+        SimilarityWeightedAveraging,
+        SimpleFill,
+        SoftImpute,
+        StochasticSoftImpute,
+    ]
+}
+
+
+def _is_serializable_object(value):
+    return SERIALIZABLE_CLASSES.get(value.__class__.__name__) is value.__class__
+
+
+def _encode_attribute(value):
+    if isinstance(value, float) and not np.isfinite(value):
+        return {"__float__": repr(value)}
+    return value
+
+
+def _decode_attribute(value):
+    if isinstance(value, dict) and "__float__" in value:
+        return float(value["__float__"])
+    return value
+
+
+def _object_state(obj, path, prefix=""):
+    """
+    Save the arrays of obj (and of any nested objects) into the directory
+    path and return the JSON description of obj.
+    """
+    attributes = {}
+    dtypes = {}
+    arrays = {}
+    objects = {}
+    for name, value in sorted(obj.__dict__.items()):
+        if isinstance(value, np.ndarray):
+            if value.dtype.hasobject:
+                raise ValueError(
+                    "Can't save array '%s' of Python objects" % (name,))
+            filename = "%s%s.npy" % (prefix, name)
+            np.save(join(path, filename), np.asarray(value), allow_pickle=False)
+            arrays[name] = filename
+        elif isinstance(value, np.dtype):
+            dtypes[name] = value.name
+        elif isinstance(value, np.generic):
+            attributes[name] = _encode_attribute(value.item())
+        elif value is None or isinstance(
+                value, (bool, int, float) + string_types):
+            attributes[name] = _encode_attribute(value)
+        elif _is_serializable_object(value):
+            objects[name] = _object_state(
+                value, path, prefix="%s%s." % (prefix, name))
+    return {
+        "class": obj.__class__.__name__,
+        "attributes": attributes,
+        "dtypes": dtypes,
+        "arrays": arrays,
+        "objects": objects,
+    }
+
+
+def _object_from_state(state, path, mmap_mode):
+    class_name = state["class"]
+    if class_name not in SERIALIZABLE_CLASSES:
+        raise ValueError("Unknown class '%s'" % (class_name,))
+    obj = SERIALIZABLE_CLASSES[class_name]()
+    for name, value in state["attributes"].items():
+        setattr(obj, name, _decode_attribute(value))
+    for name, dtype_name in state["dtypes"].items():
+        setattr(obj, name, np.dtype(dtype_name))
+    for name, filename in state["arrays"].items():
+        setattr(obj, name, np.load(
+            join(path, filename),
+            mmap_mode=mmap_mode,
+            allow_pickle=False))
+    for name, object_state in state["objects"].items():
+        setattr(obj, name, _object_from_state(object_state, path, mmap_mode))
+    return obj
+
+
+def save_fitted_model(model, path):
+    """
+    Save a (typically fitted) imputer into the directory path, which is
+    created if it doesn't already exist.
+    """
+    if not _is_serializable_object(model):
+        raise ValueError("Can't save object of type %s" % (type(model),))
+    if not exists(path):
+        makedirs(path)
+    header = {
+        "format": FORMAT_NAME,
+        "version": FORMAT_VERSION,
+        "model": _object_state(model, path),
+    }
+    with open(join(path, HEADER_FILENAME), "w") as f:
+        json.dump(header, f, indent=2, sort_keys=True, allow_nan=False)
+
+
+def load_fitted_model(path, mmap_mode="r"):
+    """
+    Load an imputer saved by save_fitted_model.
+
+    Parameters
+    ----------
+    path : str
+        Directory the model was saved into.
+
+    mmap_mode : str or None
+        Passed to np.load, by default arrays are memory-mapped read-only.
+        Use None to read them into memory instead.
+    """
+    with open(join(path, HEADER_FILENAME)) as f:
+        header = json.load(f)
+    if header.get("format") != FORMAT_NAME:
+        raise ValueError("%s doesn't contain a fitted model" % (path,))
+    if header.get("version") != FORMAT_VERSION:
+        raise ValueError("Unsupported model format version %s" % (
+            header.get("version"),))
+    return _object_from_state(header["model"], path, mmap_mode)
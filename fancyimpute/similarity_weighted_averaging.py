@@ -14,15 +14,153 @@ from __future__ import absolute_import, print_function, division
 from collections import defaultdict
 
 import numpy as np
+from scipy.sparse import coo_matrix, csr_matrix, issparse
+from six.moves import range
 
+from .common import WorkerPool, create_output_array, load_input_array
 from .dictionary_helpers import (
     collect_nested_keys,
+    dense_matrix_from_sparse_matrix,
     reverse_lookup_from_nested_dict,
     matrix_to_nested_dictionary,
+    matrix_to_sparse_csr_matrix,
+    nested_dictionary_triplets,
+    sparse_csr_matrix_from_nested_dictionary,
     transpose_nested_dictionary,
 )
 
 
+def overlapping_min_max_sums(
+        X_csr,
+        X_csc,
+        row_start,
+        row_end,
+        upper_triangle=True):
+    """
+    For each row i in X[row_start:row_end] and each row j >= i of X (or
+    every row j if upper_triangle is False), sum the elementwise minimum and
+    maximum of the two rows over the columns where both have a stored value.
+
+    Every stored entry (i, k) of the block is joined against the stored
+    entries of column k, so the work is proportional to the number of
+    co-occurring pairs rather than to the number of row pairs.
+
+    Parameters
+    ----------
+    X_csr : scipy.sparse.csr_matrix
+        Observed values, missing entries are simply not stored.
+
+    X_csc : scipy.sparse.csc_matrix
+        The same matrix in column-major format.
+
+    row_start, row_end : int
+        Half-open range of rows to compute sums for.
+
+    upper_triangle : bool
+        Only compute sums for pairs with j >= i, since they're symmetric.
+
+    Returns five arrays: row indices, other row indices, overlap counts,
+    sums of minima and sums of maxima. Only pairs with at least one
+    overlapping column are included.
+    """
+    n_rows = X_csr.shape[0]
+    indptr = X_csr.indptr
+    entry_start = indptr[row_start]
+    entry_end = indptr[row_end]
+    block_columns = X_csr.indices[entry_start:entry_end]
+    block_values = X_csr.data[entry_start:entry_end]
+    block_rows = np.repeat(
+        np.arange(row_start, row_end),
+        np.diff(indptr[row_start:row_end + 1]))
+
+    # expand each entry of the block into the stored entries of its column
+    column_starts = X_csc.indptr[block_columns]
+    column_lengths = X_csc.indptr[block_columns + 1] - column_starts
+    n_pairs = column_lengths.sum()
+    offsets_within_column = np.arange(n_pairs) - np.repeat(
+        np.cumsum(column_lengths) - column_lengths,
+        column_lengths)
+    positions = np.repeat(column_starts, column_lengths) + offsets_within_column
+    rows = np.repeat(block_rows, column_lengths)
+    other_rows = X_csc.indices[positions]
+
+    values_a = np.repeat(block_values, column_lengths)
+    values_b = X_csc.data[positions]
+    if upper_triangle:
+        upper = other_rows >= rows
+        rows = rows[upper]
+        other_rows = other_rows[upper]
+        values_a = values_a[upper]
+        values_b = values_b[upper]
+
+    # aggregate all the column contributions for each pair of rows
+    pair_keys = rows.astype(np.int64) * n_rows + other_rows
+    unique_pair_keys, pair_indices = np.unique(pair_keys, return_inverse=True)
+    overlaps = np.bincount(pair_indices)
+    min_sums = np.bincount(pair_indices, weights=np.minimum(values_a, values_b))
+    max_sums = np.bincount(pair_indices, weights=np.maximum(values_a, values_b))
+    return (
+        unique_pair_keys // n_rows,
+        unique_pair_keys % n_rows,
+        overlaps,
+        min_sums,
+        max_sums,
+    )
+
+
+def symmetric_csr_from_upper_triangle(rows, columns, values, n):
+    """
+    Build an (n, n) CSR matrix from entries with rows <= columns by
+    mirroring the strictly upper triangular entries.
+    """
+    off_diagonal = rows != columns
+    all_rows = np.concatenate([rows, columns[off_diagonal]])
+    all_columns = np.concatenate([columns, rows[off_diagonal]])
+    all_values = np.concatenate([values, values[off_diagonal]])
+    return coo_matrix(
+        (all_values, (all_rows, all_columns)),
+        shape=(n, n)).tocsr()
+
+
+def top_k_per_row(X, k):
+    """
+    Keep only the k largest stored values in each row of a CSR matrix.
+    Ties are broken arbitrarily.
+    """
+    X = X.tocsr()
+    n_rows = X.shape[0]
+    row_lengths = np.diff(X.indptr)
+    if n_rows == 0 or row_lengths.max() <= k:
+        return X
+    rows = np.repeat(np.arange(n_rows), row_lengths)
+    # sort entries by row and then by decreasing value
+    order = np.lexsort((-X.data, rows))
+    rank_within_row = np.arange(len(order)) - np.repeat(
+        X.indptr[:-1], row_lengths)
+    keep = order[rank_within_row < k]
+    return coo_matrix(
+        (X.data[keep], (rows[keep], X.indices[keep])),
+        shape=X.shape).tocsr()
+
+
+def drop_diagonal(X, row_offset=0):
+    """
+    Remove the stored entries (i, i + row_offset) of a sparse matrix whose
+    rows are the rows row_offset, row_offset + 1, ... of a square matrix.
+    """
+    X = X.tocoo()
+    off_diagonal = X.col != X.row + row_offset
+    return coo_matrix(
+        (X.data[off_diagonal], (X.row[off_diagonal], X.col[off_diagonal])),
+        shape=X.shape).tocsr()
+
+
+def _predict_row_block(row_range, solver, X_csr, X_csc, observed_indicator):
+    row_start, row_end = row_range
+    return row_start, solver.predict_row_block(
+        X_csr, X_csc, observed_indicator, row_start, row_end)
+
+
 class SimilarityWeightedAveraging(object):
     """
     Fill in missing each missing row/column value by averaging across the
@@ -40,6 +178,11 @@ class SimilarityWeightedAveraging(object):
             similarity_exponent=4.0,
             shrinkage_coef=0.0001,
             orientation="rows",
+            similarity_backend="dict",
+            similarity_block_size=1000,
+            max_neighbors=None,
+            row_chunk_size=None,
+            n_jobs=1,
             verbose=False):
         """
         Parameters
@@ -62,6 +205,28 @@ class SimilarityWeightedAveraging(object):
         orientation : str
             Whether to compute similarities along rows or columns
 
+        similarity_backend : str
+            "dict" (default) compares every pair of keys in Python,
+            "sparse" converts the values to a CSR matrix once and computes
+            similarities with vectorized operations in blocks of rows.
+
+        similarity_block_size : int
+            Number of rows per block when similarity_backend="sparse".
+
+        max_neighbors : int, optional
+            Only average over the values of this many of the most similar
+            other rows for each row. Requires similarity_backend="sparse".
+
+        row_chunk_size : int, optional
+            If given then complete() computes similarities and predictions
+            for this many rows at a time and writes them straight into the
+            result, so the full similarity matrix is never held in memory.
+            Requires similarity_backend="sparse".
+
+        n_jobs : int
+            Number of worker processes to spread row chunks across when
+            row_chunk_size is given.
+
         verbose : bool
         """
         self.min_weight_for_similarity = min_weight_for_similarity
@@ -69,8 +234,70 @@ class SimilarityWeightedAveraging(object):
         self.similarity_exponent = similarity_exponent
         self.shrinkage_coef = shrinkage_coef
         self.orientation = orientation
+        self.similarity_backend = similarity_backend
+        self.similarity_block_size = similarity_block_size
+        self.max_neighbors = max_neighbors
+        self.row_chunk_size = row_chunk_size
+        self.n_jobs = n_jobs
         self.verbose = verbose
 
+    def jacard_similarity_from_sparse_matrix(self, X):
+        """
+        Compute the continuous Jacard similarity between all pairs of rows
+        of a sparse matrix whose stored entries are the observed values.
+
+        Returns three element tuple of symmetric CSR matrices:
+            - similarities, only stored for pairs of rows which pass
+              min_weight_for_similarity and min_count_for_similarity
+            - overlap counts
+            - weights (sums of elementwise maxima over overlapping columns)
+        """
+        X_csr = X.tocsr()
+        X_csc = X_csr.tocsc()
+        n_rows = X_csr.shape[0]
+        block_size = max(1, self.similarity_block_size)
+        row_blocks = [
+            overlapping_min_max_sums(
+                X_csr,
+                X_csc,
+                row_start,
+                min(row_start + block_size, n_rows))
+            for row_start in range(0, n_rows, block_size)
+        ]
+        if len(row_blocks) == 0:
+            row_blocks.append(overlapping_min_max_sums(X_csr, X_csc, 0, 0))
+        rows, other_rows, overlaps, totals, weights = [
+            np.concatenate(arrays) for arrays in zip(*row_blocks)
+        ]
+        overlap_matrix = symmetric_csr_from_upper_triangle(
+            rows, other_rows, overlaps, n_rows)
+        weight_matrix = symmetric_csr_from_upper_triangle(
+            rows, other_rows, weights, n_rows)
+        valid = (
+            (weights >= self.min_weight_for_similarity) &
+            (overlaps >= self.min_count_for_similarity))
+        similarity_matrix = symmetric_csr_from_upper_triangle(
+            rows[valid],
+            other_rows[valid],
+            totals[valid] / weights[valid],
+            n_rows)
+        return similarity_matrix, overlap_matrix, weight_matrix
+
+    def _jacard_similarity_from_nested_dicts_sparse(self, nested_dictionaries):
+        X, keys, _ = sparse_csr_matrix_from_nested_dictionary(
+            nested_dictionaries,
+            dtype="float64")
+        similarity_matrix, overlap_matrix, weight_matrix = \
+            self.jacard_similarity_from_sparse_matrix(X)
+        results = []
+        for matrix in [similarity_matrix, overlap_matrix, weight_matrix]:
+            coo = matrix.tocoo()
+            results.append({
+                (keys[i], keys[j]): value
+                for (i, j, value) in zip(coo.row, coo.col, coo.data)
+            })
+        return tuple(results)
+
     def jacard_similarity_from_nested_dicts(self, nested_dictionaries):
         """
         Compute the continuous Jacard similarity between all pairs
@@ -78,9 +305,19 @@ class SimilarityWeightedAveraging(object):
 
         Returns three element tuple:
             - similarity dictionary: (key, key) -> float
-            - overlap count dictionary: key -> key -> int
-            - weight dictionary: key -> key -> float
+            - overlap count dictionary: (key, key) -> int
+            - weight dictionary: (key, key) -> float
+
+        With similarity_backend="sparse" the overlap and weight dictionaries
+        only contain pairs of keys which overlap.
         """
+        if self.similarity_backend == "sparse":
+            return self._jacard_similarity_from_nested_dicts_sparse(
+                nested_dictionaries)
+        elif self.similarity_backend != "dict":
+            raise ValueError(
+                "Invalid similarity backend: '%s'" % (
+                    self.similarity_backend,))
         sims = {}
         overlaps = {}
         weights = {}
@@ -108,6 +345,185 @@ class SimilarityWeightedAveraging(object):
                 sims[(a, b)] = total / weight
         return sims, overlaps, weights
 
+    def neighbor_weights(self, X):
+        """
+        Sparse matrix of weights (similarity ** similarity_exponent) between
+        the rows of X, pruned to the max_neighbors largest weights per row.
+        """
+        similarity_matrix, _, _ = self.jacard_similarity_from_sparse_matrix(X)
+        if self.verbose:
+            print(
+                "[SimilarityWeightedAveraging] Computed %d similarities between rows" % (
+                    similarity_matrix.nnz,))
+        weights = similarity_matrix
+        weights.data **= self.similarity_exponent
+        if self.max_neighbors is not None:
+            weights = self._top_neighbors(weights)
+        return weights
+
+    def _top_neighbors(self, weights, row_offset=0):
+        """
+        Keep the max_neighbors largest weights of each row. A row's weight
+        on itself is dropped first, since its own values are never observed
+        where a prediction is needed and it would take up one of the slots.
+        """
+        return top_k_per_row(
+            drop_diagonal(weights, row_offset), self.max_neighbors)
+
+    def _weighted_average(self, weights, X, observed_indicator):
+        """
+        Weighted average of the observed values of X for each row of weights,
+        returned as COO matrix with one entry for every (row, column) where
+        at least one row with non-zero weight has an observed value.
+        """
+        # weighted sums of observed values and the sums of the weights
+        # which went into them
+        numerators = weights.dot(X).tocsr()
+        numerators.sort_indices()
+        denominators = weights.dot(observed_indicator).tocsr()
+        denominators.sort_indices()
+        if (np.array_equal(numerators.indptr, denominators.indptr) and
+                np.array_equal(numerators.indices, denominators.indices)):
+            # usual case, both products have the same sparsity pattern
+            denominators = denominators.data.copy()
+            numerators = numerators.tocoo()
+        else:
+            # the sparse product drops any sums which are exactly zero
+            numerators = numerators.tocoo()
+            denominators = np.asarray(
+                denominators[numerators.row, numerators.col]).ravel()
+        denominators += self.shrinkage_coef
+        valid = denominators > self.shrinkage_coef
+        return coo_matrix(
+            (
+                numerators.data[valid] / denominators[valid],
+                (numerators.row[valid], numerators.col[valid])
+            ),
+            shape=(weights.shape[0], X.shape[1]))
+
+    def predict_row_block(
+            self,
+            X_csr,
+            X_csc,
+            observed_indicator,
+            row_start,
+            row_end):
+        """
+        Predict values for the rows X[row_start:row_end] using only the
+        similarities between those rows and all of the rows of X.
+
+        Returns COO matrix of predictions with row_end - row_start rows.
+        """
+        n_rows = X_csr.shape[0]
+        rows, other_rows, overlaps, totals, weights = overlapping_min_max_sums(
+            X_csr,
+            X_csc,
+            row_start,
+            row_end,
+            upper_triangle=False)
+        valid = (
+            (weights >= self.min_weight_for_similarity) &
+            (overlaps >= self.min_count_for_similarity))
+        similarities = totals[valid] / weights[valid]
+        neighbor_weights = coo_matrix(
+            (
+                similarities ** self.similarity_exponent,
+                (rows[valid] - row_start, other_rows[valid])
+            ),
+            shape=(row_end - row_start, n_rows)).tocsr()
+        if self.max_neighbors is not None:
+            neighbor_weights = self._top_neighbors(
+                neighbor_weights, row_offset=row_start)
+        return self._weighted_average(
+            neighbor_weights, X_csr, observed_indicator)
+
+    def _observed_indicator(self, X):
+        return csr_matrix(
+            (np.ones_like(X.data), X.indices, X.indptr),
+            shape=X.shape)
+
+    def complete_sparse_matrix(self, X):
+        """
+        Parameters
+        ----------
+        X : scipy.sparse matrix
+            Observed values, missing entries are simply not stored.
+
+        Returns CSR matrix with a prediction for every (row, column) where
+        at least one row with non-zero weight has an observed value.
+        """
+        X = csr_matrix(X, dtype="float64")
+        weights = self.neighbor_weights(X)
+        return self._weighted_average(
+            weights, X, self._observed_indicator(X)).tocsr()
+
+    def _row_chunks(self, n_rows):
+        chunk_size = max(1, self.row_chunk_size)
+        return [
+            (row_start, min(row_start + chunk_size, n_rows))
+            for row_start in range(0, n_rows, chunk_size)
+        ]
+
+    def complete_sparse_matrix_in_chunks(self, X, out):
+        """
+        Write predictions for the missing entries of X into out one chunk of
+        rows at a time. Similarities for each chunk are computed against all
+        rows, so only row_chunk_size rows of the similarity matrix exist at
+        once (at the cost of computing each similarity twice).
+
+        Parameters
+        ----------
+        X : scipy.sparse matrix
+            Observed values, missing entries are simply not stored.
+
+        out : np.ndarray or np.memmap
+            Array with the same shape as X. Entries with a prediction are
+            overwritten, all others are left alone.
+        """
+        X_csr = csr_matrix(X, dtype="float64")
+        X_csc = X_csr.tocsc()
+        observed_indicator = self._observed_indicator(X_csr)
+        row_chunks = self._row_chunks(X_csr.shape[0])
+        if self.n_jobs > 1:
+            # the matrices are only sent to each worker once rather than
+            # with every chunk
+            pool = WorkerPool(
+                self.n_jobs,
+                _predict_row_block,
+                shared_args=(self, X_csr, X_csc, observed_indicator))
+            with pool:
+                results = pool.imap_unordered(row_chunks)
+                self._write_row_blocks(results, out, len(row_chunks))
+        else:
+            results = (
+                (row_start, self.predict_row_block(
+                    X_csr, X_csc, observed_indicator, row_start, row_end))
+                for (row_start, row_end) in row_chunks
+            )
+            self._write_row_blocks(results, out, len(row_chunks))
+        return out
+
+    def _write_row_blocks(self, results, out, n_chunks):
+        for i, (row_start, predictions) in enumerate(results):
+            out[predictions.row + row_start, predictions.col] = \
+                predictions.data
+            if self.verbose:
+                print("[SimilarityWeightedAveraging] Finished chunk %d/%d" % (
+                    i + 1, n_chunks))
+
+    def _complete_dict_sparse(self, values_dict):
+        X, row_keys, column_keys = sparse_csr_matrix_from_nested_dictionary(
+            values_dict,
+            dtype="float64")
+        if self.verbose:
+            print("[SimilarityWeightedAveraging] # rows = %d" % (len(row_keys)))
+            print("[SimilarityWeightedAveraging] # columns = %d" % (len(column_keys)))
+        completed = self.complete_sparse_matrix(X).tocoo()
+        result = defaultdict(dict)
+        for (i, j, value) in zip(completed.row, completed.col, completed.data):
+            result[row_keys[i]][column_keys[j]] = value
+        return result
+
     def complete_dict(
             self,
             values_dict):
@@ -117,6 +533,15 @@ class SimilarityWeightedAveraging(object):
         if self.orientation != "rows":
             values_dict = transpose_nested_dictionary(values_dict)
 
+        if self.similarity_backend == "sparse":
+            result = self._complete_dict_sparse(values_dict)
+            if self.orientation != "rows":
+                result = transpose_nested_dictionary(result)
+            return result
+        elif self.max_neighbors is not None:
+            raise ValueError(
+                "max_neighbors requires similarity_backend='sparse'")
+
         row_keys, column_keys = collect_nested_keys(values_dict)
         if self.verbose:
             print("[SimilarityWeightedAveraging] # rows = %d" % (len(row_keys)))
@@ -150,22 +575,110 @@ class SimilarityWeightedAveraging(object):
             result = transpose_nested_dictionary(result)
         return result
 
-    def complete(self, X):
+    def _observed_csr_matrix(self, X):
+        """
+        CSR matrix of the observed values of a dense matrix with NaN entries
+        or of a sparse matrix whose stored entries are the observed values.
+        """
+        if issparse(X):
+            X_csr = csr_matrix(X, dtype="float64")
+            X_csr.sum_duplicates()
+            return X_csr
+        return matrix_to_sparse_csr_matrix(
+            X, filter_fn=np.isfinite, dtype="float64")
+
+    def _fill_observed_values(self, X_csr, out):
+        observed_rows = np.repeat(
+            np.arange(X_csr.shape[0]),
+            np.diff(X_csr.indptr))
+        out[observed_rows, X_csr.indices] = X_csr.data
+        return out
+
+    def _complete_in_chunks(self, X, out):
+        X_csr = self._observed_csr_matrix(X)
+        if self.orientation == "rows":
+            self.complete_sparse_matrix_in_chunks(X_csr, out)
+        else:
+            self.complete_sparse_matrix_in_chunks(X_csr.T, out.T)
+        return self._fill_observed_values(X_csr, out)
+
+    def complete(self, X, out=None):
+        """
+        Parameters
+        ----------
+        X : np.ndarray, scipy.sparse matrix or str
+            Dense matrix with NaN entries signifying missing values, a
+            sparse matrix whose stored entries are the observed values or
+            the path of a .npy file to memory-map. Sparse matrices are only
+            densified for the "dict" similarity backend.
+
+        out : np.ndarray or str, optional
+            Array to write the result into, or a path at which to create
+            a memory-mapped .npy file for it. Only supported together with
+            row_chunk_size.
+
+        Returns completed matrix, missing values for which no prediction
+        could be made are set to zero.
+        """
+        X = load_input_array(X)
+        if self.row_chunk_size is not None:
+            if self.similarity_backend != "sparse":
+                raise ValueError(
+                    "row_chunk_size requires similarity_backend='sparse'")
+            out = create_output_array(out, X.shape, "float64")
+            out[...] = 0
+            return self._complete_in_chunks(X, out)
+        elif out is not None:
+            raise ValueError("out is only supported with row_chunk_size")
+        if self.similarity_backend == "sparse":
+            # stays sparse until the final result is written out
+            X_csr = self._observed_csr_matrix(X)
+            completed = self._complete_observed_csr_matrix(X_csr)
+            array_result = np.zeros(
+                X.shape, dtype=X.dtype if not issparse(X) else "float64")
+            array_result[completed.row, completed.col] = completed.data
+            return self._fill_observed_values(X_csr, array_result)
+        if issparse(X):
+            X = dense_matrix_from_sparse_matrix(X, dtype="float64")
+        missing_mask = np.isnan(X)
+        observed_mask = ~missing_mask
+        completed = self._complete_dense_matrix_dict(X)
+        array_result = np.zeros_like(X)
+        array_result[completed.row, completed.col] = completed.data
+        array_result[observed_mask] = X[observed_mask]
+        return array_result
+
+    def _complete_observed_csr_matrix(self, X_csr):
+        """
+        Returns the predictions for a CSR matrix of observed values as a COO
+        matrix, taking the orientation into account.
+        """
+        if self.verbose:
+            print(
+                ("[SimilarityWeightedAveraging] Completing sparse matrix "
+                 "with shape %s") % (X_csr.shape,))
+        if self.orientation != "rows":
+            X_csr = X_csr.T.tocsr()
+        completed = self.complete_sparse_matrix(X_csr).tocoo()
+        if self.orientation != "rows":
+            completed = completed.T
+        return completed
+
+    def _complete_dense_matrix_dict(self, X):
         if self.verbose:
             print(
                 ("[SimilarityWeightedAveraging] Creating dictionary from matrix "
                  " with shape %s") % (X.shape,))
-        missing_mask = np.isnan(X)
-        observed_mask = ~missing_mask
         sparse_dict = matrix_to_nested_dictionary(
             X,
             filter_fn=np.isfinite)
-
-        completed_dict = self.complete_dict(
-            sparse_dict)
-        array_result = np.zeros_like(X)
-        for row_idx, row_dict in completed_dict.items():
-            for col_idx, value in row_dict.items():
-                array_result[row_idx, col_idx] = value
-        array_result[observed_mask] = X[observed_mask]
-        return array_result
+        completed_dict = self.complete_dict(sparse_dict)
+        n_rows, n_cols = X.shape
+        row_indices, column_indices, values = nested_dictionary_triplets(
+            completed_dict,
+            outer_key_indices={i: i for i in range(n_rows)},
+            inner_key_indices={j: j for j in range(n_cols)},
+            dtype="float64")
+        return coo_matrix(
+            (values, (row_indices, column_indices)),
+            shape=X.shape)
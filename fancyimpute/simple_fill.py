@@ -16,7 +16,12 @@ from .solver import Solver
 
 
 class SimpleFill(Solver):
-    def __init__(self, fill_method="mean", min_value=None, max_value=None):
+    def __init__(
+            self,
+            fill_method="mean",
+            min_value=None,
+            max_value=None,
+            dtype=None):
         """
         Possible values for fill_method:
             "zero": fill missing entries with zeros
@@ -24,15 +29,24 @@ class SimpleFill(Solver):
             "median" : fill with column medians
             "min": fill with min value per column
             "random": fill with gaussian noise according to mean/std of column
+
+        dtype : optional floating point type to convert the input to
         """
         Solver.__init__(
             self,
             fill_method=fill_method,
             min_value=None,
-            max_value=None)
+            max_value=None,
+            dtype=dtype)
 
     def solve(self, X, missing_mask):
         """
         Since X is given to us already filled, just return it.
         """
         return X
+
+    def solve_batch(self, X, missing_mask):
+        """
+        Every matrix of the stack X is already filled, just return it.
+        """
+        return X
@@ -12,11 +12,15 @@
 
 from __future__ import absolute_import, print_function, division
 
+from time import time
+
 from six.moves import range
 import numpy as np
 from sklearn.utils.extmath import randomized_svd
 
-from .common import masked_mae
+from .common import masked_changes_per_matrix
+from .convergence import ConvergenceMonitor
+from .rank_estimation import estimate_rank_and_shrinkage
 from .solver import Solver
 
 
@@ -37,15 +41,22 @@ class SoftImpute(Solver):
             min_value=None,
             max_value=None,
             normalizer=None,
-            verbose=True):
+            verbose=True,
+            dtype=None,
+            callbacks=None,
+            n_metric_samples=10000,
+            full_metrics_every=None,
+            adaptive_rank=False,
+            rank_margin=5):
         """
         Parameters
         ----------
-        shrinkage_value : float
+        shrinkage_value : float or str
             Value by which we shrink singular values on each iteration. If
             omitted then the default value will be the maximum singular
             value of the initialized matrix (zeros for missing values) divided
-            by 100.
+            by 50. Use "auto" to estimate it from the noise level of the
+            observed entries, see fancyimpute.rank_estimation.
 
         convergence_threshold : float
             Minimum ration difference between iterations (as a fraction of
@@ -76,33 +87,64 @@ class SoftImpute(Solver):
 
         verbose : bool
             Print debugging info
+
+        dtype : dtype, optional
+            Floating point type to compute in, e.g. "float32"
+
+        callbacks : list, optional
+            Functions called with a dictionary describing each iteration,
+            see fancyimpute.callbacks.
+
+        n_metric_samples : int, optional
+            The observed MAE reported when verbose or to callbacks is
+            estimated on this many observed entries, use None for all of
+            them.
+
+        full_metrics_every : int, optional
+            Compute the observed MAE over all observed entries on every
+            iteration which is a multiple of this.
+
+        adaptive_rank : bool
+            Rather than computing max_rank singular values (or all of them
+            without a max_rank) on every iteration, use a randomized SVD
+            with rank_margin more components than survived the previous
+            iteration's thresholding, doubling the number of components
+            while all of them survive. max_rank (if given) still bounds
+            the rank, so the cost of each iteration follows the rank of
+            the solution.
+
+        rank_margin : int
+            Number of extra components computed with adaptive_rank.
         """
         Solver.__init__(
             self,
             fill_method=init_fill_method,
             min_value=min_value,
             max_value=max_value,
-            normalizer=normalizer)
+            normalizer=normalizer,
+            dtype=dtype,
+            callbacks=callbacks)
         self.shrinkage_value = shrinkage_value
         self.convergence_threshold = convergence_threshold
         self.max_iters = max_iters
         self.max_rank = max_rank
         self.n_power_iterations = n_power_iterations
         self.verbose = verbose
+        self.n_metric_samples = n_metric_samples
+        self.full_metrics_every = full_metrics_every
+        self.adaptive_rank = adaptive_rank
+        self.rank_margin = rank_margin
 
-    def _converged(self, X_old, X_new, missing_mask):
-        # check for convergence
-        old_missing_values = X_old[missing_mask]
-        new_missing_values = X_new[missing_mask]
-        difference = old_missing_values - new_missing_values
-        ssd = np.sum(difference ** 2)
-        old_norm = np.sqrt((old_missing_values ** 2).sum())
-        return (np.sqrt(ssd) / old_norm) < self.convergence_threshold
+    def _converged_batch(self, X_old, X_new, missing_mask):
+        ssd, old_norm_squared = masked_changes_per_matrix(
+            X_old, X_new, missing_mask)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return np.sqrt(ssd / old_norm_squared) < self.convergence_threshold
 
-    def _svd_step(self, X, shrinkage_value, max_rank=None):
+    def _thresholded_svd(self, X, shrinkage_value, max_rank=None):
         """
-        Returns reconstructed X from low-rank thresholded SVD and
-        the rank achieved.
+        Returns the factors U, s, V of the SVD of X after soft-thresholding
+        its singular values, dropping the components which were zeroed.
         """
         if max_rank:
             # if we have a max rank then perform the faster randomized SVD
@@ -118,12 +160,65 @@ class SoftImpute(Solver):
                 compute_uv=True)
         s_thresh = np.maximum(s - shrinkage_value, 0)
         rank = (s_thresh > 0).sum()
-        s_thresh = s_thresh[:rank]
-        U_thresh = U[:, :rank]
-        V_thresh = V[:rank, :]
-        S_thresh = np.diag(s_thresh)
-        X_reconstruction = np.dot(U_thresh, np.dot(S_thresh, V_thresh))
-        return X_reconstruction, rank
+        return U[:, :rank], s_thresh[:rank], V[:rank, :]
+
+    def _adaptive_thresholded_svd(self, X, shrinkage_value, n_components):
+        """
+        Same as _thresholded_svd with a randomized SVD of n_components
+        components, which is repeated with twice as many components (up to
+        max_rank or the smaller dimension of X) whenever every singular
+        value survives the thresholding, since more of them might have.
+        Without a max_rank it switches to the full SVD once that would be
+        faster.
+        """
+        max_components = min(X.shape)
+        if self.max_rank:
+            max_components = min(max_components, self.max_rank)
+        n_components = max(1, min(n_components, max_components))
+        while True:
+            if not self.max_rank and 2 * n_components > min(X.shape):
+                # a randomized SVD of more than half of the components is
+                # slower than the full SVD
+                return self._thresholded_svd(X, shrinkage_value)
+            U_thresh, s_thresh, V_thresh = self._thresholded_svd(
+                X, shrinkage_value, max_rank=n_components)
+            if (len(s_thresh) < n_components or
+                    n_components == max_components):
+                return U_thresh, s_thresh, V_thresh
+            n_components = min(2 * n_components, max_components)
+
+    def _batch_svd_step(self, X, shrinkage_values, max_rank=None):
+        """
+        Returns the reconstruction of each matrix in the stack X from its
+        SVD after soft-thresholding the singular values by the matrix's
+        shrinkage value.
+
+        Rather than a batched SVD this uses the eigendecomposition of each
+        matrix's (smaller) Gram matrix, which is about twice as fast for
+        the small matrices this is meant for. Only singular values far
+        below the largest one lose precision and those get thresholded away
+        unless the shrinkage value is tiny.
+        """
+        transposed = X.shape[1] < X.shape[2]
+        if transposed:
+            X = X.transpose(0, 2, 1)
+        # X = U diag(s) V' so X'X = V diag(s ** 2) V' and the thresholded
+        # reconstruction U diag(s_thresh) V' = X V diag(s_thresh / s) V'
+        eigenvalues, V = np.linalg.eigh(np.matmul(X.transpose(0, 2, 1), X))
+        s = np.sqrt(np.maximum(eigenvalues, 0))
+        s_thresh = np.maximum(s - shrinkage_values[:, np.newaxis], 0)
+        if max_rank:
+            # eigenvalues are in ascending order, keep the largest ones
+            s_thresh[:, :-max_rank] = 0
+        nonzero = s_thresh > 0
+        scales = np.zeros_like(s)
+        scales[nonzero] = s_thresh[nonzero] / s[nonzero]
+        X_reconstruction = np.matmul(
+            np.matmul(X, V) * scales[:, np.newaxis, :],
+            V.transpose(0, 2, 1))
+        if transposed:
+            X_reconstruction = X_reconstruction.transpose(0, 2, 1)
+        return X_reconstruction
 
     def _max_singular_value(self, X_filled):
         # quick decomposition of X_filled into rank-1 SVD
@@ -134,51 +229,138 @@ class SoftImpute(Solver):
         return s[0]
 
     def solve(self, X, missing_mask):
-        X_init = X.copy()
-
+        # observed entries of X_filled are never modified so there's no need
+        # for a copy of the initial matrix to measure the error against
         X_filled = X
-        observed_mask = ~missing_mask
+        monitor = ConvergenceMonitor(
+            X_filled,
+            missing_mask,
+            sample_size=self.n_metric_samples,
+            full_metrics_every=self.full_metrics_every)
         max_singular_value = self._max_singular_value(X_filled)
         if self.verbose:
             print("[SoftImpute] Max Singular Value of X_init = %f" % (
                 max_singular_value))
 
-        if self.shrinkage_value:
+        if self.shrinkage_value == "auto":
+            _, shrinkage_value = estimate_rank_and_shrinkage(
+                X_filled, missing_mask)
+        elif self.shrinkage_value:
             shrinkage_value = self.shrinkage_value
         else:
             # totally hackish heuristic: keep only components
             # with at least 1/50th the max singular value
             shrinkage_value = max_singular_value / 50.0
 
+        rank = 0
         for i in range(self.max_iters):
-            X_reconstruction, rank = self._svd_step(
-                X_filled,
-                shrinkage_value,
-                max_rank=self.max_rank)
-            X_reconstruction = self.clip(X_reconstruction)
+            start_t = time()
+            if self.adaptive_rank:
+                U_thresh, s_thresh, V_thresh = self._adaptive_thresholded_svd(
+                    X_filled,
+                    shrinkage_value,
+                    n_components=rank + self.rank_margin)
+            else:
+                U_thresh, s_thresh, V_thresh = self._thresholded_svd(
+                    X_filled,
+                    shrinkage_value,
+                    max_rank=self.max_rank)
+            svd_time = time() - start_t
+            rank = len(s_thresh)
+            # the reconstruction is only formed where it's needed
+            row_factors = U_thresh * s_thresh
+            column_factors = V_thresh.T
+            delta = np.sqrt(monitor.update_from_factors(
+                row_factors, column_factors, clip=self.clip))
+            converged = delta < self.convergence_threshold
 
             # print error on observed data
+            mae = None
+            if self.verbose or self.callbacks:
+                mae = monitor.observed_mae_from_factors(
+                    row_factors, column_factors, clip=self.clip)
             if self.verbose:
-                mae = masked_mae(
-                    X_true=X_init,
-                    X_pred=X_reconstruction,
-                    mask=observed_mask)
                 print(
                     "[SoftImpute] Iter %d: observed MAE=%0.6f rank=%d" % (
                         i + 1,
                         mae,
                         rank))
-
-            converged = self._converged(
-                X_old=X_filled,
-                X_new=X_reconstruction,
-                missing_mask=missing_mask)
-            X_filled[missing_mask] = X_reconstruction[missing_mask]
+            self._notify_callbacks(
+                iteration=i + 1,
+                elapsed_time=time() - start_t,
+                svd_time=svd_time,
+                rank=rank,
+                convergence_delta=delta,
+                observed_mae=mae,
+                observed_mae_sampled=not monitor.uses_full_metrics())
             if converged:
                 break
         if self.verbose:
             print("[SoftImpute] Stopped after iteration %d for lambda=%f" % (
                 i + 1,
                 shrinkage_value))
+        # Splitting the thresholded singular values evenly between the row
+        # and column factors turns folding in a new row into a ridge
+        # regression with the shrinkage value as its penalty, which
+        # reproduces the soft-thresholded reconstruction of fully observed
+        # rows.
+        self.column_factors = V_thresh.T * np.sqrt(s_thresh)
+        self.fold_in_regularization = shrinkage_value
 
         return X_filled
+
+    def solve_batch(self, X, missing_mask):
+        """
+        Runs the SoftImpute iterations on a whole stack of matrices with
+        batched SVDs. Every matrix gets its own shrinkage value and stops
+        being updated once it has converged.
+        """
+        X_filled = X
+        n_matrices = len(X_filled)
+        if self.shrinkage_value == "auto":
+            shrinkage_values = np.array([
+                estimate_rank_and_shrinkage(X_matrix, matrix_missing_mask)[1]
+                for (X_matrix, matrix_missing_mask) in zip(
+                    X_filled, missing_mask)
+            ], dtype=X_filled.dtype)
+        elif self.shrinkage_value:
+            shrinkage_values = np.full(
+                n_matrices, self.shrinkage_value, dtype=X_filled.dtype)
+        else:
+            max_singular_values = np.linalg.svd(
+                X_filled, compute_uv=False)[:, 0]
+            shrinkage_values = max_singular_values / 50.0
+        # matrices without missing values are already complete
+        active = missing_mask.any(axis=(1, 2))
+        for i in range(self.max_iters):
+            active_indices = np.flatnonzero(active)
+            if len(active_indices) == 0:
+                break
+            start_t = time()
+            X_active = X_filled[active_indices]
+            active_missing_mask = missing_mask[active_indices]
+            X_reconstruction = self._batch_svd_step(
+                X_active,
+                shrinkage_values[active_indices],
+                max_rank=self.max_rank)
+            svd_time = time() - start_t
+            X_reconstruction = self.clip(X_reconstruction)
+            converged = self._converged_batch(
+                X_old=X_active,
+                X_new=X_reconstruction,
+                missing_mask=active_missing_mask)
+            np.copyto(X_active, X_reconstruction, where=active_missing_mask)
+            X_filled[active_indices] = X_active
+            active[active_indices[converged]] = False
+            n_converged = n_matrices - active.sum()
+            if self.verbose:
+                print("[SoftImpute] Iter %d: %d of %d matrices converged" % (
+                    i + 1,
+                    n_converged,
+                    n_matrices))
+            self._notify_callbacks(
+                iteration=i + 1,
+                elapsed_time=time() - start_t,
+                svd_time=svd_time,
+                n_converged=n_converged)
+        return X_filled
@@ -13,9 +13,17 @@
 from __future__ import absolute_import, print_function, division
 
 import numpy as np
+from scipy.sparse import issparse
 from six.moves import range
 
-from .common import generate_random_column_samples
+from .callbacks import notify_callbacks
+from .common import (
+    create_output_array,
+    fold_in_rows,
+    generate_random_samples_for_missing_entries,
+    load_input_array,
+)
+from .dictionary_helpers import dense_matrix_from_sparse_matrix
 
 
 class Solver(object):
@@ -25,12 +33,49 @@ class Solver(object):
             n_imputations=1,
             min_value=None,
             max_value=None,
-            normalizer=None):
+            normalizer=None,
+            dtype=None,
+            callbacks=None):
+        """
+        Parameters
+        ----------
+        fill_method : str
+            How to initialize the missing values, see fill.
+
+        n_imputations : int
+            Number of imputations averaged by complete.
+
+        min_value : float
+            Smallest allowable value in the solution
+
+        max_value : float
+            Largest allowable value in the solution
+
+        normalizer : object
+            Any object (such as BiScaler) with fit() and transform() methods
+
+        dtype : dtype, optional
+            Floating point type which the input is converted to and which all
+            intermediate arrays are kept in, e.g. "float32" to halve memory
+            use. By default float32 and float64 inputs keep their type and
+            anything else is converted to float64.
+
+        callbacks : list, optional
+            Functions called with a dictionary describing each iteration of
+            iterative solvers, see fancyimpute.callbacks.
+        """
         self.fill_method = fill_method
         self.n_imputations = n_imputations
         self.min_value = min_value
         self.max_value = max_value
         self.normalizer = normalizer
+        if dtype is not None:
+            dtype = np.dtype(dtype)
+            if dtype.kind != "f":
+                raise ValueError(
+                    "Expected floating point dtype but got %s" % (dtype,))
+        self.dtype = dtype
+        self.callbacks = list(callbacks) if callbacks else []
 
     def __repr__(self):
         return str(self)
@@ -46,6 +91,9 @@ class Solver(object):
             self.__class__.__name__,
             ", ".join(field_list))
 
+    def _notify_callbacks(self, **fields):
+        notify_callbacks(self.callbacks, self.__class__.__name__, **fields)
+
     def _check_input(self, X):
         if len(X.shape) != 2:
             raise ValueError("Expected 2d matrix, got %s array" % (X.shape,))
@@ -56,15 +104,13 @@ class Solver(object):
         if missing.all():
             raise ValueError("Input matrix must have some non-missing values")
 
-    def _fill_columns_with_fn(self, X, missing_mask, col_fn):
-        for col_idx in range(X.shape[1]):
-            missing_col = missing_mask[:, col_idx]
-            n_missing = missing_col.sum()
-            if n_missing == 0:
-                continue
-            col_data = X[:, col_idx]
-            fill_values = col_fn(col_data)
-            X[missing_col, col_idx] = fill_values
+    def _fill_columns_with_values(self, X, missing_mask, column_values):
+        """
+        Set the missing entries of each column to the corresponding
+        element of column_values (which has one row of values per matrix
+        when X is a stack of matrices).
+        """
+        np.copyto(X, np.expand_dims(column_values, -2), where=missing_mask)
 
     def fill(
             self,
@@ -76,7 +122,9 @@ class Solver(object):
         Parameters
         ----------
         X : np.array
-            Data array containing NaN entries
+            Data array containing NaN entries, or a stack of them with shape
+            (n_matrices, n_rows, n_cols) whose matrices are filled
+            independently
 
         missing_mask : np.array
             Boolean array indicating where NaN entries are
@@ -103,28 +151,59 @@ class Solver(object):
             # replace NaN's with 0
             X[missing_mask] = 0
         elif fill_method == "mean":
-            self._fill_columns_with_fn(X, missing_mask, np.nanmean)
+            self._fill_columns_with_values(
+                X, missing_mask, np.nanmean(X, axis=-2))
         elif fill_method == "median":
-            self._fill_columns_with_fn(X, missing_mask, np.nanmedian)
+            self._fill_columns_with_values(
+                X, missing_mask, np.nanmedian(X, axis=-2))
         elif fill_method == "min":
-            self._fill_columns_with_fn(X, missing_mask, np.nanmin)
+            self._fill_columns_with_values(
+                X, missing_mask, np.nanmin(X, axis=-2))
+        elif fill_method == "random" and X.ndim > 2:
+            for X_matrix, matrix_missing_mask in zip(X, missing_mask):
+                self.fill(
+                    X_matrix,
+                    matrix_missing_mask,
+                    fill_method=fill_method,
+                    inplace=True)
         elif fill_method == "random":
-            self._fill_columns_with_fn(
-                X,
-                missing_mask,
-                col_fn=generate_random_column_samples)
+            row_indices, column_indices, values = \
+                generate_random_samples_for_missing_entries(X, missing_mask)
+            X[row_indices, column_indices] = values
+        return X
+
+    def _input_dtype(self, X):
+        if self.dtype is not None:
+            return self.dtype
+        elif X.dtype == "f" or X.dtype == "d":
+            return X.dtype
+        else:
+            return np.dtype(float)
+
+    def _convert_input(self, X):
+        """
+        Convert X into a dense 2d array of the configured floating point
+        type, see prepare_input_data for the accepted inputs.
+        """
+        X = load_input_array(X)
+        if issparse(X):
+            X = dense_matrix_from_sparse_matrix(X, dtype=self._input_dtype(X))
+        X = np.asarray(X)
+        X = X.astype(self._input_dtype(X), copy=False)
+        self._check_input(X)
         return X
 
     def prepare_input_data(self, X):
         """
         Check to make sure that the input matrix and its mask of missing
         values are valid. Returns X and missing mask.
-        """
-        X = np.asarray(X)
-        if X.dtype != "f" and X.dtype != "d":
-            X = X.astype(float)
 
-        self._check_input(X)
+        X may also be a scipy.sparse matrix whose stored entries are the
+        observed values, it's then densified with NaN in place of every
+        entry which isn't stored, or the path of a .npy file which gets
+        memory-mapped read-only.
+        """
+        X = self._convert_input(X)
         missing_mask = np.isnan(X)
         self._check_missing_value_mask(missing_mask)
         return X, missing_mask
@@ -168,10 +247,117 @@ class Solver(object):
         raise ValueError("%s.solve not yet implemented!" % (
             self.__class__.__name__,))
 
-    def single_imputation(self, X):
+    def solve_batch(self, X, missing_mask):
+        """
+        Given a stack of initialized matrices X with shape
+        (n_matrices, n_rows, n_cols) and a mask of where their missing values
+        had been, return a completion of every matrix.
+        """
+        raise ValueError("%s.solve_batch not yet implemented!" % (
+            self.__class__.__name__,))
+
+    def prepare_batch_input_data(self, X):
+        """
+        Check a stack of matrices with shape (n_matrices, n_rows, n_cols)
+        and return a copy of it in the configured floating point type along
+        with its mask of missing values. Matrices which aren't missing any
+        values are allowed since they're simply left as they are.
+        """
+        X = np.asarray(X)
+        X = X.astype(self._input_dtype(X))
+        if len(X.shape) != 3:
+            raise ValueError(
+                "Expected 3d stack of matrices, got %s array" % (X.shape,))
+        missing_mask = np.isnan(X)
+        all_missing = missing_mask.all(axis=(1, 2))
+        if all_missing.any():
+            raise ValueError(
+                "Matrix %d of the batch must have some non-missing values" % (
+                    np.flatnonzero(all_missing)[0],))
+        return X, missing_mask
+
+    def _single_batch_imputation(self, X_original, missing_mask):
+        X_filled = self.fill(X_original, missing_mask, inplace=False)
+        # columns without any observed values in their matrix get NaN
+        # from the column statistics
+        X_filled[np.isnan(X_filled)] = 0
+        X_result = self.solve_batch(X_filled, missing_mask)
+        X_result = self.clip(X_result)
+        np.copyto(X_result, X_original, where=~missing_mask)
+        return X_result
+
+    def _complete_stack(self, X):
+        X_original, missing_mask = self.prepare_batch_input_data(X)
+        if self.n_imputations == 1:
+            return self._single_batch_imputation(X_original, missing_mask)
+        X_result = np.zeros_like(X_original)
+        for _ in range(self.n_imputations):
+            X_result += self._single_batch_imputation(
+                X_original, missing_mask)
+        X_result /= self.n_imputations
+        return X_result
+
+    def complete_batch(self, X):
+        """
+        Complete many small matrices at once, amortizing the per-call
+        overhead of complete and letting solvers which implement
+        solve_batch work on the whole stack with batched linear algebra.
+        Normalizers aren't supported since they're fit to a single matrix.
+
+        Parameters
+        ----------
+        X : np.ndarray or list of np.ndarray
+            Either a 3d array with shape (n_matrices, n_rows, n_cols)
+            holding a stack of matrices with NaN entries signifying missing
+            values, or a list of 2d matrices of possibly different shapes.
+            The matrices of a list are grouped by shape and each group is
+            completed as one stack.
+
+        Returns a completed 3d array, or a list of completed matrices in the
+        same order as X when given a list.
+        """
+        if self.normalizer is not None:
+            raise ValueError(
+                "%s.complete_batch doesn't support normalizers" % (
+                    self.__class__.__name__,))
+        if isinstance(X, np.ndarray):
+            return self._complete_stack(X)
+        matrices = [np.asarray(X_matrix) for X_matrix in X]
+        for X_matrix in matrices:
+            self._check_input(X_matrix)
+        indices_by_shape = {}
+        for i, X_matrix in enumerate(matrices):
+            indices_by_shape.setdefault(X_matrix.shape, []).append(i)
+        results = [None] * len(matrices)
+        for shape, indices in indices_by_shape.items():
+            X_stack = self._complete_stack([matrices[i] for i in indices])
+            for i, X_result in zip(indices, X_stack):
+                results[i] = X_result
+        return results
+
+    def single_imputation(self, X, out=None):
+        """
+        Parameters
+        ----------
+        X : np.ndarray, scipy.sparse matrix or str
+            Incomplete matrix, see prepare_input_data.
+
+        out : np.ndarray or str, optional
+            Array (e.g. a np.memmap) to use as the working buffer of the
+            solver and to write the result into, or a path at which to
+            create a memory-mapped .npy file for it. By default a copy of X
+            is made.
+        """
         X_original, missing_mask = self.prepare_input_data(X)
         observed_mask = ~missing_mask
-        X = X_original.copy()
+        if out is None:
+            X_out = None
+            X = X_original.copy()
+        else:
+            X_out = create_output_array(
+                out, X_original.shape, X_original.dtype)
+            X_out[...] = X_original
+            X = X_out
         if self.normalizer is not None:
             X = self.normalizer.fit_transform(X)
         X_filled = self.fill(X, missing_mask, inplace=True)
@@ -189,23 +375,98 @@ class Solver(object):
                     type(X_result)))
 
         X_result = self.project_result(X=X_result)
-        X_result[observed_mask] = X_original[observed_mask]
+        if X_out is not None:
+            if not np.may_share_memory(X_result, X_out):
+                X_out[...] = X_result
+            X_result = X_out
+        np.copyto(X_result, X_original, where=observed_mask)
         return X_result
 
     def multiple_imputations(self, X):
         """
         Generate multiple imputations of the same incomplete matrix
         """
+        if issparse(X):
+            # densify once rather than for every imputation
+            X, _ = self.prepare_input_data(X)
         return [self.single_imputation(X) for _ in range(self.n_imputations)]
 
-    def complete(self, X):
+    def complete(self, X, out=None):
         """
-        Expects 2d float matrix with NaN entries signifying missing values
+        Expects 2d float matrix with NaN entries signifying missing values,
+        a scipy.sparse matrix in which missing values aren't stored or the
+        path of a .npy file to memory-map.
+
+        If out is given (an array or a path at which to create a
+        memory-mapped .npy file) then the result is written into it.
 
         Returns completed matrix without any NaNs.
         """
-        imputations = self.multiple_imputations(X)
-        if len(imputations) == 1:
-            return imputations[0]
-        else:
-            return np.mean(imputations, axis=0)
+        if self.n_imputations == 1:
+            return self.single_imputation(X, out=out)
+        X, _ = self.prepare_input_data(X)
+        # accumulate the average one imputation at a time instead of
+        # holding all of them in memory
+        X_result = create_output_array(out, X.shape, X.dtype)
+        X_result[...] = 0
+        for _ in range(self.n_imputations):
+            X_result += self.single_imputation(X)
+        X_result /= self.n_imputations
+        return X_result
+
+    def fit_transform(self, X):
+        """
+        Complete X and keep the learned column factors (and normalizer
+        state) so that new rows can later be imputed with transform.
+        Only supported by solvers which learn a low-rank model.
+        """
+        X_result = self.complete(X)
+        if getattr(self, "column_factors", None) is None:
+            raise ValueError(
+                "%s doesn't learn column factors which new rows could be "
+                "folded into" % (self.__class__.__name__,))
+        return X_result
+
+    def fit(self, X):
+        """
+        See fit_transform.
+        """
+        self.fit_transform(X)
+        return self
+
+    def transform(self, X):
+        """
+        Impute the missing entries of new rows by folding them into the
+        low-rank model learned by fit: the column factors stay fixed and each
+        row's factors come from a small least-squares problem over its
+        observed entries.
+
+        Returns X with its missing entries filled in.
+        """
+        if getattr(self, "column_factors", None) is None:
+            raise ValueError("%s must be fit before calling transform" % (
+                self.__class__.__name__,))
+        X_original = self._convert_input(X)
+        if X_original.shape[1] != self.column_factors.shape[0]:
+            raise ValueError("Expected %d columns but got %d" % (
+                self.column_factors.shape[0], X_original.shape[1]))
+        missing_mask = np.isnan(X_original)
+        X = X_original
+        normalizer = None
+        if self.normalizer is not None:
+            # row statistics are specific to the rows they were fit on,
+            # so estimate them for the new rows from the fixed column ones
+            normalizer = self.normalizer.fit_new_rows(X)
+            X = normalizer.transform(X)
+        row_factors = fold_in_rows(
+            X,
+            missing_mask,
+            self.column_factors,
+            regularization=self.fold_in_regularization)
+        X_result = np.dot(row_factors, self.column_factors.T)
+        X_result = X_result.astype(X_original.dtype, copy=False)
+        if normalizer is not None:
+            X_result = normalizer.inverse_transform(X_result, inplace=True)
+        X_result = self.clip(X_result)
+        np.copyto(X_result, X_original, where=~missing_mask)
+        return X_result
@@ -0,0 +1,273 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import, print_function, division
+
+from time import time
+
+from six.moves import range
+import numpy as np
+from sklearn.utils.extmath import randomized_svd
+
+from .common import fold_in_rows
+from .solver import Solver
+
+
+class StochasticSoftImpute(Solver):
+    """
+    Variant of SoftImpute for tall matrices which learns the column factors
+    from random mini-batches of rows instead of taking an SVD of the whole
+    matrix on every iteration.
+
+    SoftImpute's soft-thresholded SVD Z = U (s - lambda)_+ V' is also the
+    product A B' of the factors minimizing
+
+        ||observed entries of X - A B'||^2 / 2 + lambda (||A||^2 + ||B||^2) / 2
+
+    (with B = V (s - lambda)_+ ^ 1/2, the column factors SoftImpute keeps
+    for transform). Given B, every row's factors are a ridge regression on
+    its observed entries, and given the rows' factors the best B only
+    depends on the sums X'A and A'A over all rows (with the missing entries
+    of X filled in by the current reconstruction, as in SoftImpute).
+    Each iteration folds in a mini-batch of rows, moves running averages
+    of those sums towards the mini-batch's with a decaying step size
+    (iteration ** -step_size_decay) and solves for B. A final pass over all
+    rows then folds each of them into the learned column factors.
+
+    Every iteration touches batch_size rows, so the cost of the solver is
+    max_iters * batch_size rows plus a single pass over the matrix, rather
+    than a pass over the matrix per iteration. It only pays off for
+    matrices with many more rows than that. On the synthetic benchmarks
+    (experiments/benchmarks, 20% missing, noise 0.1) the mean absolute error
+    on the missing entries compared to SoftImpute with the same max_rank is:
+
+        2000 x 200, rank 10: 0.5% to 1.1% higher for every pattern
+        20000 x 500, rank 20: 2.8% to 4.1% higher for every pattern
+        400000 x 100, rank 10, uniform: 1.4% higher in a fifth of the time
+    """
+    def __init__(
+            self,
+            shrinkage_value=None,
+            max_rank=10,
+            batch_size=1000,
+            max_iters=200,
+            step_size_decay=0.5,
+            convergence_threshold=0.0001,
+            fold_in_chunk_size=10000,
+            n_power_iterations=1,
+            init_fill_method="zero",
+            min_value=None,
+            max_value=None,
+            normalizer=None,
+            verbose=True,
+            dtype=None,
+            callbacks=None,
+            random_seed=0):
+        """
+        Parameters
+        ----------
+        shrinkage_value : float
+            Value by which the singular values are shrunk. If omitted then
+            the maximum singular value of the initialized matrix (estimated
+            from a mini-batch) divided by 50, like SoftImpute.
+
+        max_rank : int
+            Number of columns of the factors, components which get shrunk
+            to zero leave the reconstruction with a lower rank.
+
+        batch_size : int
+            Number of rows (sampled with replacement) in each mini-batch.
+
+        max_iters : int
+            Maximum number of mini-batches.
+
+        step_size_decay : float
+            The running averages move a fraction iteration ** -step_size_decay
+            of the way towards each mini-batch's statistics, values between
+            0.5 and 1 average out the noise of the mini-batches.
+
+        convergence_threshold : float
+            Stop once the relative change of the column factors between
+            mini-batches drops below this.
+
+        fold_in_chunk_size : int
+            Number of rows folded in at a time by the final pass.
+
+        n_power_iterations : int
+            Power iterations of the randomized SVD of the first mini-batch
+            which initializes the column factors.
+
+        init_fill_method : str
+            How to initialize missing values of data matrix, default is
+            to fill them with zeros.
+
+        min_value : float
+            Smallest allowable value in the solution
+
+        max_value : float
+            Largest allowable value in the solution
+
+        normalizer : object
+            Any object (such as BiScaler) with fit() and transform() methods
+
+        verbose : bool
+            Print debugging info
+
+        dtype : dtype, optional
+            Floating point type to compute in, e.g. "float32"
+
+        callbacks : list, optional
+            Functions called with a dictionary describing each iteration,
+            see fancyimpute.callbacks.
+
+        random_seed : int
+            Seed for sampling the mini-batches.
+        """
+        Solver.__init__(
+            self,
+            fill_method=init_fill_method,
+            min_value=min_value,
+            max_value=max_value,
+            normalizer=normalizer,
+            dtype=dtype,
+            callbacks=callbacks)
+        self.shrinkage_value = shrinkage_value
+        self.max_rank = max_rank
+        self.batch_size = batch_size
+        self.max_iters = max_iters
+        self.step_size_decay = step_size_decay
+        self.convergence_threshold = convergence_threshold
+        self.fold_in_chunk_size = fold_in_chunk_size
+        self.n_power_iterations = n_power_iterations
+        self.verbose = verbose
+        self.random_seed = random_seed
+
+    def _sample_rows(self, n_rows, random_state):
+        # sampling with replacement avoids permuting all of the rows of a
+        # tall matrix, and sorted indices read a memmap in order
+        return np.sort(random_state.randint(0, n_rows, self.batch_size))
+
+    def _initial_column_factors(self, X, random_state):
+        """
+        Column factors from the SVD of a mini-batch of the initialized
+        matrix, along with an estimate of the matrix's largest singular
+        value.
+        """
+        n_rows, n_cols = X.shape
+        X_batch = X[self._sample_rows(n_rows, random_state)]
+        rank = min(self.max_rank, n_cols, len(X_batch))
+        _, s, V = randomized_svd(
+            X_batch,
+            rank,
+            n_iter=self.n_power_iterations,
+            random_state=random_state)
+        # the squared singular values of a uniform sample of rows are about
+        # batch_size / n_rows of the whole matrix's
+        s *= np.sqrt(n_rows / len(X_batch))
+        return V.T * np.sqrt(s), s[0]
+
+    def _fold_in_missing_values(self, X, missing_mask, column_factors,
+                                shrinkage_value):
+        """
+        Final pass which folds every row into the column factors and fills
+        in its missing entries, fold_in_chunk_size rows at a time.
+        """
+        n_rows = X.shape[0]
+        for start in range(0, n_rows, self.fold_in_chunk_size):
+            end = min(start + self.fold_in_chunk_size, n_rows)
+            X_chunk = X[start:end]
+            missing_chunk = missing_mask[start:end]
+            row_factors = fold_in_rows(
+                X_chunk,
+                missing_chunk,
+                column_factors,
+                regularization=shrinkage_value)
+            X_reconstruction = self.clip(
+                np.dot(row_factors, column_factors.T))
+            # X_chunk is a view, so this fills in X itself
+            np.copyto(X_chunk, X_reconstruction, where=missing_chunk)
+        return X
+
+    def solve(self, X, missing_mask):
+        X_filled = X
+        n_rows = X_filled.shape[0]
+        random_state = np.random.RandomState(self.random_seed)
+        column_factors, max_singular_value = self._initial_column_factors(
+            X_filled, random_state)
+        if self.verbose:
+            print("[StochasticSoftImpute] Max Singular Value of X_init = %f" % (
+                max_singular_value))
+        if self.shrinkage_value:
+            shrinkage_value = self.shrinkage_value
+        else:
+            # same heuristic as SoftImpute
+            shrinkage_value = max_singular_value / 50.0
+        rank = column_factors.shape[1]
+        identity = np.eye(rank, dtype=column_factors.dtype)
+        # running averages over rows of x a' and a a', where a are the
+        # row's factors and x the row with its missing entries filled in
+        mean_xa = np.zeros_like(column_factors)
+        mean_aa = np.zeros((rank, rank), dtype=column_factors.dtype)
+        for i in range(self.max_iters):
+            start_t = time()
+            rows = self._sample_rows(n_rows, random_state)
+            X_batch = X_filled[rows]
+            missing_batch = missing_mask[rows]
+            row_factors = fold_in_rows(
+                X_batch,
+                missing_batch,
+                column_factors,
+                regularization=shrinkage_value)
+            X_reconstruction = self.clip(
+                np.dot(row_factors, column_factors.T))
+            observed_batch = ~missing_batch
+            mae = np.mean(np.abs(
+                X_batch[observed_batch] - X_reconstruction[observed_batch]))
+            np.copyto(X_batch, X_reconstruction, where=missing_batch)
+            step_size = (i + 1) ** -self.step_size_decay
+            mean_xa *= 1 - step_size
+            mean_xa += (step_size / len(rows)) * np.dot(X_batch.T, row_factors)
+            mean_aa *= 1 - step_size
+            mean_aa += (step_size / len(rows)) * np.dot(
+                row_factors.T, row_factors)
+            # B = (X'A) (A'A + lambda I)^-1 with the sums over all rows
+            # estimated by n_rows times the running averages
+            new_column_factors = np.linalg.solve(
+                mean_aa + (shrinkage_value / n_rows) * identity,
+                mean_xa.T).T
+            difference = new_column_factors - column_factors
+            with np.errstate(divide="ignore", invalid="ignore"):
+                delta = np.sqrt(
+                    (difference ** 2).sum() / (column_factors ** 2).sum())
+            column_factors = new_column_factors
+            converged = delta < self.convergence_threshold
+            if self.verbose:
+                print(
+                    "[StochasticSoftImpute] Iter %d: mini-batch observed "
+                    "MAE=%0.6f change=%0.6f" % (i + 1, mae, delta))
+            self._notify_callbacks(
+                iteration=i + 1,
+                elapsed_time=time() - start_t,
+                rank=rank,
+                convergence_delta=delta,
+                observed_mae=mae,
+                observed_mae_sampled=True)
+            if converged:
+                break
+        if self.verbose:
+            print(
+                "[StochasticSoftImpute] Stopped after iteration %d for "
+                "lambda=%f" % (i + 1, shrinkage_value))
+        self.column_factors = column_factors
+        self.fold_in_regularization = shrinkage_value
+        return self._fold_in_missing_values(
+            X_filled, missing_mask, column_factors, shrinkage_value)
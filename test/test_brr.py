@@ -30,5 +30,43 @@ def test_brr_like_sklearn():
     assert np.mean(np.abs(y_ts_brr - y_ts_rr)) < 0.001, \
         "Predictions are different from sklearn's ridge regression."
 
+
+def test_brr_intercept_matches_explicit_column_of_ones():
+    n = 500
+    d = 5
+    X = np.random.randn(n, d)
+    y = np.dot(X, np.random.randn(d)) + 3.0 + np.random.randn(n)
+    X_ones = np.column_stack((X, np.ones(n)))
+
+    brr_intercept = BayesianRidgeRegression(lambda_reg=0.1, add_ones=True)
+    brr_intercept.fit(X, y)
+    brr_explicit = BayesianRidgeRegression(lambda_reg=0.1, add_ones=False)
+    brr_explicit.fit(X_ones, y)
+
+    assert np.allclose(
+        brr_intercept.beta_estimate, brr_explicit.beta_estimate)
+    assert np.allclose(brr_intercept.predict(X), brr_explicit.predict(X_ones))
+    mus, sigmas_squared = brr_intercept.predict_dist(X)
+    mus_explicit, sigmas_squared_explicit = brr_explicit.predict_dist(X_ones)
+    assert np.allclose(mus, mus_explicit)
+    assert np.allclose(sigmas_squared, sigmas_squared_explicit)
+
+def test_brr_keeps_float32():
+    X = np.random.randn(100, 5).astype("float32")
+    y = X.sum(axis=1)
+    brr = BayesianRidgeRegression(add_ones=True)
+    brr.fit(X, y)
+    assert brr.beta_estimate.dtype == np.float32
+    assert brr.covar.dtype == np.float32
+    assert brr.predict(X).dtype == np.float32
+    assert brr.predict(X, random_draw=True).dtype == np.float32
+    mus, sigmas_squared = brr.predict_dist(X)
+    assert mus.dtype == np.float32
+    assert sigmas_squared.dtype == np.float32
+    assert brr.add_column_of_ones(X).dtype == np.float32
+
+
 if __name__ == "__main__":
     test_brr_like_sklearn()
+    test_brr_intercept_matches_explicit_column_of_ones()
+    test_brr_keeps_float32()
@@ -0,0 +1,115 @@
+import json
+import logging
+
+import numpy as np
+from nose.tools import eq_
+
+from fancyimpute import (
+    BiScaler,
+    IterativeSVD,
+    LoggingCallback,
+    MICE,
+    SoftImpute,
+    TraceCallback,
+)
+
+from low_rank_data import XY_incomplete
+
+
+def check_trace(solver, trace, expected_fields):
+    eq_(len(trace.events) > 0, True)
+    eq_([event["iteration"] for event in trace.events],
+        list(range(1, len(trace.events) + 1)))
+    for event in trace.events:
+        eq_(event["source"], solver.__class__.__name__)
+        assert event["elapsed_time"] >= 0
+        for field in expected_fields:
+            assert field in event, "Missing %s in %s" % (field, event)
+
+
+def test_soft_impute_trace():
+    trace = TraceCallback()
+    solver = SoftImpute(verbose=False, callbacks=[trace])
+    solver.complete(XY_incomplete)
+    check_trace(
+        solver,
+        trace,
+        ["svd_time", "rank", "convergence_delta", "observed_mae", "peak_rss"])
+    for event in trace.events:
+        assert event["svd_time"] <= event["elapsed_time"]
+    # the last iteration is the one which converged
+    assert trace.events[-1]["convergence_delta"] < solver.convergence_threshold
+
+
+def test_iterative_svd_trace():
+    trace = TraceCallback()
+    solver = IterativeSVD(rank=3, verbose=False, callbacks=[trace])
+    solver.complete(XY_incomplete)
+    check_trace(
+        solver,
+        trace,
+        ["svd_time", "rank", "convergence_delta", "observed_mae"])
+    eq_(trace.events[0]["rank"], 1)
+    eq_(trace.events[-1]["rank"], 3)
+
+
+def test_mice_trace():
+    trace = TraceCallback()
+    solver = MICE(
+        n_imputations=3, n_burn_in=2, verbose=False, callbacks=[trace])
+    solver.complete(XY_incomplete)
+    check_trace(solver, trace, [])
+    eq_(len(trace.events), 5)
+
+
+def test_biscaler_trace():
+    trace = TraceCallback()
+    biscaler = BiScaler(verbose=False, callbacks=[trace])
+    biscaler.fit(XY_incomplete)
+    check_trace(biscaler, trace, ["residual", "convergence_delta"])
+
+
+def reject_constant(name):
+    raise ValueError("Invalid JSON constant %s" % (name,))
+
+
+def test_trace_to_json():
+    trace = TraceCallback()
+    SoftImpute(max_iters=3, verbose=False, callbacks=[trace]).complete(
+        XY_incomplete.astype("float32"))
+    events = json.loads(trace.to_json(), parse_constant=reject_constant)
+    eq_(len(events), 3)
+    # the first change from the zero fill is infinite
+    eq_(trace.events[0]["convergence_delta"], np.inf)
+    eq_(events[0]["convergence_delta"], None)
+    eq_(events[0]["source"], "SoftImpute")
+
+
+def test_logging_callback():
+    records = []
+
+    class ListHandler(logging.Handler):
+        def emit(self, record):
+            records.append(record)
+
+    logger = logging.getLogger("fancyimpute.test_callbacks")
+    logger.setLevel(logging.INFO)
+    logger.addHandler(ListHandler())
+    SoftImpute(
+        max_iters=2,
+        verbose=False,
+        callbacks=[LoggingCallback(logger=logger)]).complete(XY_incomplete)
+    eq_(len(records), 2)
+    assert records[0].getMessage().startswith("[SoftImpute] ")
+    assert "rank=" in records[0].getMessage()
+    eq_(records[1].imputation_event["iteration"], 2)
+    assert np.isfinite(records[1].imputation_event["observed_mae"])
+
+
+if __name__ == "__main__":
+    test_soft_impute_trace()
+    test_iterative_svd_trace()
+    test_mice_trace()
+    test_biscaler_trace()
+    test_trace_to_json()
+    test_logging_callback()
@@ -0,0 +1,115 @@
+import numpy as np
+from nose.tools import eq_, assert_raises
+
+import fancyimpute.common
+from fancyimpute.common import (
+    choose_solution_using_percentiles,
+    fold_in_rows,
+    masked_column_percentiles,
+    reconstruct_entries,
+    WorkerPool,
+)
+
+from low_rank_data import XY, XY_incomplete, missing_mask
+
+
+def test_masked_column_percentiles_match_np_percentile():
+    percentiles = [0, 10, 25, 50, 75, 90, 100]
+    for mask in [missing_mask, ~missing_mask]:
+        result = masked_column_percentiles(XY, mask, percentiles)
+        eq_(result.shape, (len(percentiles), XY.shape[1]))
+        for col_idx in range(XY.shape[1]):
+            expected = np.percentile(
+                XY[mask[:, col_idx], col_idx], percentiles)
+            assert np.allclose(result[:, col_idx], expected)
+
+
+def test_choose_solution_using_every_column():
+    # the first candidate only gets the last column right while the second
+    # gets every column but the last one right, only looking at the last
+    # column would pick the first candidate
+    bad_everywhere = np.where(missing_mask, XY + 3, XY)
+    first = bad_everywhere.copy()
+    first[:, -1] = XY[:, -1]
+    second = XY.copy()
+    second[missing_mask[:, -1], -1] += 0.5
+    best = choose_solution_using_percentiles(XY_incomplete, [first, second])
+    assert best is second
+
+
+def test_choose_solution_from_generator():
+    shifts = [2.0, 0.0, 1.0]
+    solutions = (np.where(missing_mask, XY + shift, XY) for shift in shifts)
+    best = choose_solution_using_percentiles(XY_incomplete, solutions)
+    assert np.allclose(best, XY)
+
+
+def test_choose_solution_in_parallel():
+    shifts = [2.0, 0.5, 0.0, 1.0]
+    solutions = [np.where(missing_mask, XY + shift, XY) for shift in shifts]
+    best = choose_solution_using_percentiles(
+        XY_incomplete, solutions, n_jobs=2)
+    assert best is solutions[2]
+
+
+def test_choose_solution_requires_usable_columns():
+    X = XY[:3].copy()
+    X[0, :] = np.nan
+    with assert_raises(ValueError):
+        choose_solution_using_percentiles(X, [XY[:3]])
+
+
+def test_reconstruct_entries_matches_dense_product():
+    np.random.seed(0)
+    row_factors = np.random.randn(50, 4)
+    column_factors = np.random.randn(30, 4)
+    rows, cols = np.nonzero(np.random.rand(50, 30) < 0.3)
+    values = reconstruct_entries(
+        row_factors, column_factors, rows, cols, block_size=7)
+    assert np.allclose(
+        values, np.dot(row_factors, column_factors.T)[rows, cols])
+
+
+def test_batched_ridge_fold_in_matches_row_by_row():
+    np.random.seed(0)
+    column_factors = np.random.randn(10, 3)
+    row_missing_mask = missing_mask.copy()
+    row_missing_mask[0] = True
+    row_missing_mask[1] = False
+    batched = fold_in_rows(
+        XY, row_missing_mask, column_factors, regularization=0.5)
+    max_batched_size = fancyimpute.common.MAX_BATCHED_FOLD_IN_SIZE
+    fancyimpute.common.MAX_BATCHED_FOLD_IN_SIZE = 0
+    try:
+        row_by_row = fold_in_rows(
+            XY,
+            row_missing_mask,
+            column_factors,
+            regularization=0.5)
+    finally:
+        fancyimpute.common.MAX_BATCHED_FOLD_IN_SIZE = max_batched_size
+    assert np.allclose(batched, row_by_row)
+    assert (batched[0] == 0).all()
+
+
+def scaled_row_sum(row_index, X, scale):
+    return scale * X[row_index].sum()
+
+
+def test_worker_pool_passes_shared_arguments():
+    expected = [2 * XY[i].sum() for i in range(10)]
+    with WorkerPool(2, scaled_row_sum, shared_args=(XY, 2)) as pool:
+        assert np.allclose(pool.map(range(10)), expected)
+        assert np.allclose(sorted(pool.imap_unordered(range(10))),
+                           sorted(expected))
+
+
+if __name__ == "__main__":
+    test_masked_column_percentiles_match_np_percentile()
+    test_choose_solution_using_every_column()
+    test_choose_solution_from_generator()
+    test_choose_solution_in_parallel()
+    test_choose_solution_requires_usable_columns()
+    test_reconstruct_entries_matches_dense_product()
+    test_batched_ridge_fold_in_matches_row_by_row()
+    test_worker_pool_passes_shared_arguments()
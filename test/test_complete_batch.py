@@ -0,0 +1,106 @@
+import numpy as np
+from nose.tools import eq_, assert_raises
+
+from fancyimpute import IterativeSVD, SimpleFill, SoftImpute
+
+
+def create_incomplete_stack(
+        n_matrices=40,
+        n_rows=30,
+        n_cols=10,
+        rank=2,
+        fraction_missing=0.2,
+        random_seed=0):
+    np.random.seed(random_seed)
+    row_factors = np.random.randn(n_matrices, n_rows, rank)
+    column_factors = np.random.randn(n_matrices, rank, n_cols)
+    X = np.matmul(row_factors, column_factors)
+    missing_mask = np.random.rand(*X.shape) < fraction_missing
+    X_incomplete = X.copy()
+    X_incomplete[missing_mask] = np.nan
+    return X, X_incomplete, missing_mask
+
+
+def check_batch_matches_one_at_a_time(solver, X_incomplete, **kwargs):
+    X_batch = solver.complete_batch(X_incomplete)
+    eq_(X_batch.shape, X_incomplete.shape)
+    for X_matrix, X_matrix_batch in zip(X_incomplete, X_batch):
+        assert np.allclose(
+            solver.complete(X_matrix), X_matrix_batch, **kwargs)
+    return X_batch
+
+
+def test_soft_impute_batch_matches_one_at_a_time():
+    _, X_incomplete, _ = create_incomplete_stack()
+    check_batch_matches_one_at_a_time(
+        SoftImpute(shrinkage_value=1.0, verbose=False),
+        X_incomplete)
+
+
+def test_iterative_svd_batch_matches_one_at_a_time():
+    _, X_incomplete, _ = create_incomplete_stack()
+    check_batch_matches_one_at_a_time(
+        IterativeSVD(rank=2, verbose=False),
+        X_incomplete,
+        atol=1e-4)
+
+
+def test_soft_impute_batch_recovers_low_rank_matrices():
+    X, X_incomplete, missing_mask = create_incomplete_stack()
+    X_batch = SoftImpute(verbose=False).complete_batch(X_incomplete)
+    mae = np.abs(X - X_batch)[missing_mask].mean()
+    assert mae < 0.2, "Error too high: %f" % (mae,)
+
+
+def test_complete_ragged_batch():
+    _, X_small, _ = create_incomplete_stack(n_matrices=3, n_rows=8)
+    _, X_large, _ = create_incomplete_stack(n_matrices=2, n_rows=20)
+    matrices = [X_small[0], X_large[0], X_small[1], X_large[1], X_small[2]]
+    solver = SoftImpute(shrinkage_value=1.0, verbose=False)
+    results = solver.complete_batch(matrices)
+    eq_(len(results), len(matrices))
+    X_small_batch = solver.complete_batch(X_small)
+    X_large_batch = solver.complete_batch(X_large)
+    for X_result, X_expected in zip(results, [
+            X_small_batch[0],
+            X_large_batch[0],
+            X_small_batch[1],
+            X_large_batch[1],
+            X_small_batch[2]]):
+        assert np.allclose(X_result, X_expected)
+
+
+def test_complete_batch_leaves_complete_matrices_alone():
+    X, X_incomplete, _ = create_incomplete_stack(n_matrices=3)
+    X_incomplete[1] = X[1]
+    X_batch = SoftImpute(verbose=False).complete_batch(X_incomplete)
+    assert np.allclose(X_batch[1], X[1])
+    assert np.isfinite(X_batch).all()
+
+
+def test_complete_batch_keeps_float32():
+    _, X_incomplete, _ = create_incomplete_stack()
+    for solver in [
+            SimpleFill(fill_method="random"),
+            SoftImpute(verbose=False),
+            IterativeSVD(rank=2, verbose=False)]:
+        X_batch = solver.complete_batch(X_incomplete.astype("float32"))
+        eq_(X_batch.dtype, np.float32)
+        assert np.isfinite(X_batch).all()
+
+
+def test_complete_batch_rejects_missing_matrix():
+    _, X_incomplete, _ = create_incomplete_stack(n_matrices=3)
+    X_incomplete[2] = np.nan
+    with assert_raises(ValueError):
+        SoftImpute(verbose=False).complete_batch(X_incomplete)
+
+
+if __name__ == "__main__":
+    test_soft_impute_batch_matches_one_at_a_time()
+    test_iterative_svd_batch_matches_one_at_a_time()
+    test_soft_impute_batch_recovers_low_rank_matrices()
+    test_complete_ragged_batch()
+    test_complete_batch_leaves_complete_matrices_alone()
+    test_complete_batch_keeps_float32()
+    test_complete_batch_rejects_missing_matrix()
@@ -0,0 +1,157 @@
+import numpy as np
+from nose.tools import eq_
+
+import fancyimpute.convergence
+from fancyimpute import IterativeSVD, SoftImpute, TraceCallback
+from fancyimpute.common import masked_mae
+from fancyimpute.convergence import ConvergenceMonitor
+
+from low_rank_data import XY, XY_incomplete, missing_mask
+
+
+def test_update_measures_change_of_missing_values():
+    X = np.where(missing_mask, 1.0, XY_incomplete)
+    monitor = ConvergenceMonitor(X, missing_mask)
+    for X_new in [XY, XY + 0.5, XY + 0.25]:
+        old_missing_values = X[missing_mask].copy()
+        relative_change_squared = monitor.update(X_new)
+        expected = (
+            ((old_missing_values - X_new[missing_mask]) ** 2).sum() /
+            (old_missing_values ** 2).sum())
+        assert np.isclose(relative_change_squared, expected)
+        assert np.allclose(X[missing_mask], X_new[missing_mask])
+        assert np.allclose(X[~missing_mask], XY_incomplete[~missing_mask])
+
+
+def test_sampled_observed_mae():
+    X = np.where(missing_mask, 0.0, XY_incomplete)
+    X_pred = XY + np.random.randn(*XY.shape)
+    full_mae = masked_mae(X_true=XY, X_pred=X_pred, mask=~missing_mask)
+    monitor = ConvergenceMonitor(X, missing_mask, sample_size=2000)
+    eq_(monitor.uses_full_metrics(), False)
+    random_state = np.random.get_state()
+    sampled_mae = monitor.observed_mae(X_pred)
+    # sampling uses its own random state
+    assert (np.random.get_state()[1] == random_state[1]).all()
+    assert abs(sampled_mae - full_mae) < 0.1 * full_mae
+    eq_(len(set(zip(monitor._sample_rows, monitor._sample_cols))), 2000)
+    assert not missing_mask[monitor._sample_rows, monitor._sample_cols].any()
+    assert np.isclose(monitor.observed_mae(X_pred, full=True), full_mae)
+
+
+def test_full_metrics_every():
+    X = np.where(missing_mask, 0.0, XY_incomplete)
+    monitor = ConvergenceMonitor(
+        X, missing_mask, sample_size=100, full_metrics_every=3)
+    uses_full_metrics = []
+    for _ in range(6):
+        monitor.update(XY)
+        uses_full_metrics.append(monitor.uses_full_metrics())
+    eq_(uses_full_metrics, [False, False, True, False, False, True])
+
+
+def test_solvers_report_sampled_metrics():
+    for solver_class, kwargs in [(SoftImpute, {}), (IterativeSVD, {"rank": 3})]:
+        trace = TraceCallback()
+        solver = solver_class(
+            verbose=False,
+            callbacks=[trace],
+            n_metric_samples=1000,
+            full_metrics_every=5,
+            **kwargs)
+        solver.complete(XY_incomplete)
+        eq_([event["observed_mae_sampled"] for event in trace.events],
+            [(i + 1) % 5 != 0 for i in range(len(trace.events))])
+
+
+def clip_to_unit_interval(X):
+    return np.clip(X, -1, 1, out=X)
+
+
+def test_update_from_factors_matches_dense_reconstruction():
+    np.random.seed(0)
+    row_factors = np.random.randn(500, 3)
+    column_factors = np.random.randn(10, 3)
+    X_reconstruction = clip_to_unit_interval(
+        np.dot(row_factors, column_factors.T))
+    for fraction_missing in [0.02, 0.25]:
+        mask = np.random.rand(*XY.shape) < fraction_missing
+        X_dense = np.where(mask, 0.5, XY)
+        X_factors = X_dense.copy()
+        dense_monitor = ConvergenceMonitor(X_dense, mask, sample_size=50)
+        factors_monitor = ConvergenceMonitor(X_factors, mask, sample_size=50)
+        eq_(factors_monitor.uses_entrywise_reconstruction(),
+            fraction_missing < 0.05)
+        for _ in range(2):
+            assert np.isclose(
+                dense_monitor.update(X_reconstruction),
+                factors_monitor.update_from_factors(
+                    row_factors,
+                    column_factors,
+                    clip=clip_to_unit_interval))
+            assert np.allclose(X_dense, X_factors)
+        for full in [False, True]:
+            assert np.isclose(
+                dense_monitor.observed_mae(X_reconstruction, full=full),
+                factors_monitor.observed_mae_from_factors(
+                    row_factors,
+                    column_factors,
+                    clip=clip_to_unit_interval,
+                    full=full))
+
+
+def test_full_observed_mae_from_factors_without_another_product():
+    np.random.seed(0)
+    row_factors = np.random.randn(500, 3)
+    column_factors = np.random.randn(10, 3)
+    X_reconstruction = clip_to_unit_interval(
+        np.dot(row_factors, column_factors.T))
+    block_size = fancyimpute.convergence.OBSERVED_ENTRIES_BLOCK_SIZE
+    # blocks of seven rows
+    fancyimpute.convergence.OBSERVED_ENTRIES_BLOCK_SIZE = 70
+    try:
+        for fraction_missing in [0.02, 0.25]:
+            mask = np.random.rand(*XY.shape) < fraction_missing
+            monitor = ConvergenceMonitor(
+                np.where(mask, 0.5, XY), mask, sample_size=None)
+            n_products = [0]
+            dense_reconstruction = monitor._dense_reconstruction
+
+            def counting_dense_reconstruction(*args):
+                n_products[0] += 1
+                return dense_reconstruction(*args)
+
+            monitor._dense_reconstruction = counting_dense_reconstruction
+            monitor.update_from_factors(
+                row_factors, column_factors, clip=clip_to_unit_interval)
+            mae = monitor.observed_mae_from_factors(
+                row_factors, column_factors, clip=clip_to_unit_interval)
+            assert np.isclose(
+                mae,
+                masked_mae(X_true=XY, X_pred=X_reconstruction, mask=~mask))
+            eq_(n_products[0], 0 if fraction_missing < 0.05 else 1)
+    finally:
+        fancyimpute.convergence.OBSERVED_ENTRIES_BLOCK_SIZE = block_size
+
+
+def test_sampled_observed_mae_with_oversized_sample():
+    X = np.arange(50, dtype=float).reshape((10, 5))
+    mask = np.zeros(X.shape, dtype=bool)
+    mask[3, 2] = True
+    X_pred = X + 1.0
+    monitor = ConvergenceMonitor(X.copy(), mask, sample_size=100)
+    eq_(monitor.observed_mae(X_pred, full=False), 1.0)
+    row_factors = np.hstack([X, np.ones((10, 1))])
+    column_factors = np.vstack([np.eye(5), np.ones((1, 5))]).T
+    eq_(monitor.observed_mae_from_factors(
+        row_factors, column_factors, full=False), 1.0)
+
+
+if __name__ == "__main__":
+    test_update_measures_change_of_missing_values()
+    test_sampled_observed_mae()
+    test_full_metrics_every()
+    test_solvers_report_sampled_metrics()
+    test_update_from_factors_matches_dense_reconstruction()
+    test_full_observed_mae_from_factors_without_another_product()
+    test_sampled_observed_mae_with_oversized_sample()
@@ -3,10 +3,18 @@ import numpy as np
 from fancyimpute.dictionary_helpers import (
     dense_matrix_from_pair_dictionary,
     dense_matrix_from_nested_dictionary,
+    dense_matrix_from_triplets,
+    matrix_to_nested_dictionary,
+    matrix_to_pair_dictionary,
+    matrix_to_sparse_csr_matrix,
     reverse_lookup_from_nested_dict,
+    sparse_csr_matrix_from_nested_dictionary,
+    sparse_csr_matrix_from_pair_dictionary,
+    sparse_csr_matrix_from_triplets,
+    sparse_dok_matrix_from_nested_dictionary,
     transpose_nested_dictionary,
 )
-from nose.tools import eq_
+from nose.tools import eq_, assert_raises
 
 
 def test_dense_matrix_from_nested_dictionary():
@@ -75,6 +83,82 @@ def test_dense_matrix_from_pair_dictionary_square():
     assert np.isnan(X[2, 2])
 
 
+def test_sparse_matrices_from_nested_dictionary():
+    d = {
+        "a": {"b": 10, "c": 0},
+        "b": {"c": 20}
+    }
+    for fn in [
+            sparse_csr_matrix_from_nested_dictionary,
+            sparse_dok_matrix_from_nested_dictionary]:
+        X, rows, columns = fn(d)
+        eq_(rows, ["a", "b"])
+        eq_(columns, ["b", "c"])
+        assert np.allclose(X.toarray(), [[10, 0], [0, 20]])
+    X_csr, _, _ = sparse_csr_matrix_from_nested_dictionary(d)
+    # zero values in the dictionary are still explicitly stored
+    eq_(X_csr.nnz, 3)
+
+
+def test_sparse_csr_matrix_from_pair_dictionary_square():
+    d = {
+        ("a", "b"): 10,
+        ("b", "c"): 20
+    }
+    X, rows, columns = sparse_csr_matrix_from_pair_dictionary(
+        d, square_result=True)
+    eq_(rows, ["a", "b", "c"])
+    eq_(columns, ["a", "b", "c"])
+    assert np.allclose(X.toarray(), [[0, 10, 0], [0, 0, 20], [0, 0, 0]])
+
+
+def test_matrix_to_pair_dictionary():
+    X = np.array([[1.0, np.nan], [np.nan, 4.0], [5.0, 6.0]])
+    d = matrix_to_pair_dictionary(
+        X,
+        row_keys={0: "a", 1: "b", 2: "c"},
+        filter_fn=np.isfinite)
+    eq_(d, {("a", 0): 1.0, ("b", 1): 4.0, ("c", 0): 5.0, ("c", 1): 6.0})
+    # filter functions which only work on scalars are applied elementwise
+    d = matrix_to_pair_dictionary(X, filter_fn=lambda x: bool(x > 4))
+    eq_(d, {(2, 0): 5.0, (2, 1): 6.0})
+
+
+def test_matrix_to_nested_dictionary():
+    X = np.array([[np.nan, np.nan], [3.0, np.nan], [5.0, 6.0]])
+    d = matrix_to_nested_dictionary(X, filter_fn=np.isfinite)
+    eq_(dict(d), {1: {0: 3.0}, 2: {0: 5.0, 1: 6.0}})
+
+
+def test_matrix_to_sparse_csr_matrix():
+    X = np.array([[np.nan, 2.0], [0.0, np.nan], [np.nan, np.nan]])
+    X_csr = matrix_to_sparse_csr_matrix(X, filter_fn=np.isfinite)
+    eq_(X_csr.shape, (3, 2))
+    eq_(X_csr.nnz, 2)
+    assert np.allclose(X_csr.toarray(), [[0, 2], [0, 0], [0, 0]])
+
+
+def test_dense_matrix_from_triplets():
+    X, rows, columns = dense_matrix_from_triplets(
+        ["b", "a", "b"], ["y", "x", "x"], [3.0, 1.0, 2.0])
+    eq_(list(rows), ["a", "b"])
+    eq_(list(columns), ["x", "y"])
+    assert np.allclose(X, [[1.0, np.nan], [2.0, 3.0]], equal_nan=True)
+
+
+def test_sparse_csr_matrix_from_triplets_square():
+    X, rows, columns = sparse_csr_matrix_from_triplets(
+        [10, 30], [20, 10], [1.0, 2.0], square_result=True)
+    eq_(list(rows), [10, 20, 30])
+    eq_(list(columns), [10, 20, 30])
+    assert np.allclose(X.toarray(), [[0, 1, 0], [0, 0, 0], [2, 0, 0]])
+
+
+def test_triplets_with_duplicate_keys():
+    with assert_raises(ValueError):
+        dense_matrix_from_triplets([0, 0], [1, 1], [1.0, 2.0])
+
+
 def test_reverse_lookup_from_nested_dict():
     d = {
         "a": {"b": 10, "c": 20},
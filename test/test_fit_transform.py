@@ -0,0 +1,123 @@
+import numpy as np
+from nose.tools import eq_, assert_raises
+
+from fancyimpute import (
+    BiScaler,
+    IterativeSVD,
+    KNN,
+    MICE,
+    SimpleFill,
+    SoftImpute,
+    StochasticSoftImpute,
+)
+
+from low_rank_data import XY, XY_incomplete, missing_mask
+from common import reconstruction_error
+
+n_train = 400
+
+
+def check_fold_in(solver, name):
+    new_missing_mask = missing_mask[n_train:]
+    X_completed = solver.complete(XY_incomplete)
+    _, complete_mae = reconstruction_error(
+        XY[n_train:],
+        X_completed[n_train:],
+        new_missing_mask,
+        name=name + " complete")
+
+    solver.fit(XY_incomplete[:n_train])
+    X_new = solver.transform(XY_incomplete[n_train:])
+    eq_(X_new.shape, XY_incomplete[n_train:].shape)
+    assert np.isfinite(X_new).all()
+    assert np.allclose(
+        X_new[~new_missing_mask],
+        XY_incomplete[n_train:][~new_missing_mask])
+    _, fold_in_mae = reconstruction_error(
+        XY[n_train:],
+        X_new,
+        new_missing_mask,
+        name=name + " fold-in")
+    # folding new rows into a model fit without them should be about as
+    # accurate as completing the whole matrix at once
+    assert fold_in_mae < 1.25 * complete_mae, \
+        "Error too high for %s fold-in!" % (name,)
+
+
+def test_soft_impute_fold_in():
+    check_fold_in(SoftImpute(verbose=False), "SoftImpute")
+
+
+def test_soft_impute_with_biscaler_fold_in():
+    check_fold_in(
+        SoftImpute(normalizer=BiScaler(verbose=False), verbose=False),
+        "SoftImpute+BiScaler")
+
+
+def test_iterative_svd_fold_in():
+    check_fold_in(
+        IterativeSVD(rank=3, verbose=False),
+        "IterativeSVD")
+
+
+def test_stochastic_soft_impute_fold_in():
+    check_fold_in(
+        StochasticSoftImpute(max_rank=3, batch_size=100, verbose=False),
+        "StochasticSoftImpute")
+
+
+def test_knn_fold_in():
+    check_fold_in(KNN(k=3, verbose=False), "KNN")
+
+
+def test_mice_fold_in():
+    check_fold_in(MICE(n_imputations=10, n_burn_in=3, verbose=False), "MICE")
+
+
+def test_soft_impute_fold_in_is_ridge_regression():
+    # the penalty of the ridge regression is the shrinkage value
+    solver = SoftImpute(shrinkage_value=1.0, verbose=False)
+    solver.fit(XY_incomplete)
+    row_missing_mask = np.zeros_like(missing_mask[:5])
+    row_missing_mask[:, 0] = True
+    X_rows = XY[:5].copy()
+    X_rows[row_missing_mask] = np.nan
+    X_folded = solver.transform(X_rows)
+    column_factors = solver.column_factors
+    gram = np.dot(column_factors.T, column_factors)
+    gram += np.eye(len(gram))
+    observed_factors = column_factors[1:]
+    row_factors = np.linalg.solve(
+        gram - np.outer(column_factors[0], column_factors[0]),
+        np.dot(XY[:5, 1:], observed_factors).T).T
+    assert np.allclose(
+        X_folded[:, 0],
+        np.dot(row_factors, column_factors[0]))
+
+
+def test_mice_transform_stops_once_settled():
+    solver = MICE(n_imputations=5, n_burn_in=2, verbose=False)
+    solver.fit(XY_incomplete[:n_train])
+    X_new = solver.transform(XY_incomplete[n_train:])
+    X_many_rounds = solver.transform(
+        XY_incomplete[n_train:], max_rounds=1000, convergence_threshold=0)
+    assert np.allclose(X_new, X_many_rounds, atol=0.05)
+
+
+def test_transform_requires_fit():
+    with assert_raises(ValueError):
+        SoftImpute(verbose=False).transform(XY_incomplete)
+    with assert_raises(ValueError):
+        SimpleFill().fit(XY_incomplete)
+
+
+if __name__ == "__main__":
+    test_soft_impute_fold_in()
+    test_soft_impute_with_biscaler_fold_in()
+    test_iterative_svd_fold_in()
+    test_stochastic_soft_impute_fold_in()
+    test_knn_fold_in()
+    test_mice_fold_in()
+    test_soft_impute_fold_in_is_ridge_regression()
+    test_mice_transform_stops_once_settled()
+    test_transform_requires_fit()
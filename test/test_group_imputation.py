@@ -0,0 +1,105 @@
+import numpy as np
+from nose.tools import eq_, assert_raises
+
+from fancyimpute import complete_by_group, IterativeSVD, KNN, SimpleFill
+
+from common import reconstruction_error
+from low_rank_data import create_rank_k_dataset
+
+
+def create_grouped_dataset():
+    # two groups of rows with unrelated low-rank structure, interleaved
+    XY_a, XY_incomplete_a, missing_mask_a = create_rank_k_dataset(
+        n_rows=200, n_cols=10, k=2, fraction_missing=0.2, random_seed=0)
+    XY_b, XY_incomplete_b, missing_mask_b = create_rank_k_dataset(
+        n_rows=200, n_cols=10, k=2, fraction_missing=0.2, random_seed=1)
+    order = np.random.RandomState(0).permutation(400)
+    groups = np.array(["a"] * 200 + ["b"] * 200)[order]
+    XY = np.vstack([XY_a, XY_b])[order]
+    XY_incomplete = np.vstack([XY_incomplete_a, XY_incomplete_b])[order]
+    missing_mask = np.vstack([missing_mask_a, missing_mask_b])[order]
+    return XY, XY_incomplete, missing_mask, groups
+
+
+def test_groups_completed_independently():
+    XY, XY_incomplete, missing_mask, groups = create_grouped_dataset()
+    solver = KNN(k=5, verbose=False)
+    X_grouped = complete_by_group(solver, XY_incomplete, groups, verbose=False)
+    assert np.allclose(X_grouped[~missing_mask], XY[~missing_mask])
+    for label in ["a", "b"]:
+        rows = groups == label
+        assert np.allclose(
+            X_grouped[rows], solver.complete(XY_incomplete[rows]))
+
+
+def test_grouped_low_rank_more_accurate_than_global():
+    XY, XY_incomplete, missing_mask, groups = create_grouped_dataset()
+    solver = IterativeSVD(rank=2, verbose=False)
+    _, global_mae = reconstruction_error(
+        XY, solver.complete(XY_incomplete), missing_mask)
+    _, grouped_mae = reconstruction_error(
+        XY,
+        complete_by_group(solver, XY_incomplete, groups, verbose=False),
+        missing_mask)
+    assert grouped_mae < 0.5 * global_mae, \
+        "Grouped MAE %f not much lower than global MAE %f" % (
+            grouped_mae, global_mae)
+
+
+def test_small_groups_use_fallback_solver():
+    XY, XY_incomplete, missing_mask, groups = create_grouped_dataset()
+    groups = groups.copy()
+    small_rows = np.flatnonzero(missing_mask.any(axis=1))[:3]
+    groups[small_rows] = "c"
+    fallback_solver = SimpleFill("mean")
+    X_grouped = complete_by_group(
+        KNN(k=5, verbose=False),
+        XY_incomplete,
+        groups,
+        min_group_size=10,
+        fallback_solver=fallback_solver,
+        verbose=False)
+    X_global = fallback_solver.complete(XY_incomplete)
+    assert np.allclose(X_grouped[small_rows], X_global[small_rows])
+    eq_(np.isnan(X_grouped).any(), False)
+
+
+def test_default_fallback_fills_column_means():
+    XY, XY_incomplete, missing_mask, groups = create_grouped_dataset()
+    groups = groups.copy()
+    small_rows = np.flatnonzero(missing_mask.any(axis=1))[:3]
+    groups[small_rows] = "c"
+    X_grouped = complete_by_group(
+        KNN(k=5, verbose=False), XY_incomplete, groups, verbose=False)
+    X_means = SimpleFill().complete(XY_incomplete)
+    assert np.allclose(X_grouped[small_rows], X_means[small_rows])
+
+
+def test_parallel_matches_sequential():
+    XY, XY_incomplete, missing_mask, groups = create_grouped_dataset()
+    groups = np.where(np.arange(len(groups)) < 50, "c", groups)
+    solver = KNN(k=5, verbose=False)
+    X_sequential = complete_by_group(
+        solver, XY_incomplete, groups, verbose=False)
+    X_parallel = complete_by_group(
+        solver, XY_incomplete, groups, n_jobs=2, verbose=False)
+    assert np.allclose(X_sequential, X_parallel)
+
+
+def test_group_labels_must_match_rows():
+    _, XY_incomplete, _, groups = create_grouped_dataset()
+    assert_raises(
+        ValueError,
+        complete_by_group,
+        SimpleFill(),
+        XY_incomplete,
+        groups[:-1])
+
+
+if __name__ == "__main__":
+    test_groups_completed_independently()
+    test_grouped_low_rank_more_accurate_than_global()
+    test_small_groups_use_fallback_solver()
+    test_default_fallback_fills_column_means()
+    test_parallel_matches_sequential()
+    test_group_labels_must_match_rows()
@@ -0,0 +1,111 @@
+import numpy as np
+from nose.tools import eq_, assert_raises
+
+from fancyimpute import IterativeSVD, KNN, SoftImpute
+from fancyimpute.hyperparameter_search import (
+    create_holdout_mask,
+    parameter_grid,
+    search_hyperparameters,
+)
+
+from low_rank_data import XY_incomplete, missing_mask
+
+
+def test_parameter_grid():
+    eq_(parameter_grid({"rank": [1, 2], "max_iters": [5]}),
+        [{"max_iters": 5, "rank": 1}, {"max_iters": 5, "rank": 2}])
+
+
+def test_holdout_mask_only_hides_observed_entries():
+    for stratify in [None, "columns", "rows"]:
+        holdout_mask = create_holdout_mask(
+            XY_incomplete, fraction=0.2, stratify=stratify)
+        assert not (holdout_mask & missing_mask).any()
+        remaining = ~missing_mask & ~holdout_mask
+        assert remaining.any(axis=0).all()
+        assert remaining.any(axis=1).all()
+        fraction = holdout_mask.sum() / float((~missing_mask).sum())
+        assert 0.15 < fraction < 0.25, (stratify, fraction)
+
+
+def test_stratified_holdout_mask_hides_same_fraction_of_each_column():
+    holdout_mask = create_holdout_mask(
+        XY_incomplete, fraction=0.2, stratify="columns")
+    n_observed = (~missing_mask).sum(axis=0)
+    eq_(list(holdout_mask.sum(axis=0)),
+        list(np.round(0.2 * n_observed).astype(int)))
+
+
+def test_search_finds_true_rank():
+    # the test data has rank 3
+    best, results = search_hyperparameters(
+        IterativeSVD,
+        {"rank": [1, 2, 3, 5]},
+        XY_incomplete,
+        fixed_parameters={"verbose": False},
+        verbose=False)
+    eq_(best, {"rank": 3})
+    eq_(len(results), 4)
+
+
+def test_search_records_failing_configurations():
+    best, results = search_hyperparameters(
+        KNN,
+        [{"k": 3}, {"k": 3, "orientation": "diagonal"}],
+        XY_incomplete,
+        fixed_parameters={"verbose": False},
+        verbose=False)
+    eq_(best, {"k": 3})
+    assert results[1]["error"] is not None
+    eq_(results[1]["score"], np.inf)
+
+
+def test_successive_halving():
+    configurations = [{"shrinkage_value": value} for value in [
+        0.1, 1.0, 5.0, 20.0, 50.0, 100.0, 200.0, 500.0, 1000.0]]
+    best, results = search_hyperparameters(
+        SoftImpute,
+        configurations,
+        XY_incomplete,
+        fixed_parameters={"verbose": False},
+        successive_halving=True,
+        min_budget=5,
+        max_budget=45,
+        halving_factor=3,
+        verbose=False)
+    budgets = [result["budget"] for result in results]
+    eq_(budgets, [5] * 9 + [15] * 3 + [45])
+    assert best["shrinkage_value"] <= 5.0
+
+
+def test_search_in_parallel_matches_serial():
+    kwargs = dict(
+        configurations={"rank": [1, 3]},
+        X=XY_incomplete,
+        fixed_parameters={"verbose": False},
+        verbose=False)
+    best_serial, results_serial = search_hyperparameters(
+        IterativeSVD, **kwargs)
+    best_parallel, results_parallel = search_hyperparameters(
+        IterativeSVD, n_jobs=2, **kwargs)
+    eq_(best_serial, best_parallel)
+    assert np.allclose(
+        [result["score"] for result in results_serial],
+        [result["score"] for result in results_parallel])
+
+
+def test_search_rejects_unknown_metric():
+    with assert_raises(ValueError):
+        search_hyperparameters(
+            SoftImpute, [{}], XY_incomplete, metric="r2", verbose=False)
+
+
+if __name__ == "__main__":
+    test_parameter_grid()
+    test_holdout_mask_only_hides_observed_entries()
+    test_stratified_holdout_mask_hides_same_fraction_of_each_column()
+    test_search_finds_true_rank()
+    test_search_records_failing_configurations()
+    test_successive_halving()
+    test_search_in_parallel_matches_serial()
+    test_search_rejects_unknown_metric()
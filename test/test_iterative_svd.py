@@ -0,0 +1,93 @@
+from os.path import join
+from shutil import rmtree
+from tempfile import mkdtemp
+
+import numpy as np
+from nose.tools import eq_, assert_raises
+
+from fancyimpute import IterativeSVD
+from fancyimpute.iterative_svd import TruncatedSVDWorkspace
+
+from low_rank_data import XY, XY_incomplete, missing_mask
+from common import reconstruction_error
+
+
+def test_row_chunks_match_in_memory_solver():
+    X_in_memory = IterativeSVD(rank=3, verbose=False).complete(XY_incomplete)
+    X_chunked = IterativeSVD(
+        rank=3, row_chunk_size=64, verbose=False).complete(XY_incomplete)
+    eq_(X_chunked.shape, XY_incomplete.shape)
+    assert np.allclose(X_chunked[~missing_mask], XY[~missing_mask])
+    _, in_memory_mae = reconstruction_error(
+        XY, X_in_memory, missing_mask, name="IterativeSVD")
+    _, chunked_mae = reconstruction_error(
+        XY, X_chunked, missing_mask, name="IterativeSVD (row chunks)")
+    assert chunked_mae < 1.1 * in_memory_mae + 1e-6
+    assert np.allclose(X_in_memory, X_chunked, atol=1e-3)
+
+
+def test_row_chunks_from_memmapped_input_into_memmapped_output():
+    dirname = mkdtemp()
+    try:
+        input_path = join(dirname, "input.npy")
+        output_path = join(dirname, "output.npy")
+        np.save(input_path, XY_incomplete)
+        solver = IterativeSVD(rank=3, row_chunk_size=100, verbose=False)
+        X_memory = solver.complete(XY_incomplete)
+        X_memmap = solver.complete(input_path, out=output_path)
+        assert isinstance(X_memmap, np.memmap)
+        del X_memmap
+        assert np.allclose(X_memory, np.load(output_path))
+        # the fitted principal axes can fold in new rows
+        X_new = solver.transform(XY_incomplete[:100])
+        assert np.isfinite(X_new).all()
+    finally:
+        rmtree(dirname)
+
+
+def test_row_chunks_reject_unsupported_options():
+    with assert_raises(ValueError):
+        IterativeSVD(
+            row_chunk_size=10,
+            init_fill_method="median",
+            verbose=False).complete(XY_incomplete)
+    with assert_raises(ValueError):
+        IterativeSVD(row_chunk_size=10, verbose=False).complete(XY)
+
+
+def test_workspace_matches_full_svd_when_warm_started():
+    np.random.seed(0)
+    X = np.random.randn(60, 20)
+    workspace = TruncatedSVDWorkspace(X.dtype)
+    for rank in [1, 2, 4, 4]:
+        row_factors, column_factors = workspace.factorize(X, rank)
+        eq_(row_factors.shape, (60, rank))
+        eq_(column_factors.shape, (20, rank))
+        (U, s, V) = np.linalg.svd(X, full_matrices=False)
+        assert np.allclose(
+            np.dot(row_factors, column_factors.T),
+            np.dot(U[:, :rank] * s[:rank], V[:rank]))
+        eq_(workspace.components.shape, (rank, 20))
+        X += 0.01 * np.random.randn(*X.shape)
+
+
+def test_workspace_start_vector_in_workspace_dtype():
+    np.random.seed(0)
+    X = np.random.randn(60, 20).astype(np.float32)
+    workspace = TruncatedSVDWorkspace(X.dtype)
+    workspace.factorize(X, 2)
+    eq_(workspace._v0.dtype, np.float32)
+
+
+def test_workspace_rejects_unknown_algorithm():
+    with assert_raises(ValueError):
+        TruncatedSVDWorkspace(np.float64, algorithm="lanczos")
+
+
+if __name__ == "__main__":
+    test_row_chunks_match_in_memory_solver()
+    test_row_chunks_from_memmapped_input_into_memmapped_output()
+    test_row_chunks_reject_unsupported_options()
+    test_workspace_matches_full_svd_when_warm_started()
+    test_workspace_start_vector_in_workspace_dtype()
+    test_workspace_rejects_unknown_algorithm()
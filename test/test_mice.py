@@ -1,3 +1,5 @@
+from nose.tools import eq_
+
 from fancyimpute import MICE
 
 from low_rank_data import XY, XY_incomplete, missing_mask
@@ -48,8 +50,23 @@ def test_mice_row_with_low_rank_random_matrix_approximate():
     assert missing_mae < 0.1, "Error too high with approximate PMM method!"
 
 
+def test_mice_complete_prepares_input_once():
+    mice = MICE(n_imputations=2, n_burn_in=1, verbose=False)
+    n_calls = [0]
+    prepare_input_data = mice.prepare_input_data
+
+    def counting_prepare_input_data(X):
+        n_calls[0] += 1
+        return prepare_input_data(X)
+
+    mice.prepare_input_data = counting_prepare_input_data
+    mice.complete(XY_incomplete)
+    eq_(n_calls[0], 1)
+
+
 if __name__ == "__main__":
     test_mice_column_with_low_rank_random_matrix()
     test_mice_row_with_low_rank_random_matrix()
     test_mice_column_with_low_rank_random_matrix_approximate()
     test_mice_row_with_low_rank_random_matrix_approximate()
+    test_mice_complete_prepares_input_once()
@@ -0,0 +1,79 @@
+import numpy as np
+from nose.tools import eq_, assert_raises
+
+from fancyimpute import (
+    IterativeSVD,
+    SoftImpute,
+    estimate_rank_and_shrinkage,
+)
+
+from low_rank_data import create_rank_k_dataset
+from common import reconstruction_error
+
+
+def create_noisy_dataset(n_rows=1000, n_cols=100, k=5, noise=0.1):
+    XY, _, missing_mask = create_rank_k_dataset(
+        n_rows=n_rows, n_cols=n_cols, k=k, fraction_missing=0.3)
+    XY_noisy = XY + noise * np.random.randn(n_rows, n_cols)
+    XY_incomplete = XY_noisy.copy()
+    XY_incomplete[missing_mask] = np.nan
+    return XY, XY_incomplete, missing_mask
+
+
+def test_estimate_rank():
+    for k in [1, 5, 10]:
+        _, XY_incomplete, _ = create_noisy_dataset(k=k)
+        rank, _ = estimate_rank_and_shrinkage(XY_incomplete)
+        eq_(rank, k)
+
+
+def test_shrinkage_grows_with_noise():
+    shrinkage_values = []
+    for noise in [0.1, 0.5]:
+        _, XY_incomplete, _ = create_noisy_dataset(noise=noise)
+        _, shrinkage_value = estimate_rank_and_shrinkage(XY_incomplete)
+        # the largest singular value of the noise on the observed entries
+        expected = noise * np.sqrt(0.7) * (np.sqrt(1000) + np.sqrt(100))
+        assert 0.8 * expected < shrinkage_value < 1.5 * expected, \
+            "Unexpected shrinkage value %f for noise %f" % (
+                shrinkage_value, noise)
+        shrinkage_values.append(shrinkage_value)
+    assert shrinkage_values[0] < shrinkage_values[1]
+
+
+def test_auto_soft_impute_close_to_best_shrinkage():
+    XY, XY_incomplete, missing_mask = create_noisy_dataset(noise=0.5)
+    _, auto_mae = reconstruction_error(
+        XY,
+        SoftImpute(shrinkage_value="auto", verbose=False).complete(
+            XY_incomplete),
+        missing_mask,
+        name="SoftImpute (auto)")
+    _, shrinkage_value = estimate_rank_and_shrinkage(XY_incomplete)
+    grid_maes = []
+    for scale in [0.25, 0.5, 2, 4]:
+        _, mae = reconstruction_error(
+            XY,
+            SoftImpute(
+                shrinkage_value=scale * shrinkage_value,
+                verbose=False).complete(XY_incomplete),
+            missing_mask,
+            name="SoftImpute (%0.2f x auto)" % scale)
+        grid_maes.append(mae)
+    assert auto_mae < 1.05 * min(grid_maes)
+
+
+def test_auto_iterative_svd_rank():
+    _, XY_incomplete, _ = create_noisy_dataset(k=5)
+    solver = IterativeSVD(rank="auto", verbose=False)
+    solver.complete(XY_incomplete)
+    eq_(solver.column_factors.shape, (100, 5))
+    with assert_raises(ValueError):
+        solver.complete_batch(np.array([XY_incomplete[:50, :10]] * 2))
+
+
+if __name__ == "__main__":
+    test_estimate_rank()
+    test_shrinkage_grows_with_noise()
+    test_auto_soft_impute_close_to_best_shrinkage()
+    test_auto_iterative_svd_rank()
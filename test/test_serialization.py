@@ -0,0 +1,100 @@
+import json
+from os.path import join
+from shutil import rmtree
+from tempfile import mkdtemp
+
+import numpy as np
+from nose.tools import eq_, assert_raises
+
+from fancyimpute import (
+    BiScaler,
+    IterativeSVD,
+    KNN,
+    MICE,
+    SoftImpute,
+    load_fitted_model,
+    save_fitted_model,
+)
+
+from low_rank_data import XY_incomplete
+
+n_train = 400
+
+
+def check_save_and_load(solver):
+    solver.fit(XY_incomplete[:n_train])
+    X_new = solver.transform(XY_incomplete[n_train:])
+    dirname = mkdtemp()
+    try:
+        path = join(dirname, "model")
+        save_fitted_model(solver, path)
+        loaded = load_fitted_model(path)
+        eq_(loaded.__class__, solver.__class__)
+        eq_(str(loaded), str(solver))
+        assert np.allclose(X_new, loaded.transform(XY_incomplete[n_train:]))
+        loaded_in_memory = load_fitted_model(path, mmap_mode=None)
+        assert np.allclose(
+            X_new,
+            loaded_in_memory.transform(XY_incomplete[n_train:]))
+        return loaded
+    finally:
+        rmtree(dirname)
+
+
+def test_save_and_load_soft_impute_with_biscaler():
+    loaded = check_save_and_load(
+        SoftImpute(normalizer=BiScaler(verbose=False), verbose=False))
+    assert isinstance(loaded.column_factors, np.memmap)
+    assert isinstance(loaded.normalizer, BiScaler)
+    assert isinstance(loaded.normalizer.column_means, np.memmap)
+
+
+def test_save_and_load_iterative_svd():
+    check_save_and_load(IterativeSVD(rank=3, verbose=False, dtype="float32"))
+
+
+def test_save_and_load_knn():
+    check_save_and_load(KNN(k=3, verbose=False))
+
+
+def test_save_and_load_mice():
+    check_save_and_load(MICE(n_imputations=5, n_burn_in=2, verbose=False))
+
+
+def reject_constant(name):
+    raise ValueError("Invalid JSON constant %s" % (name,))
+
+
+def test_non_finite_attributes_saved_as_valid_json():
+    solver = MICE(n_imputations=5, n_burn_in=2, verbose=False)
+    eq_(solver.n_nearest_columns, np.inf)
+    solver.fit(XY_incomplete[:n_train])
+    dirname = mkdtemp()
+    try:
+        path = join(dirname, "model")
+        save_fitted_model(solver, path)
+        with open(join(path, "header.json")) as f:
+            json.load(f, parse_constant=reject_constant)
+        eq_(load_fitted_model(path).n_nearest_columns, np.inf)
+    finally:
+        rmtree(dirname)
+
+
+def test_load_requires_header():
+    dirname = mkdtemp()
+    try:
+        with open(join(dirname, "header.json"), "w") as f:
+            f.write("{}")
+        with assert_raises(ValueError):
+            load_fitted_model(dirname)
+    finally:
+        rmtree(dirname)
+
+
+if __name__ == "__main__":
+    test_save_and_load_soft_impute_with_biscaler()
+    test_save_and_load_iterative_svd()
+    test_save_and_load_knn()
+    test_save_and_load_mice()
+    test_non_finite_attributes_saved_as_valid_json()
+    test_load_requires_header()
@@ -1,7 +1,15 @@
+from os.path import join
+from shutil import rmtree
+from tempfile import mkdtemp
+
 import numpy as np
 from nose.tools import eq_
 
+from scipy.sparse import csr_matrix
+
 from fancyimpute import SimilarityWeightedAveraging
+from fancyimpute.similarity_weighted_averaging import top_k_per_row
+from fancyimpute.dictionary_helpers import matrix_to_nested_dictionary
 
 
 def test_similarity_weighted_column_averaging():
@@ -25,5 +33,134 @@ def test_similarity_weighted_column_averaging():
     print("MAE", mae)
     assert mae < 0.1, "Difference between imputed values! MAE=%0.4f" % mae
 
+
+def test_sparse_similarity_backend_matches_dict_backend():
+    np.random.seed(0)
+    X = np.random.rand(50, 10)
+    X[np.random.rand(*X.shape) < 0.5] = np.nan
+    nested_dict = matrix_to_nested_dictionary(X, filter_fn=np.isfinite)
+
+    dict_solver = SimilarityWeightedAveraging(similarity_backend="dict")
+    sparse_solver = SimilarityWeightedAveraging(
+        similarity_backend="sparse",
+        similarity_block_size=7)
+    dict_sims, dict_overlaps, dict_weights = \
+        dict_solver.jacard_similarity_from_nested_dicts(nested_dict)
+    sparse_sims, sparse_overlaps, sparse_weights = \
+        sparse_solver.jacard_similarity_from_nested_dicts(nested_dict)
+
+    eq_(set(dict_sims.keys()), set(sparse_sims.keys()))
+    for key, sim in dict_sims.items():
+        assert np.isclose(sim, sparse_sims[key])
+    for key, overlap in dict_overlaps.items():
+        eq_(overlap, sparse_overlaps.get(key, 0))
+    for key, weight in dict_weights.items():
+        assert np.isclose(weight, sparse_weights.get(key, 0))
+    assert np.allclose(dict_solver.complete(X), sparse_solver.complete(X))
+
+
+def test_top_k_per_row():
+    X = csr_matrix(np.array([
+        [0.5, 0.1, 0.9, 0.0],
+        [0.0, 0.3, 0.0, 0.0],
+        [0.2, 0.4, 0.6, 0.8],
+    ]))
+    pruned = top_k_per_row(X, 2).toarray()
+    assert np.allclose(pruned, [
+        [0.5, 0.0, 0.9, 0.0],
+        [0.0, 0.3, 0.0, 0.0],
+        [0.0, 0.0, 0.6, 0.8],
+    ])
+
+
+def test_max_neighbors_covering_all_rows_matches_full_averaging():
+    np.random.seed(0)
+    X = np.random.rand(40, 8)
+    X[np.random.rand(*X.shape) < 0.4] = np.nan
+    X_filled = SimilarityWeightedAveraging().complete(X)
+    X_filled_pruned = SimilarityWeightedAveraging(
+        similarity_backend="sparse",
+        max_neighbors=40).complete(X)
+    assert np.allclose(X_filled, X_filled_pruned)
+    X_filled_top_5 = SimilarityWeightedAveraging(
+        similarity_backend="sparse",
+        max_neighbors=5).complete(X)
+    eq_(X_filled_top_5.shape, X.shape)
+    assert np.isfinite(X_filled_top_5).all()
+
+
+def test_single_neighbor_is_another_row():
+    # row 0 is closest to row 1 and row 2 to row 3, every row is its own
+    # most similar row but can't predict its own missing entry
+    X = np.array([
+        [1.0, 2.0, 3.0, np.nan],
+        [1.0, 2.0, 3.1, 5.0],
+        [9.0, 8.0, np.nan, 6.0],
+        [9.0, 8.1, 1.0, 6.0],
+    ])
+    for row_chunk_size in [None, 1]:
+        X_filled = SimilarityWeightedAveraging(
+            similarity_backend="sparse",
+            max_neighbors=1,
+            row_chunk_size=row_chunk_size,
+            similarity_exponent=1.0,
+            shrinkage_coef=0.0).complete(X)
+        assert np.allclose(X_filled[0, 3], 5.0)
+        assert np.allclose(X_filled[2, 2], 1.0)
+
+
+def test_row_chunks_match_full_similarity_matrix():
+    np.random.seed(0)
+    X = np.random.rand(60, 8)
+    X[np.random.rand(*X.shape) < 0.4] = np.nan
+    X_filled = SimilarityWeightedAveraging().complete(X)
+    for n_jobs in [1, 2]:
+        solver = SimilarityWeightedAveraging(
+            similarity_backend="sparse",
+            row_chunk_size=7,
+            n_jobs=n_jobs)
+        assert np.allclose(X_filled, solver.complete(X))
+        X_sparse = csr_matrix(np.where(np.isnan(X), 0, X))
+        assert np.allclose(X_filled, solver.complete(X_sparse))
+
+
+def test_row_chunks_written_to_memmap():
+    np.random.seed(0)
+    X = np.random.rand(30, 6)
+    X[np.random.rand(*X.shape) < 0.4] = np.nan
+    X_filled = SimilarityWeightedAveraging(orientation="columns").complete(X)
+    dirname = mkdtemp()
+    try:
+        path = join(dirname, "completed.npy")
+        solver = SimilarityWeightedAveraging(
+            orientation="columns",
+            similarity_backend="sparse",
+            row_chunk_size=4)
+        X_memmap = solver.complete(X, out=path)
+        assert isinstance(X_memmap, np.memmap)
+        del X_memmap
+        assert np.allclose(X_filled, np.load(path))
+    finally:
+        rmtree(dirname)
+
+def test_sparse_input_matches_dense_input():
+    np.random.seed(0)
+    X = np.random.rand(40, 8)
+    X[np.random.rand(*X.shape) < 0.5] = np.nan
+    observed_rows, observed_cols = np.nonzero(np.isfinite(X))
+    X_sparse = csr_matrix(
+        (X[observed_rows, observed_cols], (observed_rows, observed_cols)),
+        shape=X.shape)
+    for backend in ["dict", "sparse"]:
+        solver = SimilarityWeightedAveraging(similarity_backend=backend)
+        assert np.allclose(solver.complete(X), solver.complete(X_sparse))
+
 if __name__ == "__main__":
     test_similarity_weighted_column_averaging()
+    test_sparse_similarity_backend_matches_dict_backend()
+    test_top_k_per_row()
+    test_max_neighbors_covering_all_rows_matches_full_averaging()
+    test_single_neighbor_is_another_row()
+    test_row_chunks_match_full_similarity_matrix()
+    test_row_chunks_written_to_memmap()
+    test_sparse_input_matches_dense_input()
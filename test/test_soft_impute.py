@@ -0,0 +1,43 @@
+import numpy as np
+from nose.tools import eq_
+
+from fancyimpute import SoftImpute
+
+from common import reconstruction_error
+from low_rank_data import XY, XY_incomplete, missing_mask
+
+
+def test_adaptive_rank_matches_fixed_rank():
+    for max_rank in [None, 8]:
+        np.random.seed(0)
+        X_fixed = SoftImpute(
+            max_rank=max_rank,
+            verbose=False).complete(XY_incomplete)
+        np.random.seed(0)
+        X_adaptive = SoftImpute(
+            max_rank=max_rank,
+            adaptive_rank=True,
+            rank_margin=2,
+            verbose=False).complete(XY_incomplete)
+        _, fixed_mae = reconstruction_error(XY, X_fixed, missing_mask)
+        _, adaptive_mae = reconstruction_error(XY, X_adaptive, missing_mask)
+        assert abs(adaptive_mae - fixed_mae) < 0.01 * fixed_mae, \
+            "Adaptive rank MAE %f too far from %f" % (adaptive_mae, fixed_mae)
+
+
+def test_adaptive_svd_widens_when_every_component_survives():
+    solver = SoftImpute(max_rank=8, adaptive_rank=True, verbose=False)
+    np.random.seed(0)
+    # nothing gets thresholded, so the rank keeps growing up to max_rank
+    _, s, _ = solver._adaptive_thresholded_svd(XY, 0.0, n_components=1)
+    eq_(len(s), 8)
+    # the rank-3 matrix has only three singular values above the threshold
+    shrinkage_value = np.linalg.svd(XY, compute_uv=False)[3] + 1e-6
+    _, s, _ = solver._adaptive_thresholded_svd(
+        XY, shrinkage_value, n_components=1)
+    eq_(len(s), 3)
+
+
+if __name__ == "__main__":
+    test_adaptive_rank_matches_fixed_rank()
+    test_adaptive_svd_widens_when_every_component_survives()
@@ -0,0 +1,191 @@
+from os.path import join
+from shutil import rmtree
+from tempfile import mkdtemp
+
+import numpy as np
+from nose.tools import eq_
+from scipy.sparse import coo_matrix
+
+from fancyimpute.common import (
+    generate_random_column_samples,
+    nan_column_means_and_stds,
+)
+from fancyimpute import (
+    BiScaler,
+    IterativeSVD,
+    KNN,
+    MICE,
+    SimpleFill,
+    SoftImpute,
+)
+
+from low_rank_data import XY_incomplete, missing_mask
+
+
+def sparse_observed_matrix(X, missing_mask):
+    observed_rows, observed_cols = np.nonzero(~missing_mask)
+    return coo_matrix(
+        (X[observed_rows, observed_cols], (observed_rows, observed_cols)),
+        shape=X.shape)
+
+
+def test_prepare_input_data_from_sparse_matrix():
+    X_sparse = sparse_observed_matrix(XY_incomplete, missing_mask)
+    X, sparse_missing_mask = SimpleFill().prepare_input_data(X_sparse)
+    assert (sparse_missing_mask == missing_mask).all()
+    assert np.allclose(X, XY_incomplete, equal_nan=True)
+
+
+def test_solvers_complete_sparse_input():
+    X_sparse = sparse_observed_matrix(XY_incomplete, missing_mask)
+    for solver in [
+            SimpleFill(),
+            IterativeSVD(rank=3, verbose=False),
+            MICE(n_imputations=5, n_burn_in=1, verbose=False)]:
+        np.random.seed(0)
+        X_from_dense = solver.complete(XY_incomplete)
+        np.random.seed(0)
+        X_from_sparse = solver.complete(X_sparse)
+        assert np.allclose(X_from_dense, X_from_sparse)
+
+
+def test_complete_memmapped_input_into_memmapped_output():
+    dirname = mkdtemp()
+    try:
+        input_path = join(dirname, "input.npy")
+        np.save(input_path, XY_incomplete)
+        for i, solver in enumerate([
+                SimpleFill(),
+                IterativeSVD(rank=3, verbose=False),
+                SoftImpute(verbose=False),
+                MICE(n_imputations=5, n_burn_in=1, verbose=False)]):
+            np.random.seed(0)
+            X_filled = solver.complete(XY_incomplete)
+            output_path = join(dirname, "output_%d.npy" % i)
+            np.random.seed(0)
+            X_memmap = solver.complete(input_path, out=output_path)
+            assert isinstance(X_memmap, np.memmap)
+            del X_memmap
+            assert np.allclose(X_filled, np.load(output_path))
+    finally:
+        rmtree(dirname)
+
+
+def test_complete_into_existing_array():
+    out = np.empty_like(XY_incomplete)
+    solver = SimpleFill()
+    X_filled = solver.complete(XY_incomplete, out=out)
+    assert X_filled is out
+    assert np.allclose(out, SimpleFill().complete(XY_incomplete))
+
+
+def check_solve_keeps_dtype(solver, dtype):
+    solve = solver.solve
+
+    def solve_and_check_dtype(X, missing_mask):
+        eq_(X.dtype, dtype)
+        X_result = solve(X, missing_mask)
+        eq_(X_result.dtype, dtype)
+        return X_result
+    solver.solve = solve_and_check_dtype
+
+
+def test_float32_dtype_never_widens():
+    for solver in [
+            SimpleFill(dtype="float32"),
+            IterativeSVD(rank=3, verbose=False, dtype="float32"),
+            SoftImpute(verbose=False, dtype="float32"),
+            SoftImpute(max_rank=3, verbose=False, dtype="float32"),
+            SoftImpute(
+                normalizer=BiScaler(verbose=False),
+                verbose=False,
+                dtype="float32"),
+            KNN(verbose=False, dtype="float32"),
+            MICE(
+                n_imputations=2,
+                n_burn_in=1,
+                impute_type="pmm",
+                verbose=False,
+                dtype="float32"),
+            MICE(n_imputations=2, n_burn_in=1, verbose=False, dtype="float32")]:
+        check_solve_keeps_dtype(solver, np.float32)
+        X_filled = solver.complete(XY_incomplete)
+        eq_(X_filled.dtype, np.float32)
+        assert np.isfinite(X_filled).all()
+
+
+def test_mice_imputation_round_keeps_float32():
+    mice = MICE(verbose=False, dtype="float32")
+    X, missing_mask = mice.prepare_input_data(XY_incomplete)
+    observed_mask = ~missing_mask
+    visit_indices = mice.get_visit_indices(missing_mask)
+    X_filled = mice.initialize(
+        X,
+        missing_mask=missing_mask,
+        observed_mask=observed_mask,
+        visit_indices=visit_indices)
+    for impute_type in ["col", "pmm"]:
+        mice.impute_type = impute_type
+        X_filled = mice.perform_imputation_round(
+            X_filled=X_filled,
+            missing_mask=missing_mask,
+            observed_mask=observed_mask,
+            visit_indices=visit_indices)
+        eq_(X_filled.dtype, np.float32)
+
+
+def test_biscaler_keeps_float32():
+    biscaler = BiScaler(verbose=False)
+    X_normalized = biscaler.fit_transform(XY_incomplete.astype("float32"))
+    eq_(X_normalized.dtype, np.float32)
+    for name in ["row_means", "row_scales", "column_means", "column_scales"]:
+        eq_(getattr(biscaler, name).dtype, np.float32)
+
+
+def test_nan_column_means_and_stds():
+    # blocks of one row, of seven rows and of the whole matrix
+    row_size = XY_incomplete.shape[1] * XY_incomplete.itemsize
+    for buffer_size in [1, 7 * row_size, 2 ** 20]:
+        means, stds = nan_column_means_and_stds(
+            XY_incomplete, missing_mask, buffer_size=buffer_size)
+        assert np.allclose(means, np.nanmean(XY_incomplete, axis=0))
+        assert np.allclose(stds, np.nanstd(XY_incomplete, axis=0))
+
+
+def test_fill_matches_filling_one_column_at_a_time():
+    X = XY_incomplete.copy()
+    # a constant column and a column with only one missing value
+    X[:, 0] = 3.0
+    X[:5, 0] = np.nan
+    X[:, 1] = np.arange(X.shape[0])
+    X[7, 1] = np.nan
+    fill_missing_mask = np.isnan(X)
+    column_functions = {
+        "mean": np.nanmean,
+        "median": np.nanmedian,
+        "min": np.nanmin,
+        "random": generate_random_column_samples,
+    }
+    solver = SimpleFill()
+    for fill_method, col_fn in column_functions.items():
+        np.random.seed(0)
+        X_expected = X.copy()
+        for col_idx in range(X.shape[1]):
+            missing_col = fill_missing_mask[:, col_idx]
+            if missing_col.any():
+                X_expected[missing_col, col_idx] = col_fn(X[:, col_idx])
+        np.random.seed(0)
+        X_filled = solver.fill(X, fill_missing_mask, fill_method=fill_method)
+        assert np.allclose(X_expected, X_filled), fill_method
+
+
+if __name__ == "__main__":
+    test_prepare_input_data_from_sparse_matrix()
+    test_solvers_complete_sparse_input()
+    test_complete_memmapped_input_into_memmapped_output()
+    test_complete_into_existing_array()
+    test_float32_dtype_never_widens()
+    test_mice_imputation_round_keeps_float32()
+    test_biscaler_keeps_float32()
+    test_nan_column_means_and_stds()
+    test_fill_matches_filling_one_column_at_a_time()
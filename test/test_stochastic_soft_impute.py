@@ -0,0 +1,46 @@
+import numpy as np
+from nose.tools import eq_
+
+from fancyimpute import SoftImpute, StochasticSoftImpute, TraceCallback
+
+from low_rank_data import XY, XY_incomplete, missing_mask
+from common import reconstruction_error
+
+
+def test_stochastic_soft_impute_close_to_soft_impute():
+    _, soft_impute_mae = reconstruction_error(
+        XY,
+        SoftImpute(max_rank=3, verbose=False).complete(XY_incomplete),
+        missing_mask,
+        name="SoftImpute")
+    solver = StochasticSoftImpute(max_rank=3, batch_size=100, verbose=False)
+    X_completed = solver.complete(XY_incomplete)
+    assert np.allclose(X_completed[~missing_mask], XY[~missing_mask])
+    _, stochastic_mae = reconstruction_error(
+        XY,
+        X_completed,
+        missing_mask,
+        name="StochasticSoftImpute")
+    assert stochastic_mae < 1.1 * soft_impute_mae, \
+        "Error too high for StochasticSoftImpute!"
+    eq_(solver.column_factors.shape, (XY.shape[1], 3))
+
+
+def test_mini_batches_are_reproducible():
+    traces = []
+    for _ in range(2):
+        trace = TraceCallback()
+        StochasticSoftImpute(
+            batch_size=50,
+            max_iters=10,
+            verbose=False,
+            callbacks=[trace]).complete(XY_incomplete)
+        traces.append([event["observed_mae"] for event in trace.events])
+    eq_(len(traces[0]), 10)
+    eq_(traces[0], traces[1])
+    assert all(event_mae >= 0 for event_mae in traces[0])
+
+
+if __name__ == "__main__":
+    test_stochastic_soft_impute_close_to_soft_impute()
+    test_mini_batches_are_reproducible()